@@ -28,20 +28,29 @@ bl_info = {
     "category": "Animation",
 }
 
-if "bpy" in locals():
+if "flexrig_ui" in locals():
     import importlib
     importlib.reload(flexrig_ui)
 else:
-    import bpy
-    from . import flexrig_ui
+    # Rig planning modules can be imported without Blender
+    try:
+        import bpy
+    except ImportError:
+        bpy = None
 
 def register():
+    # UI is only imported once the add-on is enabled, profiles are read on first panel draw
+    global flexrig_ui
+    from . import flexrig_ui
+
     bpy.utils.register_module(__name__)
     flexrig_ui.initSceneProperties()
+    flexrig_ui.register_handlers()
     #flexrig_ui.register()
     print("Flexrig loaded.")
 
 def unregister():
+    flexrig_ui.unregister_handlers()
     bpy.utils.unregister_module(__name__)
     #flexrig_ui.unregister()
     print("Flexrig unloaded.")
\ No newline at end of file
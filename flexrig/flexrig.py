@@ -16,8 +16,22 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
-import bpy
-import mathutils
+try:
+    import bpy
+except ImportError:
+    # Rigs can still be built with flexrig_backend.MemoryBackend
+    bpy = None
+
+import json
+from . import flexrig_backend
+from . import flexrig_library
+from . import flexrig_plan
+from . import flexrig_weights
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 def get_context_mode():
     return bpy.context.active_object.mode if bpy.context.active_object is not None else 'OBJECT'
@@ -25,250 +39,719 @@ def get_context_mode():
 def switch_context_mode(target_mode):
     if get_context_mode() != target_mode:
         bpy.ops.object.mode_set(mode=target_mode)
+        return True
+    return False
+
+def flatten_vectors(vectors):
+    if numpy is not None:
+        return numpy.asarray(vectors, dtype=numpy.float32).reshape(-1)
+    return [c for v in vectors for c in v]
+
+def collection_get(collection, attr, size=1, dtype=float):
+    if numpy is not None and dtype is float:
+        values = numpy.empty(len(collection) * size, dtype=numpy.float32)
+    else:
+        values = [dtype()] * (len(collection) * size)
+    collection.foreach_get(attr, values)
+    return values
+
+# Blender backend -------------------------------
+
+class BlenderBackend:
+    # Linked instance key to armature data name, for every backend. Names are checked against
+    # the key on use, they may be stale after a file load or a rename
+    shared_names = {}
+
+    # Edit bones are looked up through a registry built once per edit session
+    def __init__(self):
+        self.edit_registry = None
+        self.edit_registry_first = 0
+
+    def new_armature(self, name, data=None):
+        return Flexrig.new_armature_object(name, data=data)
+
+    def get_mode(self):
+        return get_context_mode()
+
+    def set_mode(self, mode):
+        if switch_context_mode(mode):
+            # Edit bones are rebuilt by Blender on every mode switch
+            self.edit_registry = None
+            return True
+        return False
+
+    def get_active(self):
+        return bpy.context.scene.objects.active
+
+    def set_active(self, arm):
+        arm.select = True
+        bpy.context.scene.objects.active = arm
+
+    def load_plan(self, arm):
+        return arm.data["flexrig_plan"] if "flexrig_plan" in arm.data else None
+
+    def store_plan(self, arm, data):
+        arm.data["flexrig_plan"] = data
+
+    def find_shared(self, key):
+        # Armatures are only scanned when the key is unknown or its name stale, once per profile
+        # of a crowd instead of once per character
+        data = bpy.data.armatures.get(self.shared_names.get(key, ""))
+        if data is None or data.get("flexrig_key") != key:
+            BlenderBackend.shared_names = {d["flexrig_key"]: d.name for d in bpy.data.armatures if "flexrig_key" in d}
+            data = bpy.data.armatures.get(self.shared_names.get(key, ""))
+        return data
+
+    def store_key(self, arm, key):
+        if key is not None:
+            arm.data["flexrig_key"] = key
+            self.shared_names[key] = arm.data.name
+        elif "flexrig_key" in arm.data:
+            del arm.data["flexrig_key"]
+
+    def remove_armature(self, arm):
+        data = arm.data
+        bpy.context.scene.objects.unlink(arm)
+        bpy.data.objects.remove(arm)
+        if data.users == 0:
+            bpy.data.armatures.remove(data)
+        self.edit_registry = None
+
+    def make_single_user(self, arm):
+        # Copy on write, edit bones of shared data would change every character using it
+        if arm.data.users <= 1:
+            return False
+        arm.data = arm.data.copy()
+        self.edit_registry = None
+        return True
+
+    def check_registry(self, arm):
+        # Called once per edit session, drop the registry if bones changed outside of Flexrig
+        edit_bones = arm.data.edit_bones
+        if self.edit_registry is not None:
+            if len(self.edit_registry) != len(edit_bones) or (len(edit_bones) > 0 and self.edit_registry_first != edit_bones[0].as_pointer()):
+                self.edit_registry = None
+
+        if self.edit_registry is None:
+            self.edit_registry = {b.name: b for b in edit_bones}
+            self.edit_registry_first = edit_bones[0].as_pointer() if len(edit_bones) > 0 else 0
+
+    def register_edit_bone(self, arm, bone):
+        if self.edit_registry is None:
+            self.check_registry(arm)
+        else:
+            if len(self.edit_registry) == 0:
+                self.edit_registry_first = bone.as_pointer()
+            self.edit_registry[bone.name] = bone
+
+    def edit_bone(self, arm, name):
+        if self.edit_registry is None:
+            self.check_registry(arm)
+        return self.edit_registry[name]
+
+    def add_bones(self, arm, names, heads, tails, parents=None, connects=None, deforms=None, rolls=None):
+        # Create all bones first, parent them in one pass then write every head/tail with foreach_set
+        self.check_registry(arm)
+
+        edit_bones = arm.data.edit_bones
+        count = len(names)
+
+        first = len(edit_bones)
+        created = []
+
+        for name in names:
+            bone = edit_bones.new(name)
+            self.register_edit_bone(arm, bone)
+            created.append(bone)
+
+        if parents is not None:
+            for bone, parent in zip(created, parents):
+                if parent is not None:
+                    bone.parent = self.edit_bone(arm, parent)
+
+        end = first + count
+        all_heads = collection_get(edit_bones, "head", 3)
+        all_heads[first * 3:end * 3] = flatten_vectors(heads)
+        edit_bones.foreach_set("head", all_heads)
+
+        all_tails = collection_get(edit_bones, "tail", 3)
+        all_tails[first * 3:end * 3] = flatten_vectors(tails)
+        edit_bones.foreach_set("tail", all_tails)
+
+        if rolls is not None:
+            all_rolls = collection_get(edit_bones, "roll")
+            all_rolls[first:end] = rolls
+            edit_bones.foreach_set("roll", all_rolls)
+
+        for attr, values in (("use_connect", connects), ("use_deform", deforms)):
+            if values is not None:
+                all_values = collection_get(edit_bones, attr, dtype=bool)
+                all_values[first:end] = [bool(v) for v in values]
+                edit_bones.foreach_set(attr, all_values)
+
+        return created
+
+    def remove_bones(self, arm, names):
+        self.check_registry(arm)
+        for name in names:
+            arm.data.edit_bones.remove(self.edit_bone(arm, name))
+            del self.edit_registry[name]
+
+    def set_parent(self, arm, name, parent):
+        self.edit_bone(arm, name).parent = self.edit_bone(arm, parent) if parent is not None else None
+
+    def set_connect(self, arm, name, connect):
+        self.edit_bone(arm, name).use_connect = connect
+
+    def set_deform(self, arm, name, deform):
+        self.edit_bone(arm, name).use_deform = deform
+
+    def set_geometry(self, arm, name, head, tail, roll):
+        bone = self.edit_bone(arm, name)
+        bone.head = head
+        bone.tail = tail
+        bone.roll = roll
+
+    def rename_bones(self, arm, renames):
+        # OBJECT mode only. Blender renames pose bones, constraint targets and vertex groups
+        # of the bound meshes with the bone, FlexRig constraint names are renamed here
+        for old, new in renames:
+            arm.data.bones[old].name = new
+            pose_bone = arm.pose.bones.get(new) if arm.pose is not None else None
+            if pose_bone is not None and old + ".ik" in pose_bone.constraints:
+                pose_bone.constraints[old + ".ik"].name = new + ".ik"
+        self.edit_registry = None
+
+    def unselect_all(self, arm):
+        edit_bones = arm.data.edit_bones
+        unselected = [False] * len(edit_bones)
+        for attr in ("select", "select_head", "select_tail"):
+            edit_bones.foreach_set(attr, unselected)
+
+    def add_ik(self, arm, bone, target, pole_target, chain_len, pole_angle):
+        pose_bone = arm.pose.bones[bone]
+
+        ik_prop = pose_bone.constraints.new('IK')
+        ik_prop.name = bone + ".ik"
+        ik_prop.target = arm
+        ik_prop.subtarget = target
+        ik_prop.pole_target = arm
+        ik_prop.pole_subtarget = pole_target
+        ik_prop.chain_count = chain_len
+        ik_prop.pole_angle = pole_angle
+
+    def remove_ik(self, arm, bone):
+        if bone in arm.pose.bones:
+            pose_bone = arm.pose.bones[bone]
+            if bone + ".ik" in pose_bone.constraints:
+                pose_bone.constraints.remove(pose_bone.constraints[bone + ".ik"])
+
+    def bone_table(self, arm):
+        # Read back from edit bones, same layout as MemoryBackend.bone_table
+        d_mode = self.get_mode()
+        self.set_mode('EDIT')
+        edit_bones = arm.data.edit_bones
+
+        table = {
+            'names': [b.name for b in edit_bones],
+            'heads': [tuple(b.head) for b in edit_bones],
+            'tails': [tuple(b.tail) for b in edit_bones],
+            'rolls': [b.roll for b in edit_bones],
+            'parents': [b.parent.name if b.parent is not None else None for b in edit_bones],
+            'connects': [b.use_connect for b in edit_bones],
+            'deforms': [b.use_deform for b in edit_bones],
+            'iks': {},
+        }
+
+        self.set_mode('POSE')
+        for pose_bone in arm.pose.bones:
+            for c in pose_bone.constraints:
+                if c.type == 'IK':
+                    table["iks"][pose_bone.name] = (c.subtarget, c.pole_subtarget, c.chain_count, c.pole_angle)
+
+        self.set_mode(d_mode)
+        return table
+
+# Builder ---------------------------------------
 
 class Flexrig:
     
-    def __init__(self, arm_name):
-        switch_context_mode('OBJECT')
-        bpy.ops.object.armature_add(view_align=False, enter_editmode=False, location=(0.0,0.0,0.0),layers=(True, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False, False))
-        self.arm = bpy.context.object
+    def __init__(self, arm_name, batch=False, arm=None, backend=None, data=None):
+        self.mode_switches = 0
+        self.batch = batch
 
-        self.arm.name = arm_name
-        self.arm.data.name = arm_name + ".amt"
-        self.arm.show_x_ray = True
+        if backend is None:
+            backend = BlenderBackend() if bpy is not None else flexrig_backend.MemoryBackend()
+        self.backend = backend
 
-        self.bones = {}
-
-    def create_chest(self, stomach_loc, chest_loc, neck_loc):
-        self.bones["body"] = {}
+        # Existing FlexRig armature, its plan is already applied
+        if arm is not None:
+            self.arm = arm
+            self.set_plan(self.load_plan(arm, backend))
+            self.mark_applied()
+            return
 
-        d_mode = get_context_mode()
-        switch_context_mode('EDIT')
+        self.switch_mode('OBJECT')
+        self.arm = backend.new_armature(arm_name, data)
 
-        # rib (first bone created so it's not needed to create again)
-        b_stomach = self.arm.data.edit_bones[0]
-        b_stomach.name = self.arm.name + ".rib"
-        b_stomach.head = stomach_loc
-        b_stomach.tail = chest_loc 
+        # Linked instance of existing armature data : bones are there, the pose is not
+        if data is not None:
+            self.set_plan(self.load_plan(self.arm, backend))
+            self.mark_applied()
+            self.applied_ik = 0
+            return
 
-        self.bones["body"]["rib"] = b_stomach.name
+        self.set_plan(flexrig_plan.RigPlan(self.arm.name))
 
-        # Chest
-        b_chest = self.add_bone(self.arm.name + ".chest", chest_loc, neck_loc, b_stomach)
-        self.bones["body"]["chest"] = b_chest.name
+    @staticmethod
+    def new_armature_object(arm_name, scene=None, data=None):
+        # Data API only : no operator, no undo push and no 3D view needed (works with blender -b)
+        scene = bpy.context.scene if scene is None else scene
 
-        # Clear
-        self.unselect_all_edit_bones()
-        switch_context_mode(d_mode)
+        arm = bpy.data.objects.new(arm_name, data if data is not None else bpy.data.armatures.new(arm_name + ".amt"))
+        arm.location = (0.0, 0.0, 0.0)
+        arm.show_x_ray = True
+        scene.objects.link(arm)
 
-    def create_head(self, suffix, neck_loc, head_loc):
-        if 'head' not in self.bones:
-            self.bones["heads"] = []
+        # Mode switches work on the active object
+        arm.select = True
+        scene.objects.active = arm
+        return arm
 
-        head_data = {}
-        base_name = self.arm.name + ".head." + str(len(self.bones["heads"]))
+    @staticmethod
+    def load_plan(arm, backend=None):
+        backend = backend if backend is not None else BlenderBackend()
+        data = backend.load_plan(arm)
+        return flexrig_plan.RigPlan.from_dict(json.loads(data)) if data is not None else None
 
-        d_mode = get_context_mode()
-        switch_context_mode('EDIT')
+    @staticmethod
+    def profile_key(profile):
+        # Same for every profile with the same members and proportions, whatever its name
+        return flexrig_library.profile_hash(dict(profile, name=""))
 
-        # Neck
-        b_chest = self.find_edit_bones_by_name(self.bones["body"]["chest"])[0]
-        b_neck = self.add_bone(base_name + ".neck." + suffix, b_chest.tail, neck_loc, b_chest)
-        head_data["neck"] = b_neck.name
-        
-        # Head
-        b_head = self.add_bone(base_name + ".head." + suffix, b_neck.tail, head_loc, b_neck)
-        head_data["head"] = b_head.name
+    @staticmethod
+    def plan_from_profile(profile, amt_name):
+        # Plan of a JSON profile with its pole angles solved
+        plan = flexrig_plan.RigPlan.from_profile(profile, amt_name)
+        plan.solve_ik()
+        return plan
+
+    @classmethod
+    def linked_instance(cls, arm_name, profile, backend=None):
+        # Armatures built from the same profile content share one armature data, each with its
+        # own object and pose. Returns the builder and whether the data was shared
+        backend = backend if backend is not None else (BlenderBackend() if bpy is not None else flexrig_backend.MemoryBackend())
+        key = cls.profile_key(profile)
+
+        data = backend.find_shared(key)
+        if data is not None:
+            amt = cls(arm_name, batch=True, backend=backend, data=data)
+            amt.build()
+            return amt, True
+
+        amt = cls(arm_name, batch=True, backend=backend)
+        amt.apply_plan(cls.plan_from_profile(profile, amt.arm.name))
+        backend.store_key(amt.arm, key)
+        return amt, False
+
+    def store_plan(self):
+        # Bones recorded on the armature data, used to update it later
+        self.backend.store_plan(self.arm, json.dumps(self.plan.to_dict()))
+
+    def mark_applied(self):
+        self.applied = len(self.plan)
+        self.applied_parents = list(self.plan.parents)
+        self.applied_connects = list(self.plan.connects)
+        self.applied_ik = len(self.plan.iks)
+
+    def set_plan(self, plan):
+        self.plan = plan
+        self.bones = plan.members
+
+        # Part of the plan already written to the armature
+        self.applied = 0
+        self.applied_parents = []
+        self.applied_connects = []
+        self.applied_ik = 0
 
-        # Add to armature data
-        self.bones["heads"].append(head_data)
+    def create_chest(self, stomach_loc, chest_loc, neck_loc):
+        self.plan.add_chest(stomach_loc, chest_loc, neck_loc)
+        self.flush()
 
-        # Clear
-        self.unselect_all_edit_bones()
-        switch_context_mode(d_mode)
+    def create_head(self, suffix, neck_loc, head_loc):
+        self.plan.add_head(suffix, neck_loc, head_loc)
+        self.flush()
 
     def create_arm(self, suffix, uarm_loc, larm_loc, wrist_loc, shoulder=False, ik=False, hand_loc=None, thumb_loc=None):
-        if 'arms' not in self.bones:
-            self.bones["arms"] = []
-        
-        arm_data = {}
-        base_name = self.arm.name + ".arm." + str(len(self.bones["arms"]))
-
-        d_mode = get_context_mode()
-        switch_context_mode('EDIT')
-
-        # Shoulder
-        b_shoulder = None
-        if shoulder:
-            b_rib = self.arm.data.edit_bones[self.bones["body"]["rib"]]
-            b_shoulder = self.add_bone(base_name + ".shoulder." + suffix, b_rib.tail, uarm_loc, b_rib)
-            arm_data["shoulder"] = b_shoulder.name
-
-        # Upper arm
-        b_upper = self.add_bone(base_name + ".upper_arm." + suffix, uarm_loc, larm_loc, b_shoulder)
-        arm_data["upper_arm"] = b_upper.name
-
-        # Lower arm
-        b_lower = self.add_bone(base_name + ".lower_arm." + suffix, larm_loc, wrist_loc, b_upper)
-        arm_data["lower_arm"] = b_lower.name
-
-        # Hand & Thumb
-        if hand_loc is not None:
-            b_hand = self.add_bone(base_name + ".hand." + suffix, wrist_loc, hand_loc, b_lower)
-            arm_data["hand"] = b_hand.name
-        if thumb_loc is not None:
-            b_thumb = self.add_bone(base_name + ".thumb." + suffix, wrist_loc, thumb_loc, b_lower)
-            arm_data["thumb"] = b_thumb.name
-
-        # IK
-        if ik:
-            # Elbow
-            b_elbow = self.add_bone(base_name + ".elbow." + suffix, [larm_loc[0], larm_loc[1] - 1.5, larm_loc[2] - 0.2], [larm_loc[0], larm_loc[1] - 1.5, larm_loc[2] + 0.2])
-            b_elbow.use_deform = False
-            arm_data["elbow"] = b_elbow.name
-
-            # Constraint
-            b_ik = self.add_bone(base_name + ".ik." + suffix, wrist_loc, [wrist_loc[0], wrist_loc[1] + 0.5, wrist_loc[2]])
-            b_ik.use_deform = False
-            arm_data["ik"] = b_ik.name
-
-            if hand_loc is not None:
-                b_hand.use_connect = False
-                b_hand.parent = b_ik
-            if thumb_loc is not None:
-                b_thumb.use_connect = False
-                b_thumb.parent = b_ik
-
-            self.add_ik(b_lower, b_upper, b_ik, b_elbow, 2)
-
-        # Add to armature data
-        self.bones["arms"].append(arm_data)
-
-        # Clear
-        self.unselect_all_edit_bones()
-        switch_context_mode(d_mode)
+        self.plan.add_arm(suffix, uarm_loc, larm_loc, wrist_loc, shoulder, ik, hand_loc, thumb_loc)
+        self.flush()
 
     def create_leg(self, suffix, uleg_loc, lleg_loc, heel_loc, foot_loc, hip=False, ik=False):
-        if 'legs' not in self.bones:
-            self.bones["legs"] = []
-
-        leg_data = {}
-        base_name = self.arm.name + ".leg." + str(len(self.bones["legs"]))
-
-        d_mode = get_context_mode()
-        switch_context_mode('EDIT')
-
-        # Hip
-        b_hip = None
-        if hip:
-            b_rib = self.arm.data.edit_bones[self.bones["body"]["rib"]]
-            b_hip = self.add_bone(base_name + ".hip." + suffix, b_rib.head, uleg_loc)
-            b_hip.use_connect = False
-            b_hip.parent = b_rib
-            leg_data["hip"] = b_hip.name
-
-        # Upper leg
-        b_upper = self.add_bone(base_name + ".upper_leg." + suffix, uleg_loc, lleg_loc, b_hip)
-        leg_data["upper_leg"] = b_upper.name
-
-        # Lower leg
-        b_lower = self.add_bone(base_name + ".lower_leg." + suffix, lleg_loc, heel_loc, b_upper)
-        leg_data["lower_leg"] = b_lower.name
+        self.plan.add_leg(suffix, uleg_loc, lleg_loc, heel_loc, foot_loc, hip, ik)
+        self.flush()
 
-        # Foot
-        b_foot = self.add_bone(base_name + ".foot." + suffix, heel_loc, foot_loc, b_lower)
-        leg_data["foot"] = b_foot.name
-
-        if ik:
-            # Knee
-            b_knee = self.add_bone(base_name + ".knee." + suffix, [lleg_loc[0], lleg_loc[1] - 1.5, lleg_loc[2] - 0.2], [lleg_loc[0], lleg_loc[1] - 1.5, lleg_loc[2] + 0.2])
-            b_knee.use_deform = False
-            leg_data["knee"] = b_knee.name
-
-            # Constraint
-            b_ik = self.add_bone(base_name + ".ik." + suffix, heel_loc, [heel_loc[0], heel_loc[1] + 0.5, heel_loc[2]])
-            b_ik.use_deform = False
-            leg_data["ik"] = b_ik.name
-
-            b_foot.use_connect = False
-            b_foot.parent = b_ik
-
-            self.add_ik(b_lower, b_upper, b_ik, b_knee, 2)
-
-        # Add to armature data
-        self.bones["legs"].append(leg_data)
+    def create_ik_controller(self, g_control=False):
+        self.plan.add_ik_controller(g_control)
+        self.flush()
+
+    def flush(self):
+        # Without batch mode each member is written to the armature as soon as it is created
+        if not self.batch:
+            self.build()
+
+    def apply_plan(self, plan):
+        self.set_plan(plan)
+        return self.build()
+
+    def build(self):
+        for progress in self.build_steps(max(len(self.plan) - self.applied, 1)):
+            pass
+        return self.mode_switches
+
+    def build_steps(self, chunk=32):
+        # Write pending bones in one EDIT session, chunk bones at a time, then pending IK
+        # constraints once out of it. Yields the fraction of bones written after each chunk
+        plan = self.plan
+        backend = self.backend
+        d_mode = backend.get_mode()
+
+        # Closing the generator (a cancelled modal build) still leaves the armature in its mode
+        try:
+            pending = range(self.applied, len(plan))
+            # Bones already written but re-parented since (controller, IK targets)
+            reparented = [i for i in range(self.applied) if plan.parents[i] != self.applied_parents[i] or plan.connects[i] != self.applied_connects[i]]
+
+            # Nothing to edit for a linked instance, its bones are already in the shared data
+            edited = len(pending) > 0 or len(reparented) > 0
+            if edited:
+                for start in range(0, len(pending), chunk):
+                    # Other operators may run between two chunks
+                    self.activate()
+                    self.switch_mode('EDIT')
+
+                    # A parent written by a later chunk (the controller comes last) is set once it exists
+                    part = pending[start:start + chunk]
+                    written = part[-1] + 1
+                    later = [i for i in part if plan.parents[i] >= written]
+                    reparented.extend(later)
+                    backend.add_bones(self.arm, [plan.names[i] for i in part], [plan.heads[i] for i in part], [plan.tails[i] for i in part],
+                        parents=[plan.names[plan.parents[i]] if 0 <= plan.parents[i] < written else None for i in part],
+                        connects=[plan.connects[i] and plan.parents[i] < written for i in part], deforms=[plan.deforms[i] for i in part], rolls=[plan.rolls[i] for i in part])
+                    yield float(start + len(part)) / len(pending)
+
+                self.activate()
+                self.switch_mode('EDIT')
+                for i in reparented:
+                    backend.set_parent(self.arm, plan.names[i], plan.names[plan.parents[i]] if plan.parents[i] >= 0 else None)
+                    backend.set_connect(self.arm, plan.names[i], plan.connects[i])
+
+                backend.unselect_all(self.arm)
+
+            # Plans from plan_from_profile() are already solved
+            if any(ik[5] is None for ik in plan.iks[self.applied_ik:]):
+                plan.solve_ik(self.applied_ik)
+
+            applied_ik = self.applied_ik
+            self.mark_applied()
+
+            self.activate()
+            if applied_ik < len(plan.iks):
+                # Pose bones are rebuilt when leaving EDIT mode, constraints can then be added in OBJECT
+                # mode. A new object on existing data has no pose until it enters POSE mode
+                self.switch_mode(d_mode if edited and d_mode != 'EDIT' else 'POSE')
+                for ik in plan.iks[applied_ik:]:
+                    backend.add_ik(self.arm, plan.names[ik[0]], plan.names[ik[2]], plan.names[ik[3]], ik[4], ik[5])
+
+            self.store_plan()
+            yield 1.0
+        finally:
+            self.activate()
+            self.switch_mode(d_mode)
+
+    def remove(self):
+        # Rollback of a cancelled build, the armature object and its data are deleted
+        self.activate()
+        self.switch_mode('OBJECT')
+        self.backend.remove_armature(self.arm)
+        self.arm = None
+
+    def update_plan(self, plan):
+        # Change only the bones and IK constraints that differ from the recorded plan, the rest
+        # of the armature (and the meshes bound to it) is left untouched.
+        plan.solve_ik()
+        backend = self.backend
+
+        # Mode switches work on the active object, often the mesh bound last. It is made active
+        # again at the end, in its own mode
+        previous = backend.get_active()
+        previous_mode = backend.get_mode()
+        self.activate()
+        d_mode = backend.get_mode()
+
+        # A linked instance diverges : it gets its own copy of the armature data
+        self.switch_mode('OBJECT')
+        backend.make_single_user(self.arm)
+        backend.store_key(self.arm, None)
+
+        # Bones of linked data are named after the armature that built them first, name them
+        # after this one so that only what changed is diffed
+        if self.plan.amt_name != self.arm.name:
+            self.rename_bones(self.plan.renamed(self.arm.name))
+
+        # Surviving limbs keep their bones (and the vertex groups bound to them) when a limb
+        # before them is removed
+        renames = dict(self.plan.limb_renames(plan))
+        if len(renames) > 0:
+            self.rename_bones(self.plan.with_names(lambda name: renames.get(name, name)))
+
+        diff = self.plan.diff(plan)
+
+        self.switch_mode('EDIT')
+
+        backend.remove_bones(self.arm, diff["removed"])
+
+        added = [plan.index[name] for name in diff["added"]]
+        if len(added) > 0:
+            backend.add_bones(self.arm, [plan.names[i] for i in added], [plan.heads[i] for i in added], [plan.tails[i] for i in added],
+                parents=[plan.names[plan.parents[i]] if plan.parents[i] >= 0 else None for i in added],
+                connects=[plan.connects[i] for i in added], deforms=[plan.deforms[i] for i in added], rolls=[plan.rolls[i] for i in added])
+
+        for name in diff["reparented"]:
+            i = plan.index[name]
+            backend.set_connect(self.arm, name, False)
+            backend.set_parent(self.arm, name, plan.names[plan.parents[i]] if plan.parents[i] >= 0 else None)
+
+        for name in diff["moved"]:
+            i = plan.index[name]
+            backend.set_geometry(self.arm, name, plan.heads[i], plan.tails[i], plan.rolls[i])
+
+        for name in diff["reparented"]:
+            backend.set_connect(self.arm, name, plan.connects[plan.index[name]])
+
+        for name in diff["deform"]:
+            backend.set_deform(self.arm, name, plan.deforms[plan.index[name]])
+
+        backend.unselect_all(self.arm)
+
+        if len(diff["ik_removed"]) > 0 or len(diff["ik_added"]) > 0:
+            self.switch_mode('POSE')
+            for name in diff["ik_removed"]:
+                backend.remove_ik(self.arm, name)
+
+            iks = plan.ik_table()
+            for name in diff["ik_added"]:
+                base, target, pole_target, chain_len, pole_angle = iks[name]
+                backend.add_ik(self.arm, name, target, pole_target, chain_len, pole_angle)
+
+        self.switch_mode(d_mode)
+        if previous is not None and previous is not self.arm:
+            self.switch_mode('OBJECT')
+            backend.set_active(previous)
+            self.switch_mode(previous_mode)
+
+        self.set_plan(plan)
+        self.mark_applied()
+        self.store_plan()
+        return diff
+
+    def rename_bones(self, stored):
+        # Rename the armature bones to those of stored, which becomes the applied plan. Through
+        # temporary names so that a bone can take the name another one is leaving (OBJECT mode)
+        renames = [(old, new) for old, new in zip(self.plan.names, stored.names) if old != new]
+        self.backend.rename_bones(self.arm, [(old, "~~" + new) for old, new in renames])
+        self.backend.rename_bones(self.arm, [("~~" + new, new) for old, new in renames])
+        self.set_plan(stored)
+        self.mark_applied()
+
+    def bone_table(self):
+        return self.backend.bone_table(self.arm)
+
+    def activate(self):
+        # Mode switches work on the active object, the user may have selected another one
+        # between two build steps
+        if self.backend.get_active() is not self.arm:
+            self.switch_mode('OBJECT')
+            self.backend.set_active(self.arm)
+
+    def switch_mode(self, target_mode):
+        if self.backend.set_mode(target_mode):
+            self.mode_switches += 1
+
+    def edit_bone(self, name):
+        return self.backend.edit_bone(self.arm, name)
 
-        # Clear
-        self.unselect_all_edit_bones()
-        switch_context_mode(d_mode)
+    @staticmethod
+    def link_to_object(src_name, target_name, weight_mode='HEAT', proxy_ratio=1.0, cache=None):
+        return Flexrig.link_to_objects(src_name, [target_name], weight_mode, proxy_ratio, cache) == 1
 
-    def create_ik_controller(self, g_control=False):
+    @staticmethod
+    def link_to_objects(src_name, target_names, weight_mode='HEAT', proxy_ratio=1.0, cache=None, workers=None):
+        # Weight every target against the armature in one pass, returns how many came from the cache
         d_mode = get_context_mode()
-        switch_context_mode('EDIT')
-        b_rib = self.arm.data.edit_bones[self.bones["body"]["rib"]]
-
-        if "arms" in self.bones:
-            for a in self.bones["arms"]:
-                if 'shoulder' not in a:
-                    self.arm.data.edit_bones[a["upper_arm"]].parent = b_rib
-                    self.arm.data.edit_bones[a["upper_arm"]].use_connect = False
-
-        if "legs" in self.bones:
-            for a in self.bones["legs"]:
-                if 'hip' not in a:
-                    self.arm.data.edit_bones[a["upper_leg"]].parent = b_rib
-                    self.arm.data.edit_bones[a["upper_leg"]].use_connect = False
-        
-        # Create global controller
-        if g_control:
-            b_control = self.add_bone(self.arm.name + ".control", [0,0,0], [0,-2.0,0])
-            b_rib.parent = b_control
-            b_rib.use_connect = False
-
-            if "arms" in self.bones:
-                for a in self.bones["arms"]:
-                    if "ik" in a:
-                        self.arm.data.edit_bones[a["ik"]].parent = b_control
-                        self.arm.data.edit_bones[a["ik"]].use_connect = False
-                        self.arm.data.edit_bones[a["elbow"]].parent = b_control
-                        self.arm.data.edit_bones[a["elbow"]].use_connect = False
-
-            if "legs" in self.bones:
-                for a in self.bones["legs"]:
-                    if "ik" in a:
-                        self.arm.data.edit_bones[a["ik"]].parent = b_control
-                        self.arm.data.edit_bones[a["ik"]].use_connect = False
-                        self.arm.data.edit_bones[a["knee"]].parent = b_control
-                        self.arm.data.edit_bones[a["knee"]].use_connect = False
+        switch_context_mode('OBJECT')
+
+        # Attach to models
+        src = bpy.data.objects[src_name]
+        targets = [bpy.data.objects[name] for name in target_names]
+
+        # Unchanged meshes and rest pose : reuse weights from a previous link
+        keys = [None] * len(targets)
+        solved = []
+        cached = 0
+        if cache is not None and flexrig_weights.numpy is not None:
+            rig_hash = flexrig_weights.rig_hash(src)
+            for i, t_object in enumerate(targets):
+                keys[i] = cache.key(flexrig_weights.mesh_hash(t_object), rig_hash, weight_mode, proxy_ratio)
+                entry = cache.get(keys[i])
+                if entry is None:
+                    solved.append(i)
+                    continue
+                flexrig_weights.apply_weights(src, t_object, [str(n) for n in entry["names"]], entry["bones"], entry["weights"])
+                cached += 1
+        else:
+            solved = list(range(len(targets)))
+
+        objects = [targets[i] for i in solved]
+        if len(objects) > 0:
+            if proxy_ratio < 1.0:
+                solve = lambda arm, proxies: Flexrig.solve_weights_many(arm, proxies, weight_mode, workers)
+                results = flexrig_weights.link_proxy_many(src, objects, proxy_ratio, solve, bpy.context.scene, workers=workers)
+            else:
+                results = Flexrig.solve_weights_many(src, objects, weight_mode, workers)
+
+            for i, result in zip(solved, results if results is not None else [None] * len(solved)):
+                if keys[i] is None:
+                    continue
+                if result is None:
+                    if len(targets[i].data.vertices) > flexrig_weights.READBACK_MAX_VERTICES:
+                        continue
+                    names = flexrig_weights.bone_segments(src)[0]
+                    bones, weights = flexrig_weights.read_influences(targets[i], names, 8)
+                    result = (names, bones, weights)
+                cache.put(keys[i], {'names': flexrig_weights.numpy.array(result[0]), 'bones': result[1], 'weights': result[2]})
 
         # Clear
-        self.unselect_all_edit_bones()
         switch_context_mode(d_mode)
+        return cached
 
     @staticmethod
-    def link_to_object(src_name, target_name):
+    def link_steps(src_name, target_names, weight_mode='HEAT', proxy_ratio=1.0, cache=None, workers=None, chunk=2048):
+        # link_to_objects() chunk vertices at a time for modal operators, yields the progress
+        # between 0 and 1. Weights go to staging groups and meshes are only bound at the last
+        # step, closing the generator before removes the staging groups.
+        if weight_mode != 'FAST' and proxy_ratio >= 1.0:
+            # Heat and envelope weights are solved by Blender in a single call
+            yield 0.0
+            Flexrig.link_to_objects(src_name, target_names, weight_mode, proxy_ratio, cache, workers)
+            yield 1.0
+            return
+
         d_mode = get_context_mode()
+        active = bpy.context.scene.objects.active
         switch_context_mode('OBJECT')
 
-        # Attach to model
-        t_object = bpy.data.objects[target_name]
         src = bpy.data.objects[src_name]
+        targets = [bpy.data.objects[name] for name in target_names]
+        names, heads, tails = flexrig_weights.bone_segments(src)
+        rig_hash = flexrig_weights.rig_hash(src) if cache is not None else None
+
+        # Each vertex is solved then written
+        total = float(max(sum(len(t_object.data.vertices) for t_object in targets) * 2, 1))
+        done = 0
+        staged = []
+
+        try:
+            for t_object in targets:
+                count = len(t_object.data.vertices)
+                key = cache.key(flexrig_weights.mesh_hash(t_object), rig_hash, weight_mode, proxy_ratio) if cache is not None else None
+                entry = cache.get(key) if key is not None else None
+                yield done / total
+
+                if entry is not None:
+                    obj_names, bones, weights = [str(n) for n in entry["names"]], entry["bones"], entry["weights"]
+                    key = None
+                else:
+                    obj_names = names
+                    points = flexrig_weights.mesh_points(t_object)
+                    if proxy_ratio < 1.0:
+                        solve = lambda arm, proxies: Flexrig.solve_weights_many(arm, proxies, weight_mode, workers)
+                        proxy_points, proxy_triangles, proxy_weights = flexrig_weights.solve_proxies(src, [t_object], proxy_ratio, solve, bpy.context.scene, names)[0]
+                        yield done / total
+
+                        bones, weights = flexrig_weights.influence_arrays(count, min(4, len(names)))
+                        # A transferred vertex costs about 4 solved ones (27 grid cells, triangle projections)
+                        steps = flexrig_weights.transfer_steps(proxy_points, proxy_triangles, proxy_weights, points, bones, weights, max(chunk // 4, 1))
+                    else:
+                        bones, weights = flexrig_weights.influence_arrays(count, min(4, len(names)))
+                        steps = flexrig_weights.solve_steps(points, heads, tails, bones, weights, chunk=chunk)
+
+                    for n in steps:
+                        yield (done + n) / total
+                done += count
+
+                group_names = flexrig_weights.staging_names(obj_names)
+                flexrig_weights.add_groups(t_object, group_names)
+                staged.append((t_object, obj_names, group_names, key, bones, weights))
+                for n in flexrig_weights.write_steps(t_object, group_names, bones, weights, chunk=chunk):
+                    yield (done + n) / total
+                done += count
+
+            for t_object, obj_names, group_names, key, bones, weights in staged:
+                flexrig_weights.commit_groups(t_object, obj_names, group_names)
+                flexrig_weights.bind_to_armature(src, t_object)
+                if key is not None:
+                    cache.put(key, {'names': flexrig_weights.numpy.array(obj_names), 'bones': bones, 'weights': weights})
+            staged = []
+        finally:
+            for t_object, obj_names, group_names, key, bones, weights in staged:
+                flexrig_weights.discard_groups(t_object, group_names)
+            # The mode belongs to the object active at the start, the user may have selected another
+            if bpy.context.scene.objects.active is active:
+                switch_context_mode(d_mode)
+
+        yield 1.0
 
-        src.select = True
-        t_object.select = True
-        bpy.context.scene.objects.active = src
-
-        bpy.ops.object.parent_set(type='ARMATURE_AUTO')
-        t_object.select = False
+    @staticmethod
+    def solve_weights(src, t_object, weight_mode='HEAT'):
+        # Returns (names, bones, weights) when the engine computed them itself
+        results = Flexrig.solve_weights_many(src, [t_object], weight_mode)
+        return results[0] if results is not None else None
 
-        # Clear
-        switch_context_mode(d_mode)
+    @staticmethod
+    def solve_weights_many(src, objects, weight_mode='HEAT', workers=None):
+        # Returns [(names, bones, weights)] when the engine computed them itself
+        if weight_mode == 'FAST':
+            return flexrig_weights.link_fast_many(src, objects, workers=workers)
+
+        # One parent_set call weights every selected mesh, the user selection is restored after
+        scene = bpy.context.scene
+        selection = [obj for obj in scene.objects if obj.select]
+        active = scene.objects.active
+
+        for obj in selection:
+            obj.select = False
+        src.select = True
+        for obj in objects:
+            obj.select = True
+        scene.objects.active = src
+
+        try:
+            bpy.ops.object.parent_set(type='ARMATURE_ENVELOPE' if weight_mode == 'ENVELOPE' else 'ARMATURE_AUTO')
+        finally:
+            for obj in scene.objects:
+                obj.select = False
+            for obj in selection:
+                obj.select = True
+            scene.objects.active = active
+        return None
 
     def add_bone(self, name, head, tail, parent=None):
         d_mode = get_context_mode()
-        switch_context_mode('EDIT')
+        self.switch_mode('EDIT')
+        self.backend.check_registry(self.arm)
 
         bone = self.arm.data.edit_bones.new(name)
+        self.backend.register_edit_bone(self.arm, bone)
 
         if parent is not None:
             bone.parent = parent
@@ -277,34 +760,36 @@ class Flexrig:
         bone.head = head
         bone.tail = tail
 
-        switch_context_mode(d_mode)
+        self.switch_mode(d_mode)
         return bone
 
+    def add_bones_bulk(self, names, heads, tails, parents=None, connects=None, deforms=None, rolls=None):
+        d_mode = self.backend.get_mode()
+        self.switch_mode('EDIT')
+        created = self.backend.add_bones(self.arm, names, heads, tails, parents, connects, deforms, rolls)
+        self.switch_mode(d_mode)
+        return created
+
     def add_ik(self, bone, base, target, pole_target, chain_len):
         d_mode = get_context_mode()
-        switch_context_mode('EDIT')
-
-        # Calculate pole angle (Jerryno way)
-        # see : http://blender.stackexchange.com/questions/19754/how-to-set-calculate-pole-angle-of-ik-constraint-so-the-chain-does-not-move
-        projected_pole_axis = (target.tail - base.head).cross(pole_target.matrix.translation - base.head).cross(base.tail - base.head)
-        pole_angle_rad = base.x_axis.angle(projected_pole_axis) if base.x_axis.cross(projected_pole_axis).angle(base.tail - base.head) >= 1 else -(base.x_axis.angle(projected_pole_axis))
+        self.switch_mode('EDIT')
 
+        pole_angle_rad = self.calc_pole_angle(base, target, pole_target)
+        bone_name = bone.name
         target_name = target.name
         ptarget_name = pole_target.name
 
-        switch_context_mode('POSE')
-        pose_bone = self.arm.pose.bones[bone.name]
+        self.switch_mode('POSE')
+        self.add_ik_constraint(bone_name, target_name, ptarget_name, chain_len, pole_angle_rad)
 
-        ik_prop = pose_bone.constraints.new('IK')
-        ik_prop.name = bone.name + ".ik"
-        ik_prop.target = self.arm
-        ik_prop.subtarget = target_name
-        ik_prop.pole_target = self.arm
-        ik_prop.pole_subtarget = ptarget_name
-        ik_prop.chain_count = chain_len
-        ik_prop.pole_angle = pole_angle_rad
+        self.switch_mode(d_mode)
 
-        switch_context_mode(d_mode)
+    @staticmethod
+    def calc_pole_angle(base, target, pole_target):
+        return flexrig_plan.pole_angle(base.head, base.tail, base.x_axis, target.tail, pole_target.matrix.translation)
+
+    def add_ik_constraint(self, bone_name, target_name, ptarget_name, chain_len, pole_angle_rad):
+        self.backend.add_ik(self.arm, bone_name, target_name, ptarget_name, chain_len, pole_angle_rad)
 
     def select_edit_bone(self, target, s_bone=True, s_head=False, s_tail=False):
         target.select = s_bone
@@ -312,15 +797,15 @@ class Flexrig:
         target.select_tail = s_tail
 
     def find_edit_bones_by_name(self, name):
-        return [b for b in self.arm.data.edit_bones if b.name == name]
+        self.backend.check_registry(self.arm)
+        return [self.edit_bone(name)] if name in self.backend.edit_registry else []
 
     def unselect_all_edit_bones(self):
-        for b in self.arm.data.edit_bones:
-            self.select_edit_bone(b, False, False, False)
+        self.backend.unselect_all(self.arm)
 
 
 """
 TO DO :
 + (Digitigrade)
 + (tail)
-"""
\ No newline at end of file
+"""
@@ -0,0 +1,256 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# In-memory armature backend, Flexrig builds without Blender for planning, validation and CI.
+#
+# A backend is what Flexrig writes armatures with :
+#   new_armature(name), get_mode(), set_mode(mode), get_active(), set_active(arm)
+#   load_plan(arm), store_plan(arm, data)
+#   add_bones(arm, names, heads, tails, parents, connects, deforms, rolls), remove_bones(arm, names)
+#   set_parent(arm, name, parent), set_connect(arm, name, connect), set_deform(arm, name, deform)
+#   set_geometry(arm, name, head, tail, roll), rename_bones(arm, renames), unselect_all(arm)
+#   add_ik(arm, bone, target, pole_target, chain_len, pole_angle), remove_ik(arm, bone)
+#   bone_table(arm)
+#   find_shared(key), store_key(arm, key), make_single_user(arm) for linked instances
+#   remove_armature(arm)
+#
+# The live one is flexrig.BlenderBackend. Pole angles come from the rig plan in both, solved
+# with NumPy when available.
+
+# Armature --------------------------------------
+
+class MemoryArmatureData(dict):
+    # Armature datablock : custom properties as items, bones shared by every user
+    def __init__(self, bones=None):
+        dict.__init__(self)
+        self.bones = bones if bones is not None else {}
+        self.users = 0
+
+class MemoryArmature:
+    # Armature object, constraints belong to its pose. As in Blender the pose is only
+    # rebuilt from the bones when leaving EDIT mode or entering POSE mode
+    def __init__(self, name, data=None):
+        self.name = name
+        self.mode = 'OBJECT'
+        self.pose = set()
+        self.constraints = {}
+        self.data = data if data is not None else MemoryArmatureData()
+        self.data.users += 1
+
+    @property
+    def bones(self):
+        return self.data.bones
+
+class MemoryBackend:
+
+    def __init__(self):
+        self.armatures = {}
+        self.active = None
+        # Last suffix given per base name, a crowd of one name is not scanned from .001 each time
+        self.suffixes = {}
+        # Linked instance key to armature data
+        self.shared = {}
+
+    def new_armature(self, name, data=None):
+        # Same naming as bpy.data on collision
+        unique = name
+        i = self.suffixes.get(name, 0)
+        while unique in self.armatures:
+            i += 1
+            unique = "%s.%03d" % (name, i)
+        self.suffixes[name] = i
+
+        arm = MemoryArmature(unique, data)
+        self.armatures[unique] = arm
+        self.active = arm
+        return arm
+
+    def find_shared(self, key):
+        data = self.shared.get(key)
+        return data if data is not None and data.users > 0 and data.get("flexrig_key") == key else None
+
+    def store_key(self, arm, key):
+        if key is not None:
+            arm.data["flexrig_key"] = key
+            self.shared[key] = arm.data
+        else:
+            key = arm.data.pop("flexrig_key", None)
+            if self.shared.get(key) is arm.data:
+                del self.shared[key]
+
+    def remove_armature(self, arm):
+        del self.armatures[arm.name]
+        arm.data.users -= 1
+        if self.active is arm:
+            self.active = None
+
+    def make_single_user(self, arm):
+        # Copy on write : bones are about to change for this armature only
+        if arm.data.users <= 1:
+            return False
+        data = MemoryArmatureData({name: dict(bone) for name, bone in arm.data.bones.items()})
+        data.update(arm.data)
+        arm.data.users -= 1
+        arm.data = data
+        data.users += 1
+        return True
+
+    def get_mode(self):
+        return self.active.mode if self.active is not None else 'OBJECT'
+
+    def set_mode(self, mode):
+        if self.get_mode() == mode:
+            return False
+        if self.active.mode == 'EDIT' or mode == 'POSE':
+            self.active.pose = set(self.active.bones)
+        self.active.mode = mode
+        return True
+
+    def get_active(self):
+        return self.active
+
+    def set_active(self, arm):
+        self.active = arm
+
+    def load_plan(self, arm):
+        return arm.data.get("flexrig_plan")
+
+    def store_plan(self, arm, data):
+        arm.data["flexrig_plan"] = data
+
+    def add_bones(self, arm, names, heads, tails, parents=None, connects=None, deforms=None, rolls=None):
+        count = len(names)
+        parents = parents if parents is not None else [None] * count
+        connects = connects if connects is not None else [False] * count
+        deforms = deforms if deforms is not None else [True] * count
+        rolls = rolls if rolls is not None else [0.0] * count
+
+        for i, name in enumerate(names):
+            arm.bones[name] = {
+                'head': tuple(float(c) for c in heads[i]),
+                'tail': tuple(float(c) for c in tails[i]),
+                'roll': float(rolls[i]),
+                'parent': parents[i],
+                'connect': bool(connects[i]),
+                'deform': bool(deforms[i]),
+            }
+
+        # As with edit bones, a parent has to exist when its child is written
+        for parent in parents:
+            if parent is not None and parent not in arm.bones:
+                raise KeyError(parent)
+        return names
+
+    def remove_bones(self, arm, names):
+        for name in names:
+            parent = arm.bones[name]["parent"]
+            del arm.bones[name]
+            arm.constraints.pop(name, None)
+
+            # Children go to the removed bone parent, as with edit_bones.remove
+            for bone in arm.bones.values():
+                if bone["parent"] == name:
+                    bone["parent"] = parent
+                    bone["connect"] = False
+
+    def set_parent(self, arm, name, parent):
+        arm.bones[name]["parent"] = parent
+
+    def set_connect(self, arm, name, connect):
+        arm.bones[name]["connect"] = bool(connect)
+
+    def set_deform(self, arm, name, deform):
+        arm.bones[name]["deform"] = bool(deform)
+
+    def set_geometry(self, arm, name, head, tail, roll):
+        bone = arm.bones[name]
+        bone["head"] = tuple(float(c) for c in head)
+        bone["tail"] = tuple(float(c) for c in tail)
+        bone["roll"] = float(roll)
+
+    def rename_bones(self, arm, renames):
+        # (old, new) pairs, parents and constraints of every user of the data follow
+        renames = dict(renames)
+        rename = lambda name: renames.get(name, name) if name is not None else None
+
+        bones = list(arm.bones.items())
+        arm.bones.clear()
+        for name, bone in bones:
+            bone["parent"] = rename(bone["parent"])
+            arm.bones[rename(name)] = bone
+
+        for user in self.armatures.values():
+            if user.data is arm.data:
+                user.pose = set(rename(name) for name in user.pose)
+                user.constraints = {rename(name): (rename(c[0]), rename(c[1])) + tuple(c[2:]) for name, c in user.constraints.items()}
+
+    def unselect_all(self, arm):
+        pass
+
+    def add_ik(self, arm, bone, target, pole_target, chain_len, pole_angle):
+        if bone not in arm.pose:
+            raise KeyError("pose bone " + bone + " not found")
+        arm.constraints[bone] = (target, pole_target, chain_len, pole_angle)
+
+    def remove_ik(self, arm, bone):
+        arm.constraints.pop(bone, None)
+
+    def bone_table(self, arm):
+        names = list(arm.bones.keys())
+        return {
+            'names': names,
+            'heads': [arm.bones[n]["head"] for n in names],
+            'tails': [arm.bones[n]["tail"] for n in names],
+            'rolls': [arm.bones[n]["roll"] for n in names],
+            'parents': [arm.bones[n]["parent"] for n in names],
+            'connects': [arm.bones[n]["connect"] for n in names],
+            'deforms': [arm.bones[n]["deform"] for n in names],
+            'iks': dict(arm.constraints),
+        }
+
+# Utils -----------------------------------------
+
+def compare_bone_tables(a, b, tolerance=1e-5):
+    # Differences between two bone tables, as (bone, field) pairs, empty when identical
+    out = []
+    b_index = {name: i for i, name in enumerate(b["names"])}
+
+    for name in set(a["names"]) ^ set(b["names"]):
+        out.append((name, 'missing'))
+
+    close = lambda x, y: all(abs(u - v) <= tolerance for u, v in zip(x, y))
+    for i, name in enumerate(a["names"]):
+        j = b_index.get(name)
+        if j is None:
+            continue
+        for field in ('heads', 'tails'):
+            if not close(a[field][i], b[field][j]):
+                out.append((name, field))
+        if abs(a["rolls"][i] - b["rolls"][j]) > tolerance:
+            out.append((name, 'rolls'))
+        for field in ('parents', 'connects', 'deforms'):
+            if a[field][i] != b[field][j]:
+                out.append((name, field))
+
+    for name in set(a["iks"]) | set(b["iks"]):
+        x = a["iks"].get(name)
+        y = b["iks"].get(name)
+        if x is None or y is None or tuple(x[:3]) != tuple(y[:3]) or abs(x[3] - y[3]) > tolerance:
+            out.append((name, 'iks'))
+
+    return sorted(out)
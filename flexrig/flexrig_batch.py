@@ -0,0 +1,239 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Headless batch rigging.
+#
+# Driver (any Python 3) :
+#   python flexrig/flexrig_batch.py --profile Human --target Body --workers 4 --report report.json a.blend b.obj ...
+#
+# Each file is handled by a background Blender worker running this same script :
+#   blender -b a.blend --python flexrig/flexrig_batch.py -- --worker ...
+
+import argparse
+import concurrent.futures
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PROFILES = os.path.join(ADDON_DIR, "profiles")
+
+MESH_IMPORTERS = {
+    ".obj": ("import_scene", "obj"),
+    ".fbx": ("import_scene", "fbx"),
+    ".ply": ("import_mesh", "ply"),
+    ".stl": ("import_mesh", "stl"),
+}
+
+# Utils -----------------------------------------
+
+def load_profile(path, name):
+    # Profile library directory, binary library or former single JSON file
+    if path.endswith(".fxrb"):
+        from flexrig import flexrig_binary
+        with flexrig_binary.BinaryLibrary(path) as library:
+            return library.load(name)
+
+    if os.path.isdir(path):
+        from flexrig import flexrig_library
+        library = flexrig_library.ProfileLibrary(path)
+        library.load_index()
+        return library.load(name)
+
+    with open(path, 'r') as f:
+        for profile in json.load(f):
+            if profile["name"] == name:
+                return profile
+    raise KeyError("FlexRig : profile " + name + " not found in " + path)
+
+def output_path(args, filename):
+    if args.output_dir is None:
+        return os.path.splitext(filename)[0] + ".blend"
+    return os.path.join(args.output_dir, os.path.splitext(os.path.basename(filename))[0] + ".blend")
+
+# Worker (inside Blender) -----------------------
+
+def run_worker(args):
+    import bpy
+
+    sys.path.insert(0, os.path.dirname(ADDON_DIR))
+    from flexrig import flexrig
+
+    result = {'file': args.input, 'success': False, 'timings': {}}
+    t_start = time.perf_counter()
+
+    try:
+        target_name = args.target
+
+        # Mesh files are imported in an empty scene
+        ext = os.path.splitext(args.input)[1].lower()
+        if ext in MESH_IMPORTERS:
+            t_step = time.perf_counter()
+            before = set(bpy.data.objects.keys())
+            module, op = MESH_IMPORTERS[ext]
+            getattr(getattr(bpy.ops, module), op)(filepath=args.input)
+            imported = [o for o in bpy.data.objects if o.name not in before and o.type == 'MESH']
+            if target_name is None and len(imported) > 0:
+                target_name = imported[0].name
+            result['timings']['import'] = time.perf_counter() - t_step
+
+        if target_name not in bpy.data.objects:
+            raise KeyError("target object " + str(target_name) + " not found")
+
+        t_step = time.perf_counter()
+        profile = load_profile(args.profiles, args.profile)
+        amt = flexrig.Flexrig(args.armature, batch=True)
+        amt.apply_plan(flexrig.Flexrig.plan_from_profile(profile, amt.arm.name))
+        result['timings']['build'] = time.perf_counter() - t_step
+        result['mode_switches'] = amt.mode_switches
+        result['bones'] = len(amt.plan)
+
+        t_step = time.perf_counter()
+        flexrig.Flexrig.link_to_object(amt.arm.name, target_name, args.weights, args.proxy_ratio)
+        result['timings']['link'] = time.perf_counter() - t_step
+
+        t_step = time.perf_counter()
+        bpy.ops.wm.save_as_mainfile(filepath=args.output)
+        result['timings']['save'] = time.perf_counter() - t_step
+
+        result['armature'] = amt.arm.name
+        result['target'] = target_name
+        result['output'] = args.output
+        result['success'] = True
+    except Exception as e:
+        result['error'] = str(e)
+
+    result['timings']['total'] = time.perf_counter() - t_start
+    with open(args.result, 'w') as f:
+        json.dump(result, f)
+
+    return 0 if result['success'] else 1
+
+# Driver ----------------------------------------
+
+def run_file(args, filename):
+    filename = os.path.abspath(filename)
+    fd, result_path = tempfile.mkstemp(prefix="flexrig_", suffix=".json")
+    os.close(fd)
+
+    cmd = [args.blender, "-b"]
+    if os.path.splitext(filename)[1].lower() == ".blend":
+        cmd.append(filename)
+    else:
+        cmd.append("--factory-startup")
+    cmd += ["--python", os.path.abspath(__file__), "--", "--worker",
+        "--input", filename, "--profile", args.profile, "--profiles", args.profiles,
+        "--armature", args.armature, "--weights", args.weights, "--proxy-ratio", str(args.proxy_ratio), "--output", os.path.abspath(output_path(args, filename)), "--result", result_path]
+    if args.target is not None:
+        cmd += ["--target", args.target]
+
+    t_start = time.perf_counter()
+    try:
+        try:
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, timeout=args.timeout)
+        except subprocess.TimeoutExpired as e:
+            # The worker is killed, the file is reported as failed
+            log = e.output or ""
+            if isinstance(log, bytes):
+                log = log.decode('utf-8', 'replace')
+            return {'file': filename, 'success': False, 'timings': {'process': time.perf_counter() - t_start},
+                'error': "worker timed out after " + str(args.timeout) + " s", 'log': log[-2000:], 'returncode': None}
+        elapsed = time.perf_counter() - t_start
+
+        try:
+            with open(result_path, 'r') as f:
+                result = json.load(f)
+        except (IOError, ValueError):
+            result = {'file': filename, 'success': False, 'timings': {}, 'error': "worker did not report", 'log': proc.stdout[-2000:]}
+    finally:
+        if os.path.isfile(result_path):
+            os.remove(result_path)
+
+    result['returncode'] = proc.returncode
+    result['timings']['process'] = elapsed
+    return result
+
+def run_driver(args):
+    if args.output_dir is not None and not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    t_start = time.perf_counter()
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(run_file, args, f): (i, f) for i, f in enumerate(args.files)}
+        for future in concurrent.futures.as_completed(futures):
+            i, filename = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'file': filename, 'success': False, 'timings': {}, 'error': str(e)}
+            results.append((i, result))
+            print("FlexRig : " + ("done " if result['success'] else "failed ") + result['file'])
+
+    # Report in the order of the command line
+    results = [result for i, result in sorted(results, key=lambda entry: entry[0])]
+    report = {
+        'profile': args.profile,
+        'workers': args.workers,
+        'total_time': time.perf_counter() - t_start,
+        'succeeded': sum(1 for r in results if r['success']),
+        'failed': sum(1 for r in results if not r['success']),
+        'files': results,
+    }
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    return 0 if report['failed'] == 0 else 1
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Rig many files with a FlexRig profile")
+    parser.add_argument("files", nargs="*", help=".blend or mesh files (.obj, .fbx, .ply, .stl)")
+    parser.add_argument("--profile", required=True, help="profile name in the profile library")
+    parser.add_argument("--profiles", default=DEFAULT_PROFILES, help="profile library directory, .fxrb or JSON file")
+    parser.add_argument("--target", default=None, help="mesh object to link, first imported mesh by default")
+    parser.add_argument("--armature", default="Flexrig.Armature", help="armature object name")
+    parser.add_argument("--weights", default='HEAT', choices=['HEAT', 'ENVELOPE', 'FAST'], help="weighting engine")
+    parser.add_argument("--proxy-ratio", type=float, default=1.0, help="solve weights on a decimated proxy when below 1")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--blender", default="blender", help="Blender executable")
+    parser.add_argument("--output-dir", default=None, help="where rigged .blend are saved, next to the input by default")
+    parser.add_argument("--report", default="flexrig_report.json")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per file")
+
+    # Worker only
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--input", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = parse_args(argv)
+    if args.worker:
+        return run_worker(args)
+    args.files = [os.path.abspath(f) for f in args.files]
+    return run_driver(args)
+
+if __name__ == "__main__":
+    # Inside Blender, script arguments come after "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    sys.exit(main(argv))
@@ -0,0 +1,558 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Benchmarks, run with :
+#   blender -b --python flexrig/flexrig_bench.py -- <benchmark>
+
+import os
+import sys
+import time
+
+# Utils -----------------------------------------
+
+def chain(count, length=0.1):
+    names = ["Bench." + str(i) for i in range(count)]
+    heads = [(0.0, 0.0, i * length) for i in range(count)]
+    tails = [(0.0, 0.0, (i + 1) * length) for i in range(count)]
+    parents = [None] + names[:-1]
+    return names, heads, tails, parents
+
+def timed(func, *args):
+    t_start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - t_start
+
+def print_table(title, columns, rows):
+    print(title)
+    print("".join(c.rjust(14) for c in columns))
+    for row in rows:
+        print("".join((("%.4f" % v) if isinstance(v, float) else str(v)).rjust(14) for v in row))
+
+# Benchmarks ------------------------------------
+
+def bench_bones(sizes=(10, 100, 1000, 10000)):
+    from flexrig import flexrig
+
+    def add_bone_loop(amt, names, heads, tails, parents):
+        flexrig.switch_context_mode('EDIT')
+        created = {}
+        for name, head, tail, parent in zip(names, heads, tails, parents):
+            created[name] = amt.add_bone(name, head, tail, created[parent] if parent is not None else None)
+        flexrig.switch_context_mode('OBJECT')
+
+    def add_bones_bulk(amt, names, heads, tails, parents):
+        amt.add_bones_bulk(names, heads, tails, parents, connects=[p is not None for p in parents])
+        flexrig.switch_context_mode('OBJECT')
+
+    rows = []
+    for size in sizes:
+        bench_chain = chain(size)
+        t_loop = timed(add_bone_loop, flexrig.Flexrig("Bench.Loop"), *bench_chain)
+        t_bulk = timed(add_bones_bulk, flexrig.Flexrig("Bench.Bulk"), *bench_chain)
+        rows.append((size, t_loop, t_bulk, t_loop / t_bulk if t_bulk > 0 else 0.0))
+
+    print_table("Bone creation (seconds)", ("bones", "add_bone", "bulk", "speedup"), rows)
+    return rows
+
+def bench_pole(count=1000, seed=0):
+    # Compare the vectorized solver with the per-chain mathutils formula on real edit bones
+    import random
+    from flexrig import flexrig, flexrig_plan
+
+    def jerryno_pole_angle(base, target, pole_target):
+        projected_pole_axis = (target.tail - base.head).cross(pole_target.matrix.translation - base.head).cross(base.tail - base.head)
+        return base.x_axis.angle(projected_pole_axis) if base.x_axis.cross(projected_pole_axis).angle(base.tail - base.head) >= 1 else -(base.x_axis.angle(projected_pole_axis))
+
+    rand = random.Random(seed)
+    point = lambda: (rand.uniform(-3, 3), rand.uniform(-3, 3), rand.uniform(-3, 3))
+
+    amt = flexrig.Flexrig("Bench.Pole")
+    plan = flexrig_plan.RigPlan(amt.arm.name)
+    for i in range(count):
+        base = plan.add_bone("Base." + str(i), point(), point())
+        target = plan.add_bone("Target." + str(i), point(), point())
+        pole = plan.add_bone("Pole." + str(i), point(), point())
+        plan.rolls[base] = rand.uniform(-3, 3)
+        plan.add_ik(base, base, target, pole, 1)
+
+    t_start = time.perf_counter()
+    plan.solve_ik()
+    t_solver = time.perf_counter() - t_start
+
+    amt.add_bones_bulk(plan.names, plan.heads, plan.tails, rolls=plan.rolls)
+    t_start = time.perf_counter()
+    reference = [jerryno_pole_angle(amt.edit_bone(plan.names[ik[1]]), amt.edit_bone(plan.names[ik[2]]), amt.edit_bone(plan.names[ik[3]])) for ik in plan.iks]
+    t_chain = time.perf_counter() - t_start
+    flexrig.switch_context_mode('OBJECT')
+
+    error = max(abs(ik[5] - angle) for ik, angle in zip(plan.iks, reference))
+    assert error < 1e-6, "vectorized pole angles differ from edit bones by " + str(error)
+    print_table("Pole angles (seconds)", ("chains", "per-chain", "solver", "max error"), [(count, t_chain, t_solver, error)])
+    return error
+
+def check_pole(count=1000, seed=0):
+    # Vectorized solver against pole_angle() chain by chain, no Blender needed. Degenerate
+    # chains (null base bone, collinear chain, pole on the bone line) must give the same
+    # angles, 0.0 when there is no pole direction at all.
+    import random
+    from flexrig import flexrig_plan
+
+    rand = random.Random(seed)
+    point = lambda: (rand.uniform(-3, 3), rand.uniform(-3, 3), rand.uniform(-3, 3))
+
+    chains = []
+    for i in range(count):
+        head, tail = point(), point()
+        chains.append((head, tail, flexrig_plan.bone_x_axis(head, tail, rand.uniform(-3, 3)), point(), point()))
+
+    x_axis = flexrig_plan.bone_x_axis((0.0, 0.0, 0.0), (0.0, 0.0, 1.0))
+    degenerate = [
+        # Null base bone
+        (((1.0, 1.0, 1.0), (1.0, 1.0, 1.0), (1.0, 0.0, 0.0), (0.0, 0.0, 2.0), (1.0, 0.0, 0.0)), 0.0),
+        # Collinear chain, pole off the line : fallback on the projected pole
+        (((0.0, 0.0, 0.0), (0.0, 0.0, 1.0), x_axis, (0.0, 0.0, 2.0), (0.0, 1.0, 0.5)), None),
+        # Collinear chain, pole on the bone line
+        (((0.0, 0.0, 0.0), (0.0, 0.0, 1.0), x_axis, (0.0, 0.0, 2.0), (0.0, 0.0, 3.0)), 0.0),
+        # Pole at the base head
+        (((0.0, 0.0, 0.0), (0.0, 0.0, 1.0), x_axis, (1.0, 0.0, 2.0), (0.0, 0.0, 0.0)), 0.0),
+    ]
+    chains += [chain for chain, expected in degenerate]
+
+    reference = [flexrig_plan.pole_angle(*chain) for chain in chains]
+    columns = list(zip(*chains))
+    vectorized = flexrig_plan.solve_pole_angles(*columns)
+
+    # Pure Python fallback of the solver when NumPy is missing
+    numpy_module, flexrig_plan.numpy = flexrig_plan.numpy, None
+    try:
+        fallback = flexrig_plan.solve_pole_angles(*columns)
+    finally:
+        flexrig_plan.numpy = numpy_module
+
+    error = max(abs(a - b) for a, b in zip(vectorized, reference))
+    assert error < 1e-9, "vectorized pole angles differ from pole_angle() by " + str(error)
+    assert fallback == reference, "pure Python pole angles differ from pole_angle()"
+    for (chain, expected), angle, solved in zip(degenerate, reference[count:], vectorized[count:]):
+        if expected is None:
+            assert abs(angle) > 1e-6, "collinear chain fallback lost the pole direction"
+        else:
+            assert angle == expected and solved == expected, "degenerate chain gives " + str(solved) + " instead of " + str(expected)
+
+    print_table("Pole angles without Blender", ("chains", "degenerate", "max error"), [(count, len(degenerate), error)])
+    return error
+
+def bench_armatures(sizes=(10, 100, 1000)):
+    import bpy
+    from flexrig import flexrig
+
+    def armature_add_loop(count):
+        for i in range(count):
+            bpy.ops.object.armature_add(enter_editmode=False, location=(0.0, 0.0, 0.0))
+
+    def data_api_loop(count):
+        for i in range(count):
+            flexrig.Flexrig.new_armature_object("Bench.Armature")
+
+    rows = []
+    for size in sizes:
+        t_ops = timed(armature_add_loop, size)
+        t_data = timed(data_api_loop, size)
+        rows.append((size, t_ops, t_data, t_ops / t_data if t_data > 0 else 0.0))
+
+    print_table("Armature creation (seconds)", ("armatures", "operator", "data API", "speedup"), rows)
+    return rows
+
+def bench_proxy(ratios=(0.05, 0.1, 0.25), target_name="Human_model", profile_name="Human"):
+    # Time and weight error of proxy weighting against full resolution bone heat on demo.blend
+    import bpy
+    from flexrig import flexrig, flexrig_library, flexrig_plan, flexrig_weights
+
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    bpy.ops.wm.open_mainfile(filepath=os.path.join(package_dir, "demo.blend"))
+
+    profile = flexrig_library.open_library().load(profile_name)
+
+    amt = flexrig.Flexrig("Bench.Proxy", batch=True)
+    amt.apply_plan(flexrig_plan.RigPlan.from_profile(profile, amt.arm.name))
+    names = flexrig_weights.bone_segments(amt.arm)[0]
+    target = bpy.data.objects[target_name]
+
+    def copy_target():
+        obj = target.copy()
+        obj.data = target.data.copy()
+        bpy.context.scene.objects.link(obj)
+        return obj
+
+    reference = copy_target()
+    t_heat = timed(flexrig.Flexrig.link_to_object, amt.arm.name, reference.name, 'HEAT')
+    expected = flexrig_weights.read_vertex_groups(reference, names)
+
+    rows = [("full", len(target.data.vertices), t_heat, 0.0, 0.0)]
+    for ratio in ratios:
+        obj = copy_target()
+        t_proxy = timed(flexrig.Flexrig.link_to_object, amt.arm.name, obj.name, 'HEAT', ratio)
+        mean, worst = flexrig_weights.weight_error(flexrig_weights.read_vertex_groups(obj, names), expected)
+        rows.append((ratio, len(obj.data.vertices), t_proxy, mean, worst))
+
+    print_table("Proxy weighting on " + target_name, ("ratio", "vertices", "seconds", "mean error", "max error"), rows)
+    return rows
+
+def bench_save(sizes=(10, 100, 1000), profile_name="Human"):
+    # Save one edited profile : whole library rewrite against a single profile file and the index
+    import json
+    import shutil
+    import tempfile
+    from flexrig import flexrig_library
+
+    template = flexrig_library.open_library().load(profile_name)
+
+    def variants(count):
+        out = []
+        for i in range(count):
+            profile = json.loads(json.dumps(template))
+            profile["name"] = profile_name + "." + str(i)
+            profile["rib"][2] += i * 1e-3
+            out.append(profile)
+        return out
+
+    def save_all(filename, profiles):
+        flexrig_library.write_json(filename, profiles)
+
+    def save_changed(library, profile):
+        library.put(profile)
+        library.write_index()
+
+    rows = []
+    for size in sizes:
+        path = tempfile.mkdtemp(prefix="flexrig_bench_")
+        try:
+            profiles = variants(size)
+            library = flexrig_library.ProfileLibrary(os.path.join(path, "profiles"))
+            library.save(profiles)
+
+            profiles[size // 2]["chest"][0] += 0.01
+            t_all = timed(save_all, os.path.join(path, "flexrig_profiles.json"), profiles)
+            t_changed = timed(save_changed, library, profiles[size // 2])
+            rows.append((size, t_all, t_changed))
+        finally:
+            shutil.rmtree(path)
+
+    print_table("Save one edited profile (seconds)", ("profiles", "whole file", "incremental"), rows)
+    return rows
+
+def bench_binary(count=10000, profile_name="Human"):
+    # Load time and memory of a generated library, single JSON file against the binary format
+    import json
+    import random
+    import shutil
+    import tempfile
+    import tracemalloc
+    from flexrig import flexrig_binary, flexrig_library
+
+    template = flexrig_library.open_library().load(profile_name)
+    rand = random.Random(0)
+    jitter = lambda v: [float(flexrig_binary.struct.unpack('<f', flexrig_binary.struct.pack('<f', x + rand.uniform(-0.05, 0.05)))[0]) for x in v]
+
+    profiles = []
+    for i in range(count):
+        profile = json.loads(json.dumps(template))
+        profile["name"] = profile_name + "." + str(i)
+        for key in ("rib", "chest", "tchest"):
+            profile[key] = jitter(profile[key])
+        for member in profile["heads"] + profile["arms"] + profile["legs"]:
+            for key, value in member.items():
+                if isinstance(value, list):
+                    member[key] = jitter(value)
+        profiles.append(profile)
+
+    def measure(func):
+        elapsed = timed(func)
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return elapsed, peak / (1024.0 * 1024.0)
+
+    path = tempfile.mkdtemp(prefix="flexrig_bench_")
+    try:
+        json_file = os.path.join(path, "profiles.json")
+        binary_file = os.path.join(path, "profiles" + flexrig_binary.EXTENSION)
+        with open(json_file, 'w') as f:
+            json.dump(profiles, f)
+        flexrig_binary.write(binary_file, profiles)
+
+        def load_json_one():
+            with open(json_file, 'r') as f:
+                return [p for p in json.load(f) if p["name"] == profiles[-1]["name"]][0]
+
+        def load_binary_one():
+            with flexrig_binary.BinaryLibrary(binary_file) as library:
+                return library.load(profiles[-1]["name"])
+
+        def load_json_all():
+            with open(json_file, 'r') as f:
+                return json.load(f)
+
+        def load_binary_all():
+            with flexrig_binary.BinaryLibrary(binary_file) as library:
+                return library.profiles()
+
+        rows = []
+        for label, func, filename in (("json one", load_json_one, json_file), ("binary one", load_binary_one, binary_file),
+                ("json all", load_json_all, json_file), ("binary all", load_binary_all, binary_file)):
+            elapsed, peak = measure(func)
+            rows.append((label, os.path.getsize(filename) / (1024.0 * 1024.0), elapsed, peak))
+
+        lossless = load_binary_all() == load_json_all()
+    finally:
+        shutil.rmtree(path)
+
+    print_table(str(count) + " profiles (MB, seconds, MB), lossless " + str(lossless), ("load", "file size", "seconds", "peak memory"), rows)
+    return rows
+
+def build_members(profile, backend, batch=False):
+    # Profile built member by member, as the UI operators did before rig plans
+    from flexrig import flexrig
+
+    amt = flexrig.Flexrig("Bench.Backend", batch=batch, backend=backend)
+    amt.create_chest(profile["rib"], profile["chest"], profile["tchest"])
+    for h in profile["heads"]:
+        amt.create_head(h["suffix"], h["neck"], h["head"])
+    for a in profile["arms"]:
+        amt.create_arm(a["suffix"], a["upper"], a["lower"], a["wrist"], a["shoulder"], a["ik"], a["hand"], a["thumb"])
+    for lg in profile["legs"]:
+        amt.create_leg(lg["suffix"], lg["upper"], lg["lower"], lg["knee"], lg["foot"], lg["hip"], lg["ik"])
+    amt.create_ik_controller(profile["control"])
+    if batch:
+        amt.build()
+    return amt
+
+def bench_backends(profile_name="Human", repeat=100):
+    # Demo profile built member by member with the in-memory backend, and with Blender when
+    # available : both bone tables must be identical
+    from flexrig import flexrig, flexrig_backend, flexrig_library
+
+    profile = flexrig_library.open_library().load(profile_name)
+
+    t_memory = timed(lambda: [build_members(profile, flexrig_backend.MemoryBackend()) for i in range(repeat)]) / repeat
+    memory = build_members(profile, flexrig_backend.MemoryBackend())
+    rows = [("memory", len(memory.plan), t_memory, 0)]
+
+    differences = []
+    if flexrig.bpy is not None:
+        t_start = time.perf_counter()
+        blender = build_members(profile, flexrig.BlenderBackend())
+        t_blender = time.perf_counter() - t_start
+        differences = flexrig_backend.compare_bone_tables(memory.bone_table(), blender.bone_table())
+        rows.append(("blender", len(blender.plan), t_blender, len(differences)))
+        for name, field in differences:
+            print("FlexRig : " + name + " differs on " + field)
+
+    print_table("Demo profile build per backend", ("backend", "bones", "seconds", "differences"), rows)
+    assert len(differences) == 0, "bone tables of the backends differ on " + str(len(differences)) + " fields"
+    return rows
+
+def check_batch():
+    # Batch and member by member builds of every library profile on the in-memory backend,
+    # no Blender needed : same bone table, one EDIT and one POSE session for the batch
+    from flexrig import flexrig_backend, flexrig_library
+
+    # Member by member mode switches of the shipped profiles
+    expected_switches = {"Human": 14, "Monster": 18}
+
+    library = flexrig_library.open_library()
+    rows = []
+    for name in library.names():
+        profile = library.load(name)
+        members = build_members(profile, flexrig_backend.MemoryBackend())
+        batch = build_members(profile, flexrig_backend.MemoryBackend(), batch=True)
+
+        differences = flexrig_backend.compare_bone_tables(members.bone_table(), batch.bone_table())
+        rows.append((name, len(batch.plan), members.mode_switches, batch.mode_switches, len(differences)))
+
+        assert len(differences) == 0, name + " : batch build differs on " + ", ".join(bone + " " + field for bone, field in differences)
+        assert batch.mode_switches == 2, name + " : batch build switched mode " + str(batch.mode_switches) + " times"
+        assert members.mode_switches == expected_switches.get(name, members.mode_switches) and members.mode_switches > 2, name + " : member by member build switched mode " + str(members.mode_switches) + " times"
+
+    print_table("Batch against member by member builds", ("profile", "bones", "switches", "batch", "differences"), rows)
+    return rows
+
+def bench_export(count=2000, profile_name="Human"):
+    # Skeletons exported per second from one profile, each format streamed to a temporary file
+    import shutil
+    import tempfile
+    from flexrig import flexrig_export, flexrig_library
+
+    profile = flexrig_library.open_library().load(profile_name)
+    profiles = []
+    for i in range(count):
+        variant = dict(profile)
+        variant["name"] = profile_name + "." + str(i)
+        profiles.append(variant)
+
+    path = tempfile.mkdtemp(prefix="flexrig_bench_")
+    try:
+        rows = []
+        for fmt, output in (("json", os.path.join(path, "skeletons.jsonl")), ("gltf", os.path.join(path, "gltf"))):
+            t_build = timed(lambda: [flexrig_export.export_profile(p, "Bench.Export", fmt) for p in profiles])
+            t_stream = timed(flexrig_export.export_stream, iter(profiles), output, fmt, "Bench.Export")
+            rows.append((fmt, count, count / t_build, count / t_stream))
+    finally:
+        shutil.rmtree(path)
+
+    print_table("Skeleton export (profiles per second)", ("format", "profiles", "build", "build + write"), rows)
+    return rows
+
+def bench_instances(counts=(100, 1000), profile_name="Monster"):
+    # Crowd of characters from one profile, one armature data each against linked instances.
+    # Memory is the saved .blend size under Blender, traced Python memory with the in-memory backend
+    import shutil
+    import tempfile
+    import tracemalloc
+    from flexrig import flexrig, flexrig_backend, flexrig_library, flexrig_plan
+
+    profile = flexrig_library.open_library().load(profile_name)
+
+    def crowd(count, linked):
+        backend = flexrig.BlenderBackend() if flexrig.bpy is not None else flexrig_backend.MemoryBackend()
+        t_start = time.perf_counter()
+        for i in range(count):
+            if linked:
+                flexrig.Flexrig.linked_instance("Bench.Crowd", profile, backend=backend)
+            else:
+                amt = flexrig.Flexrig("Bench.Crowd", batch=True, backend=backend)
+                amt.apply_plan(flexrig_plan.RigPlan.from_profile(profile, amt.arm.name))
+        return backend, time.perf_counter() - t_start
+
+    def blender_size(count, linked):
+        flexrig.bpy.ops.wm.read_homefile(use_empty=True)
+        elapsed = crowd(count, linked)[1]
+        path = tempfile.mkdtemp(prefix="flexrig_bench_")
+        try:
+            filename = os.path.join(path, "crowd.blend")
+            flexrig.bpy.ops.wm.save_as_mainfile(filepath=filename, copy=True, compress=False)
+            size = os.path.getsize(filename)
+        finally:
+            shutil.rmtree(path)
+        return len(flexrig.bpy.data.armatures), size, elapsed
+
+    def memory_size(count, linked):
+        # Timed without tracing, which slows every allocation down
+        elapsed = crowd(count, linked)[1]
+        tracemalloc.start()
+        backend = crowd(count, linked)[0]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return len(set(id(arm.data) for arm in backend.armatures.values())), size, elapsed
+
+    measure = blender_size if flexrig.bpy is not None else memory_size
+
+    rows = []
+    for count in counts:
+        copies, copies_size, t_copies = measure(count, False)
+        shared, shared_size, t_shared = measure(count, True)
+        rows.append((count, copies, shared, copies_size / (1024.0 * 1024.0), shared_size / (1024.0 * 1024.0), (copies_size - shared_size) / (1024.0 * 1024.0), t_copies, t_shared))
+
+    print_table("Crowd of " + profile_name + " (MB, seconds)", ("characters", "data copies", "data linked", "copies", "linked", "saved", "t copies", "t linked"), rows)
+    return rows
+
+def bench_multilink(meshes=8, vertices=100000, bones=30, seed=0):
+    # Fast weights of several meshes against the same bones, one thread against the thread pool
+    import numpy
+    from flexrig import flexrig_weights
+
+    rand = numpy.random.RandomState(seed)
+    heads = rand.uniform(-1.0, 1.0, (bones, 3))
+    tails = heads + rand.uniform(-0.3, 0.3, (bones, 3))
+    point_sets = [rand.uniform(-1.0, 1.0, (vertices, 3)) for i in range(meshes)]
+
+    rows = []
+    reference = None
+    for workers in (1, os.cpu_count() or 1):
+        t_start = time.perf_counter()
+        results = flexrig_weights.solve_many(point_sets, heads, tails, workers=workers)
+        elapsed = time.perf_counter() - t_start
+        if reference is None:
+            reference = results
+        same = all((a[0] == b[0]).all() and (a[1] == b[1]).all() for a, b in zip(reference, results))
+        rows.append((workers, meshes, vertices * meshes, elapsed, str(same)))
+
+    print_table("Fast weights of " + str(meshes) + " meshes", ("threads", "meshes", "vertices", "seconds", "identical"), rows)
+    return rows
+
+def bench_steps(vertices=1000000, bones=40, chunk=2048, seed=0):
+    # Longest UI stall of the modal link : one weight step against solving the mesh at once,
+    # chunks as in Flexrig.link_steps()
+    import numpy
+    from flexrig import flexrig_weights
+
+    rand = numpy.random.RandomState(seed)
+    heads = rand.uniform(-1.0, 1.0, (bones, 3))
+    tails = heads + rand.uniform(-0.3, 0.3, (bones, 3))
+    points = rand.uniform(-1.0, 1.0, (vertices, 3))
+
+    # Proxy of a tenth of the vertices, weighted by the fast solve
+    proxy_points = points[::10]
+    proxy_triangles = numpy.arange(len(proxy_points) // 3 * 3).reshape(-1, 3)
+    proxy_bones, proxy_weights = flexrig_weights.solve_weights(proxy_points, heads, tails)
+    proxy_dense = flexrig_weights.dense_weights(proxy_bones, proxy_weights, bones)
+
+    rows = []
+    for name, steps_func, once_func in (
+            ("solve", lambda b, w: flexrig_weights.solve_steps(points, heads, tails, b, w, chunk=chunk),
+                lambda: flexrig_weights.solve_weights(points, heads, tails)),
+            ("transfer", lambda b, w: flexrig_weights.transfer_steps(proxy_points, proxy_triangles, proxy_dense, points, b, w, chunk // 4),
+                lambda: flexrig_weights.transfer_weights(proxy_points, proxy_triangles, proxy_dense, points))):
+        once = timed(once_func)
+
+        b, w = flexrig_weights.influence_arrays(vertices, 4)
+        durations = []
+        t_step = time.perf_counter()
+        for done in steps_func(b, w):
+            durations.append((time.perf_counter() - t_step) * 1000.0)
+            t_step = time.perf_counter()
+        durations = numpy.array(durations)
+        rows.append((name, len(durations), float(numpy.median(durations)), float(numpy.percentile(durations, 99)), float(durations.max()), once * 1000.0))
+
+    print_table("Modal steps of " + str(vertices) + " vertices, " + str(chunk) + " per step", ("weights", "steps", "median ms", "p99 ms", "max ms", "at once ms"), rows)
+    return rows
+
+BENCHMARKS = {
+    "armatures": bench_armatures,
+    "backends": bench_backends,
+    "batchcheck": check_batch,
+    "binary": bench_binary,
+    "bones": bench_bones,
+    "export": bench_export,
+    "instances": bench_instances,
+    "multilink": bench_multilink,
+    "pole": bench_pole,
+    "polecheck": check_pole,
+    "proxy": bench_proxy,
+    "save": bench_save,
+    "steps": bench_steps,
+}
+
+def main(argv):
+    names = argv if len(argv) > 0 else sorted(BENCHMARKS.keys())
+    for name in names:
+        BENCHMARKS[name]()
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
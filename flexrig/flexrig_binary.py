@@ -0,0 +1,254 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Compact binary profile library for large generated sets of profiles.
+#
+# Little endian, every section 4 bytes aligned :
+#   header   magic, version, profile / head / arm / leg / string counts, string bytes
+#   profiles name, flags, first head, head count, first arm, arm count, first leg, leg count, rib, chest, tchest
+#   heads    suffix, flags, neck, head
+#   arms     suffix, flags, upper, lower, wrist, thumb, hand
+#   legs     suffix, flags, upper, lower, knee, foot
+#   strings  offsets (count + 1) then UTF-8 bytes
+#
+# Joints are float32, the precision of Blender float properties, so profiles saved from Blender
+# go through JSON -> binary -> JSON unchanged. The file is memory mapped and a profile is only
+# decoded when asked for.
+
+import json
+import mmap
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b'FXRB'
+VERSION = 1
+EXTENSION = ".fxrb"
+
+HEADER = struct.Struct('<4s7I')
+PROFILE = struct.Struct('<8I9f')
+HEAD = struct.Struct('<2I6f')
+ARM = struct.Struct('<2I15f')
+LEG = struct.Struct('<2I12f')
+
+PROFILE_CONTROL = 1
+ARM_SHOULDER = 1
+ARM_IK = 2
+LEG_HIP = 1
+LEG_IK = 2
+
+HEAD_JOINTS = ("neck", "head")
+ARM_JOINTS = ("upper", "lower", "wrist", "thumb", "hand")
+LEG_JOINTS = ("upper", "lower", "knee", "foot")
+
+# Utils -----------------------------------------
+
+def joints(data, keys):
+    out = []
+    for key in keys:
+        out.extend(data[key])
+    return out
+
+def vectors(values, keys):
+    return {key: list(values[i * 3:i * 3 + 3]) for i, key in enumerate(keys)}
+
+class StringTable:
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def add(self, value):
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return i
+
+    def pack(self):
+        blobs = [s.encode('utf-8') for s in self.strings]
+        offsets = [0]
+        for b in blobs:
+            offsets.append(offsets[-1] + len(b))
+        data = b''.join(blobs)
+        return struct.pack('<' + str(len(offsets)) + 'I', *offsets) + data + b'\0' * (-len(data) % 4), len(data)
+
+# Writer ----------------------------------------
+
+def write(filename, profiles):
+    strings = StringTable()
+    records = [bytearray(), bytearray(), bytearray(), bytearray()]
+    counts = [0, 0, 0]
+
+    for p in profiles:
+        first = list(counts)
+
+        for h in p["heads"]:
+            records[1] += HEAD.pack(strings.add(h["suffix"]), 0, *joints(h, HEAD_JOINTS))
+        for a in p["arms"]:
+            flags = (ARM_SHOULDER if a["shoulder"] else 0) | (ARM_IK if a["ik"] else 0)
+            records[2] += ARM.pack(strings.add(a["suffix"]), flags, *joints(a, ARM_JOINTS))
+        for lg in p["legs"]:
+            flags = (LEG_HIP if lg["hip"] else 0) | (LEG_IK if lg["ik"] else 0)
+            records[3] += LEG.pack(strings.add(lg["suffix"]), flags, *joints(lg, LEG_JOINTS))
+
+        counts = [counts[0] + len(p["heads"]), counts[1] + len(p["arms"]), counts[2] + len(p["legs"])]
+        records[0] += PROFILE.pack(strings.add(p["name"]), PROFILE_CONTROL if p["control"] else 0,
+            first[0], len(p["heads"]), first[1], len(p["arms"]), first[2], len(p["legs"]),
+            *(list(p["rib"]) + list(p["chest"]) + list(p["tchest"])))
+
+    table, table_bytes = strings.pack()
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(profiles), counts[0], counts[1], counts[2], len(strings.strings), table_bytes))
+        for r in records:
+            f.write(r)
+        f.write(table)
+
+# Reader ----------------------------------------
+
+class BinaryLibrary:
+
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.profile_count, head_count, arm_count, leg_count, string_count, string_bytes = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("FlexRig : " + filename + " is not a binary profile library")
+
+        self.profiles_at = HEADER.size
+        self.heads_at = self.profiles_at + self.profile_count * PROFILE.size
+        self.arms_at = self.heads_at + head_count * HEAD.size
+        self.legs_at = self.arms_at + arm_count * ARM.size
+        self.offsets_at = self.legs_at + leg_count * LEG.size
+        self.strings_at = self.offsets_at + (string_count + 1) * 4
+        self.string_count = string_count
+        self.index = None
+
+    def __len__(self):
+        return self.profile_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def string(self, i):
+        start, end = struct.unpack_from('<2I', self.data, self.offsets_at + i * 4)
+        return self.data[self.strings_at + start:self.strings_at + end].decode('utf-8')
+
+    def name(self, i):
+        return self.string(struct.unpack_from('<I', self.data, self.profiles_at + i * PROFILE.size)[0])
+
+    def names(self):
+        return [self.name(i) for i in range(self.profile_count)]
+
+    def find(self, name):
+        if self.index is None:
+            strings = self.strings()
+            names = struct.unpack_from('<' + str(PROFILE.size // 4 * self.profile_count) + 'I', self.data, self.profiles_at)[::PROFILE.size // 4]
+            self.index = {strings[n]: i for i, n in enumerate(names)}
+        return self.index.get(name)
+
+    @staticmethod
+    def to_profile(record, heads, arms, legs, string):
+        out = {'name': string(record[0]), 'control': bool(record[1] & PROFILE_CONTROL)}
+        out.update(vectors(record[8:], ("rib", "chest", "tchest")))
+
+        out["heads"] = []
+        for r in heads:
+            h = {'suffix': string(r[0])}
+            h.update(vectors(r[2:], HEAD_JOINTS))
+            out["heads"].append(h)
+
+        out["arms"] = []
+        for r in arms:
+            a = {'suffix': string(r[0]), 'shoulder': bool(r[1] & ARM_SHOULDER), 'ik': bool(r[1] & ARM_IK)}
+            a.update(vectors(r[2:], ARM_JOINTS))
+            out["arms"].append(a)
+
+        out["legs"] = []
+        for r in legs:
+            lg = {'suffix': string(r[0]), 'hip': bool(r[1] & LEG_HIP), 'ik': bool(r[1] & LEG_IK)}
+            lg.update(vectors(r[2:], LEG_JOINTS))
+            out["legs"].append(lg)
+
+        return out
+
+    def profile(self, i):
+        record = PROFILE.unpack_from(self.data, self.profiles_at + i * PROFILE.size)
+        rows = lambda record_struct, at, first, count: [record_struct.unpack_from(self.data, at + j * record_struct.size) for j in range(first, first + count)]
+        return self.to_profile(record, rows(HEAD, self.heads_at, record[2], record[3]),
+            rows(ARM, self.arms_at, record[4], record[5]), rows(LEG, self.legs_at, record[6], record[7]), self.string)
+
+    def load(self, name):
+        i = self.find(name)
+        if i is None:
+            raise KeyError("FlexRig : profile " + name + " not found")
+        return self.profile(i)
+
+    def strings(self):
+        offsets = struct.unpack_from('<' + str(self.string_count + 1) + 'I', self.data, self.offsets_at)
+        blob = self.data[self.strings_at:self.strings_at + offsets[-1]]
+        return [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(self.string_count)]
+
+    def profiles(self):
+        # Whole library, each section unpacked in one pass
+        strings = self.strings()
+        records = list(PROFILE.iter_unpack(self.data[self.profiles_at:self.heads_at]))
+        heads = list(HEAD.iter_unpack(self.data[self.heads_at:self.arms_at]))
+        arms = list(ARM.iter_unpack(self.data[self.arms_at:self.legs_at]))
+        legs = list(LEG.iter_unpack(self.data[self.legs_at:self.offsets_at]))
+
+        return [self.to_profile(r, heads[r[2]:r[2] + r[3]], arms[r[4]:r[4] + r[5]], legs[r[6]:r[6] + r[7]], strings.__getitem__) for r in records]
+
+    def joint_arrays(self):
+        # Joints of every profile and member as float32 arrays, views on the mapped file
+        if numpy is None:
+            raise ImportError("FlexRig : NumPy is required for joint arrays")
+
+        def view(at, count, record, floats):
+            rows = numpy.frombuffer(self.data, dtype='<u4', count=count * record.size // 4, offset=at).reshape(count, record.size // 4)
+            return rows[:, record.size // 4 - floats:].view('<f4').reshape(count, floats // 3, 3)
+
+        return {
+            'profiles': view(self.profiles_at, self.profile_count, PROFILE, 9),
+            'heads': view(self.heads_at, (self.arms_at - self.heads_at) // HEAD.size, HEAD, 6),
+            'arms': view(self.arms_at, (self.legs_at - self.arms_at) // ARM.size, ARM, 15),
+            'legs': view(self.legs_at, (self.offsets_at - self.legs_at) // LEG.size, LEG, 12),
+        }
+
+# JSON ------------------------------------------
+
+def import_json(json_filename, filename):
+    with open(json_filename, 'r') as f:
+        write(filename, json.load(f))
+
+def export_json(filename, json_filename):
+    with BinaryLibrary(filename) as library:
+        profiles = library.profiles()
+    with open(json_filename, 'w') as f:
+        json.dump(profiles, f)
@@ -0,0 +1,157 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# On-disk cache of NumPy arrays (.npz), one file per key, size bounded with LRU eviction.
+# Last use of an entry is its file modification time.
+
+import hashlib
+import os
+import tempfile
+import zipfile
+import zlib
+
+# NumPy is imported on first cache use, this module is also imported for its paths when
+# the add-on is enabled
+numpy = None
+
+def load_numpy():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as module
+        except ImportError:
+            return None
+        numpy = module
+    return numpy
+
+def user_cache_path():
+    # Per user directory, the add-on folder may be read-only (system wide install)
+    try:
+        import bpy
+        return bpy.utils.user_resource('DATAFILES', path=os.path.join("flexrig", "cache"))
+    except (ImportError, AttributeError):
+        pass
+
+    if os.name == 'nt':
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "flexrig")
+
+DEFAULT_PATH = user_cache_path()
+
+class FlexrigCache:
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(*parts):
+        h = hashlib.sha1()
+        for p in parts:
+            h.update(p if isinstance(p, bytes) else str(p).encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.path, key + ".npz")
+
+    def get(self, key):
+        if load_numpy() is None:
+            return None
+
+        filename = self.filename(key)
+        try:
+            with numpy.load(filename, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(filename, None)
+        except (IOError, OSError):
+            return None
+        except (ValueError, KeyError, zipfile.BadZipFile, zlib.error):
+            # Truncated or corrupt entry, removed so it is solved and written again
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            return None
+        return arrays
+
+    def put(self, key, arrays):
+        if load_numpy() is None:
+            return False
+
+        # An entry that can't be written is only a miss next time
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            fd, tmp_name = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        except (IOError, OSError):
+            return False
+
+        # Written aside then moved, a reader never sees a partial entry
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                numpy.savez_compressed(f, **arrays)
+            os.replace(tmp_name, self.filename(key))
+        except (IOError, OSError):
+            if os.path.isfile(tmp_name):
+                os.remove(tmp_name)
+            return False
+
+        self.evict()
+        return True
+
+    def entries(self):
+        # Other processes (batch workers) may remove entries while they are listed
+        out = []
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return out
+        for name in names:
+            if name.endswith(".npz"):
+                try:
+                    stat = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    continue
+                out.append((stat.st_mtime, stat.st_size, name))
+        return out
+
+    def size(self):
+        return sum(e[1] for e in self.entries())
+
+    def evict(self):
+        # Remove least recently used entries until the cache fits in max_bytes
+        entries = sorted(self.entries())
+        total = sum(e[1] for e in entries)
+        for mtime, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        for mtime, size, name in self.entries():
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
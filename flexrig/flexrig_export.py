@@ -0,0 +1,244 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Rest pose skeleton export straight from profiles, no Blender needed :
+#   python flexrig/flexrig_export.py --profiles flexrig/profiles --format gltf --output out/
+#   python flexrig/flexrig_export.py --profiles generated.fxrb --format json --output skeletons.jsonl
+#
+# Bone names and parents are the ones FLEXRIG_OT_create_amt builds (same RigPlan). glTF files
+# are Y up with one node per bone and a skin, JSON skeletons are written one per line.
+
+import argparse
+import base64
+import json
+import math
+import os
+import struct
+import sys
+
+# Utils -----------------------------------------
+
+# Blender Z up to glTF Y up
+AXIS_CONVERSION = ((1.0, 0.0, 0.0), (0.0, 0.0, 1.0), (0.0, -1.0, 0.0))
+
+def normalize(v):
+    length = math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+    if length < 1e-12:
+        return None
+    return (v[0] / length, v[1] / length, v[2] / length)
+
+def bone_rotation(head, tail, roll, flexrig_plan):
+    # Rest rotation of an edit bone as 3 columns X, Y (along the bone), Z
+    y_axis = normalize(flexrig_plan.sub(tail, head))
+    if y_axis is None:
+        return ((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0))
+    x_axis = normalize(flexrig_plan.bone_x_axis(head, tail, roll))
+    return (x_axis, y_axis, normalize(flexrig_plan.cross(x_axis, y_axis)))
+
+def transpose_apply(columns, v):
+    # R^T v, R given by its columns
+    return (columns[0][0] * v[0] + columns[0][1] * v[1] + columns[0][2] * v[2],
+        columns[1][0] * v[0] + columns[1][1] * v[1] + columns[1][2] * v[2],
+        columns[2][0] * v[0] + columns[2][1] * v[1] + columns[2][2] * v[2])
+
+def convert(rows, v):
+    return (rows[0][0] * v[0] + rows[0][1] * v[1] + rows[0][2] * v[2],
+        rows[1][0] * v[0] + rows[1][1] * v[1] + rows[1][2] * v[2],
+        rows[2][0] * v[0] + rows[2][1] * v[1] + rows[2][2] * v[2])
+
+def to_quaternion(columns):
+    # (x, y, z, w) of a rotation matrix given by its columns
+    m00, m10, m20 = columns[0]
+    m01, m11, m21 = columns[1]
+    m02, m12, m22 = columns[2]
+    trace = m00 + m11 + m22
+    if trace > 0.0:
+        s = math.sqrt(trace + 1.0) * 2.0
+        q = ((m21 - m12) / s, (m02 - m20) / s, (m10 - m01) / s, 0.25 * s)
+    elif m00 > m11 and m00 > m22:
+        s = math.sqrt(1.0 + m00 - m11 - m22) * 2.0
+        q = (0.25 * s, (m01 + m10) / s, (m02 + m20) / s, (m21 - m12) / s)
+    elif m11 > m22:
+        s = math.sqrt(1.0 + m11 - m00 - m22) * 2.0
+        q = ((m01 + m10) / s, 0.25 * s, (m12 + m21) / s, (m02 - m20) / s)
+    else:
+        s = math.sqrt(1.0 + m22 - m00 - m11) * 2.0
+        q = ((m02 + m20) / s, (m12 + m21) / s, 0.25 * s, (m10 - m01) / s)
+    n = math.sqrt(q[0] * q[0] + q[1] * q[1] + q[2] * q[2] + q[3] * q[3])
+    return (q[0] / n, q[1] / n, q[2] / n, q[3] / n)
+
+# Skeleton --------------------------------------
+
+def skeleton(plan, y_up=True):
+    # World (armature space) and parent local rest transforms of every bone of a plan
+    from flexrig import flexrig_plan
+
+    world_rotations = []
+    world_translations = []
+    lengths = []
+    for head, tail, roll in zip(plan.heads, plan.tails, plan.rolls):
+        d = flexrig_plan.sub(tail, head)
+        lengths.append(math.sqrt(flexrig_plan.dot(d, d)))
+        columns = bone_rotation(head, tail, roll, flexrig_plan)
+        translation = tuple(float(c) for c in head)
+        if y_up:
+            columns = tuple(convert(AXIS_CONVERSION, c) for c in columns)
+            translation = convert(AXIS_CONVERSION, translation)
+        world_rotations.append(columns)
+        world_translations.append(translation)
+
+    translations = []
+    rotations = []
+    for i, parent in enumerate(plan.parents):
+        columns = world_rotations[i]
+        translation = world_translations[i]
+        if parent >= 0:
+            # Parent inverse : R_p^T (R, t - t_p)
+            p_columns = world_rotations[parent]
+            columns = tuple(transpose_apply(p_columns, c) for c in columns)
+            translation = transpose_apply(p_columns, flexrig_plan.sub(translation, world_translations[parent]))
+        translations.append(translation)
+        rotations.append(to_quaternion(columns))
+
+    return {
+        'names': list(plan.names),
+        'parents': list(plan.parents),
+        'translations': translations,
+        'rotations': rotations,
+        'lengths': lengths,
+        'world_rotations': world_rotations,
+        'world_translations': world_translations,
+    }
+
+def to_json(plan, skel):
+    # Compact skeleton, flat float lists rounded to a micro unit
+    plan.solve_ik()
+    flat = lambda vectors: [round(c, 6) for v in vectors for c in v]
+    return {
+        'armature': plan.amt_name,
+        'names': skel["names"],
+        'parents': skel["parents"],
+        'translations': flat(skel["translations"]),
+        'rotations': flat(skel["rotations"]),
+        'lengths': [round(length, 6) for length in skel["lengths"]],
+        'iks': [[plan.names[ik[0]], plan.names[ik[2]], plan.names[ik[3]], ik[4], ik[5]] for ik in plan.iks],
+    }
+
+def to_gltf(plan, skel):
+    # glTF 2.0 document, one node per bone under a root node holding the skin
+    count = len(plan)
+    children = [[] for i in range(count)]
+    roots = []
+    for i, parent in enumerate(skel["parents"]):
+        (children[parent] if parent >= 0 else roots).append(i + 1)
+
+    nodes = [{'name': plan.amt_name, 'children': roots}]
+    for i in range(count):
+        node = {'name': skel["names"][i], 'translation': list(skel["translations"][i]), 'rotation': list(skel["rotations"][i])}
+        if len(children[i]) > 0:
+            node["children"] = children[i]
+        nodes.append(node)
+
+    # Inverse bind matrices, column major : [R^T | -R^T t]
+    matrices = bytearray()
+    for columns, t in zip(skel["world_rotations"], skel["world_translations"]):
+        r_t = [transpose_apply(columns, axis) for axis in ((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0))]
+        inv_t = transpose_apply(columns, t)
+        matrices += struct.pack('<16f', r_t[0][0], r_t[0][1], r_t[0][2], 0.0, r_t[1][0], r_t[1][1], r_t[1][2], 0.0,
+            r_t[2][0], r_t[2][1], r_t[2][2], 0.0, -inv_t[0], -inv_t[1], -inv_t[2], 1.0)
+
+    return {
+        'asset': {'version': "2.0", 'generator': "FlexRig"},
+        'scene': 0,
+        'scenes': [{'nodes': [0]}],
+        'nodes': nodes,
+        'skins': [{'name': plan.amt_name, 'skeleton': 0, 'joints': list(range(1, count + 1)), 'inverseBindMatrices': 0}],
+        'accessors': [{'bufferView': 0, 'componentType': 5126, 'count': count, 'type': "MAT4"}],
+        'bufferViews': [{'buffer': 0, 'byteLength': len(matrices)}],
+        'buffers': [{'byteLength': len(matrices), 'uri': "data:application/octet-stream;base64," + base64.b64encode(bytes(matrices)).decode('ascii')}],
+    }
+
+# Export ----------------------------------------
+
+def export_profile(profile, amt_name, fmt='json'):
+    from flexrig import flexrig_plan
+
+    plan = flexrig_plan.RigPlan.from_profile(profile, amt_name)
+    skel = skeleton(plan, y_up=(fmt == 'gltf'))
+    return to_gltf(plan, skel) if fmt == 'gltf' else to_json(plan, skel)
+
+def export_stream(profiles, output, fmt='json', amt_name="Flexrig.Armature"):
+    # One profile at a time : JSON skeletons as lines of one file, glTF as files of a directory
+    count = 0
+    if fmt == 'gltf':
+        from flexrig import flexrig_library
+
+        if not os.path.isdir(output):
+            os.makedirs(output)
+        for profile in profiles:
+            # Profile names may hold path separators, files are named as library shards
+            with open(os.path.join(output, flexrig_library.shard_stem(profile["name"]) + ".gltf"), 'w') as f:
+                json.dump(export_profile(profile, amt_name, fmt), f, separators=(',', ':'))
+            count += 1
+    else:
+        with open(output, 'w') as f:
+            for profile in profiles:
+                out = export_profile(profile, amt_name, fmt)
+                out["profile"] = profile["name"]
+                f.write(json.dumps(out, separators=(',', ':')) + "\n")
+                count += 1
+    return count
+
+def iter_profiles(path, names=None):
+    # Profiles of a library directory, a binary library or a JSON list file
+    from flexrig import flexrig_binary, flexrig_library
+
+    if path.endswith(flexrig_binary.EXTENSION):
+        with flexrig_binary.BinaryLibrary(path) as library:
+            for i in range(len(library)) if names is None else [library.find(n) for n in names]:
+                if i is None:
+                    raise KeyError("FlexRig : profile not found in " + path)
+                yield library.profile(i)
+    elif os.path.isdir(path):
+        library = flexrig_library.ProfileLibrary(path)
+        library.load_index()
+        for name in library.names() if names is None else names:
+            yield library.load(name)
+    else:
+        with open(path, 'r') as f:
+            profiles = json.load(f)
+        for profile in profiles:
+            if names is None or profile["name"] in names:
+                yield profile
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Export FlexRig profiles as rest pose skeletons")
+    parser.add_argument("--profiles", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"), help="profile library directory, .fxrb or JSON file")
+    parser.add_argument("--profile", action="append", default=None, help="profile to export, every profile by default")
+    parser.add_argument("--format", default='json', choices=['json', 'gltf'])
+    parser.add_argument("--armature", default="Flexrig.Armature", help="armature name used in bone names")
+    parser.add_argument("--output", required=True, help="JSON lines file, or directory for glTF")
+    args = parser.parse_args(argv)
+
+    count = export_stream(iter_profiles(args.profiles, args.profile), args.output, args.format, args.armature)
+    print("FlexRig : " + str(count) + " skeletons exported to " + args.output)
+    return 0
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,412 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Profile library, one JSON file per profile plus an index file holding names, hashes and
+# member counts. A profile file is only read when that profile is asked for.
+#
+# Index changes are appended to a journal, folded back into the index file once the journal
+# grows past a quarter of the library, so saving one profile does not depend on library size.
+
+import hashlib
+import json
+import marshal
+import os
+import re
+import tempfile
+import threading
+from . import flexrig_cache
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.path.join(ADDON_DIR, "profiles")
+LEGACY_FILE = os.path.join(ADDON_DIR, "flexrig_profiles.json")
+SNAPSHOT_FILE = os.path.join(flexrig_cache.user_cache_path(), "profiles.marshal")
+INDEX_FILE = "index.json"
+JOURNAL_FILE = "index.log"
+
+# Utils -----------------------------------------
+
+def profile_hash(profile):
+    return hashlib.sha1(json.dumps(profile, sort_keys=True).encode('utf-8')).hexdigest()
+
+def shard_stem(name):
+    # Readable and unique whatever the profile name, safe as a file name
+    safe = re.sub(r'[^A-Za-z0-9_.-]', '_', name)[:64]
+    return safe + "." + hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]
+
+def shard_name(name):
+    return shard_stem(name) + ".json"
+
+def index_entry(profile):
+    return {
+        'name': profile["name"],
+        'file': shard_name(profile["name"]),
+        'hash': profile_hash(profile),
+        'heads': len(profile["heads"]),
+        'arms': len(profile["arms"]),
+        'legs': len(profile["legs"]),
+    }
+
+def sync_directory(directory):
+    # Make a rename durable, not available on every platform
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def write_json(filename, data):
+    # Written aside, flushed to disk then moved, a crash leaves the old or the new file
+    directory = os.path.dirname(filename)
+    fd, tmp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, filename)
+    except (IOError, OSError):
+        if os.path.isfile(tmp_name):
+            os.remove(tmp_name)
+        raise
+    sync_directory(directory)
+
+def read_json(filename):
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+# Library ---------------------------------------
+
+class ProfileLibrary:
+
+    def __init__(self, path=DEFAULT_PATH, snapshot=None):
+        self.path = path
+        self.snapshot = snapshot
+        self.entries = []
+        self.index = {}
+        self.pending = []
+        self.journal = 0
+
+    def index_path(self):
+        return os.path.join(self.path, INDEX_FILE)
+
+    def journal_path(self):
+        return os.path.join(self.path, JOURNAL_FILE)
+
+    def set_entries(self, entries):
+        self.entries = entries
+        self.index = {e["name"]: i for i, e in enumerate(entries)}
+
+    def apply_change(self, change):
+        i = self.index.get(change["name"])
+        if change.get("removed", False):
+            if i is not None:
+                self.set_entries(self.entries[:i] + self.entries[i + 1:])
+        elif i is None:
+            self.index[change["name"]] = len(self.entries)
+            self.entries.append(change)
+        else:
+            self.entries[i] = change
+
+    def load_snapshot(self, stamp):
+        # Parsed index of a previous session, valid while the index files are unchanged
+        try:
+            with open(self.snapshot, 'rb') as f:
+                data = marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return False
+
+        if data.get("path") != self.path or data.get("stamp") != stamp:
+            return False
+
+        self.set_entries(data["entries"])
+        self.pending = []
+        self.journal = data["journal"]
+        return True
+
+    def write_snapshot(self, stamp):
+        directory = os.path.dirname(self.snapshot)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            fd, tmp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump({'path': self.path, 'stamp': stamp, 'entries': self.entries, 'journal': self.journal}, f)
+            os.replace(tmp_name, self.snapshot)
+        except (IOError, OSError):
+            pass
+
+    def load_index(self):
+        stamp = self.stamp() if self.snapshot is not None else None
+        if stamp is not None and self.load_snapshot(stamp):
+            return self.entries
+
+        self.set_entries(read_json(self.index_path()) if os.path.isfile(self.index_path()) else [])
+        self.pending = []
+        self.journal = 0
+
+        if os.path.isfile(self.journal_path()):
+            with open(self.journal_path(), 'r') as f:
+                for line in f:
+                    try:
+                        change = json.loads(line)
+                    except ValueError:
+                        # Last line cut by a crash
+                        break
+                    self.apply_change(change)
+                    self.journal += 1
+
+        if stamp is not None:
+            self.write_snapshot(stamp)
+        return self.entries
+
+    def write_index(self, compact=False):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        if compact or self.journal + len(self.pending) > max(64, len(self.entries) // 4):
+            write_json(self.index_path(), self.entries)
+            if os.path.isfile(self.journal_path()):
+                os.remove(self.journal_path())
+            self.journal = 0
+        elif len(self.pending) > 0:
+            with open(self.journal_path(), 'a') as f:
+                f.write("".join(json.dumps(change) + "\n" for change in self.pending))
+                f.flush()
+                os.fsync(f.fileno())
+            self.journal += len(self.pending)
+        self.pending = []
+
+    def stamp(self):
+        # Changes when the index or its journal is written
+        out = []
+        for filename in (self.index_path(), self.journal_path()):
+            try:
+                stat = os.stat(filename)
+                out.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                out.append(None)
+        return tuple(out)
+
+    def names(self):
+        return [e["name"] for e in self.entries]
+
+    def entry(self, name):
+        i = self.index.get(name)
+        return self.entries[i] if i is not None else None
+
+    def load(self, name):
+        entry = self.entry(name)
+        if entry is None:
+            raise KeyError("FlexRig : profile " + name + " not found in " + self.path)
+        return read_json(os.path.join(self.path, entry["file"]))
+
+    def put(self, profile, old_name=None):
+        # Write one profile, old_name is its name in the library before a rename
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        if old_name is not None and old_name != profile["name"] and old_name in self.index:
+            self.remove(old_name)
+
+        entry = index_entry(profile)
+        current = self.entry(profile["name"])
+        if current is not None and current["hash"] == entry["hash"]:
+            return False
+
+        write_json(os.path.join(self.path, entry["file"]), profile)
+        self.apply_change(entry)
+        self.pending.append(entry)
+        return True
+
+    def remove(self, name):
+        entry = self.entry(name)
+        if entry is None:
+            return False
+
+        filename = os.path.join(self.path, entry["file"])
+        if os.path.isfile(filename):
+            os.remove(filename)
+        change = {'name': name, 'removed': True}
+        self.apply_change(change)
+        self.pending.append(change)
+        return True
+
+    def save(self, profiles, old_names=None):
+        # Library content becomes profiles, only changed profile files are written
+        old_names = old_names or {}
+        kept = set(p["name"] for p in profiles) | set(n for n in old_names.values() if n is not None)
+        for name in [n for n in self.names() if n not in kept]:
+            self.remove(name)
+
+        written = 0
+        for profile in profiles:
+            if self.put(profile, old_names.get(profile["name"])):
+                written += 1
+
+        # Library order follows profiles
+        order = {p["name"]: i for i, p in enumerate(profiles)}
+        self.set_entries(sorted(self.entries, key=lambda e: order.get(e["name"], len(order))))
+        self.write_index(compact=True)
+        return written
+
+    def export_profiles(self):
+        return [self.load(name) for name in self.names()]
+
+    def import_json(self, filename):
+        # Profiles of a flexrig_profiles.json list file
+        return self.save(read_json(filename))
+
+    def merge_json(self, filename):
+        # Profiles of a flexrig_profiles.json list file added to the library, replacing those
+        # with the same name and leaving the others
+        written = 0
+        for profile in read_json(filename):
+            if self.put(profile):
+                written += 1
+        self.write_index(compact=True)
+        return written
+
+    def export_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.export_profiles(), f)
+
+# Changes ---------------------------------------
+#
+# Profiles changed since the last save : {'removed': library names deleted on purpose,
+# 'profiles': [(profile, old name)]}. Profiles not named there are left as they are, the
+# library may hold profiles the scene never listed (added meanwhile by someone else).
+
+def merge_changes(older, newer):
+    if older is None or newer is None:
+        return newer if older is None else older
+
+    # A profile deleted since it was last changed is not written, the name it had is removed
+    removed = set(older["removed"]) | set(newer["removed"])
+    profiles = {}
+    for p, old_name in older["profiles"]:
+        if p["name"] in newer["removed"]:
+            if old_name not in (None, p["name"]):
+                removed.add(old_name)
+        else:
+            profiles[p["name"]] = (p, old_name)
+
+    # Same profile in both, the newer one wins but keeps the name it had in the library
+    for p, old_name in newer["profiles"]:
+        if p["name"] in profiles and old_name in (None, p["name"]):
+            old_name = profiles[p["name"]][1]
+        profiles[p["name"]] = (p, old_name)
+
+    return {'removed': removed, 'profiles': list(profiles.values())}
+
+def write_changes(library, changes):
+    library.load_index()
+
+    # A name deleted then given to another profile is overwritten instead
+    written = set(p["name"] for p, old_name in changes["profiles"])
+    for name in changes["removed"]:
+        if name not in written:
+            library.remove(name)
+
+    for profile, old_name in changes["profiles"]:
+        library.put(profile, old_name)
+
+    library.write_index()
+
+def written_hashes(library, changes):
+    # Library hash of each profile of changes once written
+    return {p["name"]: library.entry(p["name"])["hash"] for p, old_name in changes["profiles"] if library.entry(p["name"]) is not None}
+
+class BackgroundWriter:
+    # At most one write in flight, changes submitted meanwhile are merged and written next.
+    # Outcome is collected from the main thread with take_results() : hashes of the written
+    # profiles, and the changes of a failed write (no longer retried by the writer).
+    def __init__(self, path=DEFAULT_PATH):
+        self.library = ProfileLibrary(path)
+        self.lock = threading.Lock()
+        self.pending = None
+        self.failed = None
+        self.written = {}
+        self.thread = None
+        self.error = None
+
+    def submit(self, changes):
+        with self.lock:
+            self.pending = merge_changes(merge_changes(self.failed, self.pending), changes)
+            self.failed = None
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="FlexrigAutosave")
+                self.thread.daemon = True
+                self.thread.start()
+
+    def run(self):
+        while True:
+            with self.lock:
+                changes = self.pending
+                self.pending = None
+                if changes is None:
+                    self.thread = None
+                    return
+
+            try:
+                write_changes(self.library, changes)
+                self.error = None
+                with self.lock:
+                    self.written.update(written_hashes(self.library, changes))
+            except (IOError, OSError) as e:
+                # Handed back by take_results(), or written with the next changes
+                self.error = e
+                print("FlexRig : autosave failed in " + self.library.path + " : " + str(e))
+                with self.lock:
+                    if self.pending is None:
+                        self.failed = changes
+                    else:
+                        self.pending = merge_changes(changes, self.pending)
+
+    def busy(self):
+        return self.thread is not None
+
+    def take_results(self):
+        with self.lock:
+            written, failed = self.written, self.failed
+            self.written = {}
+            self.failed = None
+        return written, failed
+
+    def wait(self):
+        thread = self.thread
+        while thread is not None:
+            thread.join()
+            thread = self.thread
+
+def open_library(path=DEFAULT_PATH, legacy=LEGACY_FILE, snapshot=None):
+    library = ProfileLibrary(path, snapshot)
+    library.load_index()
+    if os.path.isfile(legacy):
+        # Former single file library, merged into the shipped one then renamed so it is only
+        # imported once
+        library.merge_json(legacy)
+        try:
+            os.replace(legacy, legacy + ".migrated")
+        except OSError:
+            pass
+    return library
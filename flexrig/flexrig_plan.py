@@ -0,0 +1,503 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Rig plan : flat bone table computed from a profile without Blender.
+# Only standard library (and optionally NumPy) here, this module must stay importable outside of bpy.
+
+import hashlib
+import json
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Utils -----------------------------------------
+
+def to_vector(v):
+    return (float(v[0]), float(v[1]), float(v[2]))
+
+def is_null_vector(v):
+    return v[0] == 0.0 and v[1] == 0.0 and v[2] == 0.0
+
+def get_value(data, key):
+    # Profile can be a JSON dict or a FlexrigProfileProperty
+    if isinstance(data, dict):
+        return data[key]
+    return getattr(data, key)
+
+def rename_members(members, rename):
+    # Copy of RigPlan.members with every bone name passed through rename
+    if isinstance(members, dict):
+        return {key: rename_members(value, rename) for key, value in members.items()}
+    if isinstance(members, list):
+        return [rename_members(value, rename) for value in members]
+    return rename(members)
+
+# Pole angle ------------------------------------
+
+# Same thresholds as Blender vec_roll_to_mat3_normalized()
+SAFE_THRESHOLD = 6.1e-3
+CRITICAL_THRESHOLD = 2.5e-4
+EPSILON = 1e-12
+
+def sub(a, b):
+    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+
+def dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+def cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0])
+
+def bone_x_axis(head, tail, roll=0.0):
+    # X axis of an edit bone matrix, as computed by Blender from head, tail and roll
+    d = sub(tail, head)
+    length = math.sqrt(dot(d, d))
+    if length < EPSILON:
+        return (1.0, 0.0, 0.0)
+    x, y, z = d[0] / length, d[1] / length, d[2] / length
+
+    theta = 1.0 + y
+    theta_alt = x * x + z * z
+    if theta > SAFE_THRESHOLD or theta_alt > CRITICAL_THRESHOLD * CRITICAL_THRESHOLD:
+        if theta <= SAFE_THRESHOLD:
+            theta = theta_alt * 0.5 + theta_alt * theta_alt * 0.125
+        axis = (1.0 - x * x / theta, -x, -x * z / theta)
+    else:
+        axis = (-1.0, 0.0, 0.0)
+
+    if roll == 0.0:
+        return axis
+
+    # Rotate around bone direction, axis is already perpendicular to it
+    c = math.cos(roll)
+    s = math.sin(roll)
+    n_axis = cross((x, y, z), axis)
+    return (axis[0] * c + n_axis[0] * s, axis[1] * c + n_axis[1] * s, axis[2] * c + n_axis[2] * s)
+
+def pole_angle(base_head, base_tail, base_x_axis, target_tail, pole_head):
+    # Calculate pole angle (Jerryno way)
+    # see : http://blender.stackexchange.com/questions/19754/how-to-set-calculate-pole-angle-of-ik-constraint-so-the-chain-does-not-move
+    direction = sub(base_tail, base_head)
+    if dot(direction, direction) < EPSILON:
+        return 0.0
+
+    pole = sub(pole_head, base_head)
+    projected_pole_axis = cross(cross(sub(target_tail, base_head), pole), direction)
+
+    # Collinear chain : fall back on the pole direction projected on the base bone normal plane
+    if dot(projected_pole_axis, projected_pole_axis) < EPSILON:
+        factor = dot(pole, direction) / dot(direction, direction)
+        projected_pole_axis = sub(pole, (direction[0] * factor, direction[1] * factor, direction[2] * factor))
+        if dot(projected_pole_axis, projected_pole_axis) < EPSILON:
+            return 0.0
+
+    # Signed angle around the bone, sign is positive when x.cross(pole) points against the bone
+    length = math.sqrt(dot(direction, direction))
+    sin_angle = -dot(cross(base_x_axis, projected_pole_axis), direction) / length
+    return math.atan2(sin_angle + 0.0, dot(base_x_axis, projected_pole_axis))
+
+def solve_pole_angles(base_heads, base_tails, base_x_axes, target_tails, pole_heads):
+    # Pole angles of every IK chain at once, same result as pole_angle() on each chain
+    if numpy is None:
+        return [pole_angle(*chain) for chain in zip(base_heads, base_tails, base_x_axes, target_tails, pole_heads)]
+    if len(base_heads) == 0:
+        return []
+
+    base_heads = numpy.asarray(base_heads, dtype=numpy.float64)
+    direction = numpy.asarray(base_tails, dtype=numpy.float64) - base_heads
+    x_axes = numpy.asarray(base_x_axes, dtype=numpy.float64)
+    pole = numpy.asarray(pole_heads, dtype=numpy.float64) - base_heads
+    target = numpy.asarray(target_tails, dtype=numpy.float64) - base_heads
+
+    dir_sq = numpy.einsum('ij,ij->i', direction, direction)
+    valid = dir_sq >= EPSILON
+    safe_dir_sq = numpy.where(valid, dir_sq, 1.0)
+
+    projected = numpy.cross(numpy.cross(target, pole), direction)
+
+    # Collinear chains
+    collinear = numpy.einsum('ij,ij->i', projected, projected) < EPSILON
+    factor = numpy.einsum('ij,ij->i', pole, direction) / safe_dir_sq
+    fallback = pole - direction * factor[:, None]
+    projected = numpy.where(collinear[:, None], fallback, projected)
+    valid &= numpy.einsum('ij,ij->i', projected, projected) >= EPSILON
+
+    sin_angle = -numpy.einsum('ij,ij->i', numpy.cross(x_axes, projected), direction) / numpy.sqrt(safe_dir_sq)
+    angles = numpy.arctan2(sin_angle + 0.0, numpy.einsum('ij,ij->i', x_axes, projected))
+    return numpy.where(valid, angles, 0.0).tolist()
+
+# Plan ------------------------------------------
+
+class RigPlan:
+
+    def __init__(self, amt_name):
+        self.amt_name = amt_name
+
+        # Bone table, one entry per bone
+        self.names = []
+        self.heads = []
+        self.tails = []
+        self.rolls = []
+        self.parents = []
+        self.connects = []
+        self.deforms = []
+
+        # IK table : [bone, base, target, pole_target, chain_len, pole_angle]
+        self.iks = []
+
+        self.index = {}
+        self.members = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __eq__(self, other):
+        return isinstance(other, RigPlan) and self.to_dict() == other.to_dict()
+
+    def add_bone(self, name, head, tail, parent=-1, connect=None, deform=True):
+        if connect is None:
+            connect = parent >= 0
+
+        self.index[name] = len(self.names)
+        self.names.append(name)
+        self.heads.append(to_vector(head))
+        self.tails.append(to_vector(tail))
+        self.rolls.append(0.0)
+        self.parents.append(parent)
+        self.connects.append(connect)
+        self.deforms.append(deform)
+
+        return len(self.names) - 1
+
+    def set_parent(self, bone, parent, connect=False):
+        self.parents[bone] = parent
+        self.connects[bone] = connect
+
+    def add_ik(self, bone, base, target, pole_target, chain_len):
+        self.iks.append([bone, base, target, pole_target, chain_len, None])
+
+    def solve_ik(self, start=0):
+        # Fill pole angles of IK chains from start, in one vectorized call
+        iks = self.iks[start:]
+        angles = solve_pole_angles(
+            [self.heads[ik[1]] for ik in iks],
+            [self.tails[ik[1]] for ik in iks],
+            [bone_x_axis(self.heads[ik[1]], self.tails[ik[1]], self.rolls[ik[1]]) for ik in iks],
+            [self.tails[ik[2]] for ik in iks],
+            [self.heads[ik[3]] for ik in iks])
+
+        for ik, angle in zip(iks, angles):
+            ik[5] = angle
+
+    def find(self, name):
+        return self.index.get(name, -1)
+
+    # Members -----------------------------------
+
+    def add_chest(self, stomach_loc, chest_loc, neck_loc):
+        self.members["body"] = {}
+
+        i_rib = self.add_bone(self.amt_name + ".rib", stomach_loc, chest_loc)
+        self.members["body"]["rib"] = self.names[i_rib]
+
+        i_chest = self.add_bone(self.amt_name + ".chest", chest_loc, neck_loc, i_rib)
+        self.members["body"]["chest"] = self.names[i_chest]
+
+    def add_head(self, suffix, neck_loc, head_loc):
+        if 'heads' not in self.members:
+            self.members["heads"] = []
+
+        head_data = {}
+        base_name = self.amt_name + ".head." + str(len(self.members["heads"]))
+
+        # Neck
+        i_chest = self.index[self.members["body"]["chest"]]
+        i_neck = self.add_bone(base_name + ".neck." + suffix, self.tails[i_chest], neck_loc, i_chest)
+        head_data["neck"] = self.names[i_neck]
+
+        # Head
+        i_head = self.add_bone(base_name + ".head." + suffix, self.tails[i_neck], head_loc, i_neck)
+        head_data["head"] = self.names[i_head]
+
+        self.members["heads"].append(head_data)
+
+    def add_arm(self, suffix, uarm_loc, larm_loc, wrist_loc, shoulder=False, ik=False, hand_loc=None, thumb_loc=None):
+        if 'arms' not in self.members:
+            self.members["arms"] = []
+
+        arm_data = {}
+        base_name = self.amt_name + ".arm." + str(len(self.members["arms"]))
+
+        # Shoulder
+        i_shoulder = -1
+        if shoulder:
+            i_rib = self.index[self.members["body"]["rib"]]
+            i_shoulder = self.add_bone(base_name + ".shoulder." + suffix, self.tails[i_rib], uarm_loc, i_rib)
+            arm_data["shoulder"] = self.names[i_shoulder]
+
+        # Upper arm
+        i_upper = self.add_bone(base_name + ".upper_arm." + suffix, uarm_loc, larm_loc, i_shoulder)
+        arm_data["upper_arm"] = self.names[i_upper]
+
+        # Lower arm
+        i_lower = self.add_bone(base_name + ".lower_arm." + suffix, larm_loc, wrist_loc, i_upper)
+        arm_data["lower_arm"] = self.names[i_lower]
+
+        # Hand & Thumb
+        if hand_loc is not None:
+            i_hand = self.add_bone(base_name + ".hand." + suffix, wrist_loc, hand_loc, i_lower)
+            arm_data["hand"] = self.names[i_hand]
+        if thumb_loc is not None:
+            i_thumb = self.add_bone(base_name + ".thumb." + suffix, wrist_loc, thumb_loc, i_lower)
+            arm_data["thumb"] = self.names[i_thumb]
+
+        # IK
+        if ik:
+            # Elbow
+            i_elbow = self.add_bone(base_name + ".elbow." + suffix, [larm_loc[0], larm_loc[1] - 1.5, larm_loc[2] - 0.2], [larm_loc[0], larm_loc[1] - 1.5, larm_loc[2] + 0.2], deform=False)
+            arm_data["elbow"] = self.names[i_elbow]
+
+            # Constraint
+            i_ik = self.add_bone(base_name + ".ik." + suffix, wrist_loc, [wrist_loc[0], wrist_loc[1] + 0.5, wrist_loc[2]], deform=False)
+            arm_data["ik"] = self.names[i_ik]
+
+            if hand_loc is not None:
+                self.set_parent(i_hand, i_ik)
+            if thumb_loc is not None:
+                self.set_parent(i_thumb, i_ik)
+
+            self.add_ik(i_lower, i_upper, i_ik, i_elbow, 2)
+
+        self.members["arms"].append(arm_data)
+
+    def add_leg(self, suffix, uleg_loc, lleg_loc, heel_loc, foot_loc, hip=False, ik=False):
+        if 'legs' not in self.members:
+            self.members["legs"] = []
+
+        leg_data = {}
+        base_name = self.amt_name + ".leg." + str(len(self.members["legs"]))
+
+        # Hip
+        i_hip = -1
+        if hip:
+            i_rib = self.index[self.members["body"]["rib"]]
+            i_hip = self.add_bone(base_name + ".hip." + suffix, self.heads[i_rib], uleg_loc, i_rib, connect=False)
+            leg_data["hip"] = self.names[i_hip]
+
+        # Upper leg
+        i_upper = self.add_bone(base_name + ".upper_leg." + suffix, uleg_loc, lleg_loc, i_hip)
+        leg_data["upper_leg"] = self.names[i_upper]
+
+        # Lower leg
+        i_lower = self.add_bone(base_name + ".lower_leg." + suffix, lleg_loc, heel_loc, i_upper)
+        leg_data["lower_leg"] = self.names[i_lower]
+
+        # Foot
+        i_foot = self.add_bone(base_name + ".foot." + suffix, heel_loc, foot_loc, i_lower)
+        leg_data["foot"] = self.names[i_foot]
+
+        if ik:
+            # Knee
+            i_knee = self.add_bone(base_name + ".knee." + suffix, [lleg_loc[0], lleg_loc[1] - 1.5, lleg_loc[2] - 0.2], [lleg_loc[0], lleg_loc[1] - 1.5, lleg_loc[2] + 0.2], deform=False)
+            leg_data["knee"] = self.names[i_knee]
+
+            # Constraint
+            i_ik = self.add_bone(base_name + ".ik." + suffix, heel_loc, [heel_loc[0], heel_loc[1] + 0.5, heel_loc[2]], deform=False)
+            leg_data["ik"] = self.names[i_ik]
+
+            self.set_parent(i_foot, i_ik)
+
+            self.add_ik(i_lower, i_upper, i_ik, i_knee, 2)
+
+        self.members["legs"].append(leg_data)
+
+    def add_ik_controller(self, g_control=False):
+        i_rib = self.index[self.members["body"]["rib"]]
+
+        if "arms" in self.members:
+            for a in self.members["arms"]:
+                if 'shoulder' not in a:
+                    self.set_parent(self.index[a["upper_arm"]], i_rib)
+
+        if "legs" in self.members:
+            for a in self.members["legs"]:
+                if 'hip' not in a:
+                    self.set_parent(self.index[a["upper_leg"]], i_rib)
+
+        # Create global controller
+        if g_control:
+            i_control = self.add_bone(self.amt_name + ".control", [0,0,0], [0,-2.0,0])
+            self.set_parent(i_rib, i_control)
+
+            for member_type, pole in (("arms", "elbow"), ("legs", "knee")):
+                if member_type in self.members:
+                    for a in self.members[member_type]:
+                        if "ik" in a:
+                            self.set_parent(self.index[a["ik"]], i_control)
+                            self.set_parent(self.index[a[pole]], i_control)
+
+    # Import / Export ---------------------------
+
+    @classmethod
+    def from_profile(cls, profile, amt_name):
+        plan = cls(amt_name)
+        plan.add_chest(get_value(profile, "rib"), get_value(profile, "chest"), get_value(profile, "tchest"))
+
+        for head in get_value(profile, "heads"):
+            plan.add_head(get_value(head, "suffix"), get_value(head, "neck"), get_value(head, "head"))
+
+        for arm in get_value(profile, "arms"):
+            hand = get_value(arm, "hand")
+            thumb = get_value(arm, "thumb")
+            hand = hand if not is_null_vector(hand) else None
+            thumb = thumb if hand is not None and not is_null_vector(thumb) else None
+            plan.add_arm(get_value(arm, "suffix"), get_value(arm, "upper"), get_value(arm, "lower"), get_value(arm, "wrist"),
+                get_value(arm, "shoulder"), get_value(arm, "ik"), hand, thumb)
+
+        for leg in get_value(profile, "legs"):
+            plan.add_leg(get_value(leg, "suffix"), get_value(leg, "upper"), get_value(leg, "lower"), get_value(leg, "knee"), get_value(leg, "foot"),
+                get_value(leg, "hip"), get_value(leg, "ik"))
+
+        plan.add_ik_controller(get_value(profile, "control"))
+        return plan
+
+    def bone_table(self):
+        return [(self.names[i], self.heads[i], self.tails[i], self.rolls[i], self.parents[i], self.connects[i], self.deforms[i]) for i in range(len(self.names))]
+
+    def to_dict(self):
+        return {
+            'amt_name': self.amt_name,
+            'names': list(self.names),
+            'heads': [list(v) for v in self.heads],
+            'tails': [list(v) for v in self.tails],
+            'rolls': list(self.rolls),
+            'parents': list(self.parents),
+            'connects': list(self.connects),
+            'deforms': list(self.deforms),
+            'iks': [list(ik) for ik in self.iks],
+            'members': self.members,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        plan = cls(data["amt_name"])
+        plan.names = list(data["names"])
+        plan.heads = [to_vector(v) for v in data["heads"]]
+        plan.tails = [to_vector(v) for v in data["tails"]]
+        plan.rolls = [float(r) for r in data["rolls"]]
+        plan.parents = list(data["parents"])
+        plan.connects = list(data["connects"])
+        plan.deforms = list(data["deforms"])
+        plan.iks = [list(ik) for ik in data["iks"]]
+        plan.members = json.loads(json.dumps(data["members"]))
+        plan.index = {name: i for i, name in enumerate(plan.names)}
+        return plan
+
+    def renamed(self, amt_name):
+        # Copy of the plan for an armature named amt_name, bone names keep what follows the armature name
+        prefix = len(self.amt_name)
+        return self.with_names(lambda name: amt_name + name[prefix:], amt_name)
+
+    def with_names(self, rename, amt_name=None):
+        # Copy of the plan with every bone name passed through rename
+        data = self.to_dict()
+        data["amt_name"] = amt_name if amt_name is not None else self.amt_name
+        data["names"] = [rename(n) for n in self.names]
+        data["members"] = rename_members(self.members, rename)
+        return RigPlan.from_dict(data)
+
+    def ik_table(self):
+        # IK chains by constrained bone name
+        return {self.names[ik[0]]: (self.names[ik[1]], self.names[ik[2]], self.names[ik[3]], ik[4], ik[5]) for ik in self.iks}
+
+    def limb_suffix(self, kind, i):
+        # Suffix of the i-th head, arm or leg, bones are named <amt>.<kind>.<i>.<role>.<suffix>
+        limb = self.members[kind][i]
+        role = sorted(limb.keys())[0]
+        prefix = "%s.%s.%d.%s." % (self.amt_name, kind[:-1], i, role)
+        return limb[role][len(prefix):] if limb[role].startswith(prefix) else limb[role]
+
+    def limb_renames(self, other):
+        # Limb bones are named by position, removing a limb shifts the names of the next ones.
+        # Returns (old, new) names of the bones of this plan for limbs matched by suffix with other,
+        # bones without a match get a name other doesn't use so diff() removes them. Empty when
+        # no matched bone changes name
+        renames = []
+        moved = False
+        for kind in ("heads", "arms", "legs"):
+            limbs = self.members.get(kind, [])
+            others = other.members.get(kind, [])
+            free = list(range(len(others)))
+            other_suffixes = [other.limb_suffix(kind, j) for j in free]
+
+            for i, limb in enumerate(limbs):
+                suffix = self.limb_suffix(kind, i)
+                candidates = [j for j in free if other_suffixes[j] == suffix]
+                j = (i if i in candidates else candidates[0]) if len(candidates) > 0 else None
+                if j is not None:
+                    free.remove(j)
+
+                for role, name in sorted(limb.items()):
+                    new = others[j].get(role) if j is not None else None
+                    if new is None:
+                        new = "~" + name
+                    moved = moved or (new != name and not new.startswith("~"))
+                    renames.append((name, new))
+
+        return [(old, new) for old, new in renames if old != new] if moved else []
+
+    def diff(self, other, tolerance=1e-6):
+        # What changes when going from this plan to other, by bone name
+        out = {'removed': [], 'added': [], 'moved': [], 'reparented': [], 'deform': [], 'ik_removed': [], 'ik_added': []}
+
+        for name in self.names:
+            if name not in other.index:
+                out['removed'].append(name)
+
+        parent_name = lambda plan, i: plan.names[plan.parents[i]] if plan.parents[i] >= 0 else None
+        close = lambda a, b: all(abs(x - y) <= tolerance for x, y in zip(a, b))
+
+        for i, name in enumerate(other.names):
+            j = self.index.get(name)
+            if j is None:
+                out['added'].append(name)
+                continue
+            if not close(self.heads[j], other.heads[i]) or not close(self.tails[j], other.tails[i]) or abs(self.rolls[j] - other.rolls[i]) > tolerance:
+                out['moved'].append(name)
+            if parent_name(self, j) != parent_name(other, i) or self.connects[j] != other.connects[i]:
+                out['reparented'].append(name)
+            if self.deforms[j] != other.deforms[i]:
+                out['deform'].append(name)
+
+        old_iks = self.ik_table()
+        new_iks = other.ik_table()
+        same_ik = lambda a, b: a[:4] == b[:4] and a[4] is not None and b[4] is not None and abs(a[4] - b[4]) <= tolerance
+        for name, ik in old_iks.items():
+            if name not in new_iks or not same_ik(ik, new_iks[name]):
+                out['ik_removed'].append(name)
+        for name, ik in new_iks.items():
+            if name not in old_iks or not same_ik(ik, old_iks[name]):
+                out['ik_added'].append(name)
+
+        return out
+
+    def digest(self):
+        return hashlib.sha1(json.dumps(self.to_dict(), sort_keys=True).encode('utf-8')).hexdigest()
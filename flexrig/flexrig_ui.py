@@ -18,21 +18,98 @@
 
 import bpy
 import mathutils
-from . import flexrig
-import json
-import os
+# flexrig and flexrig_plan (NumPy, the weight solvers) are imported by the operators using
+# them, not when the add-on is enabled
+from . import flexrig_cache
+from . import flexrig_library
+import time
+
+weight_cache = flexrig_cache.FlexrigCache()
 
 # Utils -----------------------------------------
 
-def set_flexrig_profile_list(data):
-    bpy.types.Scene.flexrig_active = bpy.props.EnumProperty(name="Profile", items=data)
+class FlexrigProfileRegistry:
+    # Profile name to index in scene.flexrig_profiles and the profile enum items, rebuilt
+    # after invalidate() or when the scene or the profile count changed
+    def __init__(self):
+        self.suspended = False
+        self.invalidate()
+
+    def invalidate(self):
+        self.index = None
+        self.items = []
+        self.scene = 0
+        self.count = 0
+
+    @staticmethod
+    def enum_item(name):
+        return (name, name, "Select " + name + " profile")
+
+    def rebuild(self, scene):
+        self.index = {p.name: i for i, p in enumerate(scene.flexrig_profiles)}
+        self.items = [self.enum_item(p.name) for p in scene.flexrig_profiles]
+        self.scene = scene.as_pointer()
+        self.count = len(scene.flexrig_profiles)
+
+    def is_valid(self, scene):
+        return self.index is not None and self.scene == scene.as_pointer() and self.count == len(scene.flexrig_profiles)
+
+    def append(self, scene, name):
+        # Called before a profile is added at the end of the collection
+        if self.is_valid(scene):
+            self.index[name] = self.count
+            self.items.append(self.enum_item(name))
+            self.count += 1
+        else:
+            self.invalidate()
+
+    def rename(self, scene, i, name):
+        if self.is_valid(scene) and i < self.count:
+            old_name = self.items[i][0]
+            if self.index.get(old_name) == i:
+                del self.index[old_name]
+            self.index[name] = i
+            self.items[i] = self.enum_item(name)
+        else:
+            self.invalidate()
+
+    def enum_items(self, scene):
+        if not self.is_valid(scene):
+            self.rebuild(scene)
+        return self.items
+
+    def find_index(self, scene, name):
+        if not self.is_valid(scene):
+            self.rebuild(scene)
+
+        # An entry is checked before use, a stale map is rebuilt once
+        i = self.index.get(name)
+        if i is None or i >= self.count or scene.flexrig_profiles[i].name != name:
+            self.rebuild(scene)
+            i = self.index.get(name)
+        return i
+
+    def find(self, scene, name):
+        i = self.find_index(scene, name)
+        return scene.flexrig_profiles[i] if i is not None else None
+
+profile_registry = FlexrigProfileRegistry()
+
+def flexrig_profile_items(self, context):
+    # Blender keeps no reference on dynamic enum strings, the registry does
+    return profile_registry.enum_items(context.scene)
     
-def find_flexrig_active_profile(scene):
-    profile_name = scene.flexrig_active
-    for p in scene.flexrig_profiles:
-        if p.name == profile_name:
-            return p
-    return None
+def find_flexrig_active_profile(scene, loaded=True):
+    # Profiles not loaded from the library yet only hold their name
+    profile = profile_registry.find(scene, scene.flexrig_active)
+    if profile is not None and loaded and not profile.loaded:
+        return None
+    return profile
+
+def on_profile_select(self, context):
+    profile = find_flexrig_active_profile(context.scene, loaded=False)
+    if profile is not None and not profile.loaded:
+        FlexrigProfileIE().load_profile(profile)
 
 def add_set_position_operator(row, mtype, mprop, mid = 0):
     cursor = row.operator("flexrig.set_position", icon="CURSOR", text="")
@@ -60,143 +137,493 @@ def add_copy_member_operator(row, mtype, mid = 0):
     op.member_id = mid
     op.member_type = mtype
 
+def profile_owner(prop):
+    # prop is flexrig_profiles[i] or one of its members flexrig_profiles[i].arms[j]
+    path = prop.path_from_id()
+    return int(path[path.index("[") + 1:path.index("]")])
+
+def add_timer(func, first_interval):
+    # func returns its next interval in seconds, or None to stop. Timers are persistent : a
+    # file load would drop them while their owner still thinks they are running.
+    if hasattr(bpy.app, "timers"):
+        bpy.app.timers.register(func, first_interval=first_interval, persistent=True)
+        return
+
+    # Blender 2.7x has no application timers, scene updates drive them
+    due = [time.time() + first_interval]
+
+    @bpy.app.handlers.persistent
+    def on_scene_update(scene):
+        if time.time() < due[0]:
+            return
+        interval = func()
+        if interval is None:
+            bpy.app.handlers.scene_update_post.remove(on_scene_update)
+        else:
+            due[0] = time.time() + interval
+
+    bpy.app.handlers.scene_update_post.append(on_scene_update)
+
+def mark_profile_dirty(scene, profile):
+    # Only changed profiles are written by the next save
+    if profile is not None:
+        profile.dirty = True
+    if scene.flexrig_autosave:
+        profile_autosave.touch()
+
 def on_profile_name_change(self, context):
-    enum_data = []
-    for d in context.scene.flexrig_profiles:
-        enum_data.append((d["name"], d["name"], "Select " + d["name"] + "profile"))
-        set_flexrig_profile_list(enum_data)
+    if profile_registry.suspended:
+        return
+
+    mark_profile_dirty(self.id_data, self)
+    profile_registry.rename(context.scene, profile_owner(self), self.name)
     context.scene.flexrig_active = self.name
 
-# JSON Loader -----------------------------------
+def on_profile_edit(self, context):
+    if profile_registry.suspended:
+        return
+
+    mark_profile_dirty(self.id_data, self.id_data.flexrig_profiles[profile_owner(self)])
+
+class FlexrigModalJob:
+    # Operator mixin running a generator of progress (0 to 1) from a window manager timer.
+    # Steps run until the time budget of a timer event is spent so the UI keeps redrawing,
+    # Esc closes the generator and calls rollback().
+    budget = 0.02
+
+    def start(self, context, steps):
+        self.steps = steps
+        self.progress = 0.0
+        self.step_time = 0.0
+        self.t_start = time.perf_counter()
+
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(0.01, window=context.window)
+        wm.modal_handler_add(self)
+        wm.progress_begin(0, 100)
+        return {'RUNNING_MODAL'}
+
+    def stop(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self.stop(context)
+            self.steps.close()
+            self.rollback(context)
+            self.report({'WARNING'}, "FlexRig : cancelled")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        # A step is only started if it should end within the budget, at least one per event
+        t_end = time.perf_counter() + self.budget
+        try:
+            while True:
+                t_step = time.perf_counter()
+                self.progress = next(self.steps)
+                self.step_time = time.perf_counter() - t_step
+                if time.perf_counter() + self.step_time > t_end:
+                    break
+        except StopIteration:
+            self.stop(context)
+            self.finish(context, time.perf_counter() - self.t_start)
+            return {'FINISHED'}
+        except Exception as e:
+            # The generator already cleaned up its own state when it raised
+            self.stop(context)
+            self.rollback(context)
+            self.report({'ERROR'}, "FlexRig : " + str(e))
+            return {'CANCELLED'}
+
+        context.window_manager.progress_update(int(self.progress * 100))
+        return {'RUNNING_MODAL'}
+
+    def rollback(self, context):
+        pass
+
+    def finish(self, context, elapsed):
+        pass
+
+# Profile Loader --------------------------------
 
 class FlexrigProfileIE:
     def __init__(self):
-        script_path = bpy.utils.script_paths()
-        
-        for p in script_path:
-            if os.path.isdir(p + "/addons/flexrig"):
-                self.path = p + "/addons/flexrig/"
+        self.path = flexrig_library.ADDON_DIR + "/"
+        self.library = flexrig_library.ProfileLibrary(self.path + "profiles", flexrig_library.SNAPSHOT_FILE)
     
     def load(self, scene):
-        filename = "flexrig_profiles.json"
-
+        # Only profile names are read, a profile is loaded when selected
         work = False
         try:
-            raw_data = []
-
-            with open(self.path + filename, 'r') as f:
-                raw_data = json.load(f)
-            
-            self.to_blender(raw_data, scene)
+            self.library = flexrig_library.open_library(self.library.path, self.path + "flexrig_profiles.json", flexrig_library.SNAPSHOT_FILE)
+            self.to_blender(self.library.entries, scene)
+            if scene.flexrig_watch:
+                profile_watcher.start(self.library)
             work = True
-        except IOError:
-            print("FlexRig : Could not open setting file in " + self.path)
+        except (IOError, ValueError):
+            print("FlexRig : Could not open profile library in " + self.library.path)
 
         return work
 
+    def load_profile(self, profile):
+        self.library.load_index()
+        profile_registry.suspended = True
+        try:
+            self.set_profile(profile, self.library.load(profile.library_name))
+        finally:
+            profile_registry.suspended = False
+        profile.library_hash = self.library.entry(profile.library_name)["hash"]
+        profile.dirty = False
+
+    def reload_profile(self, profile):
+        # Members keep their expanded and symmetry state
+        ui_state = {kind: [(m.expand, tuple(m.mirror)) for m in getattr(profile, kind)] for kind in ("heads", "arms", "legs")}
+        self.load_profile(profile)
+        for kind, states in ui_state.items():
+            for member, (expand, mirror) in zip(getattr(profile, kind), states):
+                member.expand = expand
+                member.mirror = mirror
+
+    def reload_changed(self, scene):
+        # Only profiles whose content hash changed on disk are reloaded, a profile with
+        # unsaved edits is kept as it is
+        try:
+            self.library.load_index()
+        except (IOError, ValueError):
+            return 0
+
+        profiles = scene.flexrig_profiles
+        active_profile = scene.flexrig_active
+        known = {p.library_name: p for p in profiles if p.library_name != ""}
+        reloaded = 0
+
+        for entry in self.library.entries:
+            profile = known.get(entry["name"])
+            if profile is None or profile.library_hash == entry["hash"]:
+                continue
+            if profile.dirty:
+                print("FlexRig : " + profile.name + " changed on disk, keeping unsaved edits")
+            elif profile.loaded:
+                self.reload_profile(profile)
+                reloaded += 1
+            else:
+                profile.library_hash = entry["hash"]
+
+        # Profiles added or removed by someone else, the selection is kept
+        added = [e for e in self.library.entries if e["name"] not in known]
+        removed = [i for i, p in enumerate(profiles) if p.library_name != "" and p.library_name not in self.library.index and not p.dirty and p.name != active_profile]
+        if len(added) == 0 and len(removed) == 0:
+            return reloaded
+
+        profile_registry.suspended = True
+        try:
+            for i in reversed(removed):
+                profiles.remove(i)
+            for entry in added:
+                self.add_stub(profiles, entry)
+        finally:
+            profile_registry.suspended = False
+            profile_registry.invalidate()
+        self.forget_removed(scene, set(e["name"] for e in added))
+
+        scene.flexrig_active = active_profile
+        return reloaded + len(added)
+
+    @staticmethod
+    def add_stub(profiles, entry):
+        prop = profiles.add()
+        prop.name = entry["name"]
+        prop.library_name = entry["name"]
+        prop.library_hash = entry["hash"]
+        prop.loaded = False
+
+    @staticmethod
+    def forget_removed(scene, names):
+        # Profiles listed again are no longer deleted on the next save
+        removed = scene.flexrig_removed
+        for i in reversed(range(len(removed))):
+            if names is None or removed[i].name in names:
+                removed.remove(i)
+
+    @classmethod
+    def changes(cls, scene):
+        # Profiles changed or deleted since the last save. Edits made while they are written
+        # mark them dirty again, restore_changes() puts them back if the write fails.
+        changes = {'removed': set(r.name for r in scene.flexrig_removed), 'profiles': []}
+        scene.flexrig_removed.clear()
+        for profile in scene.flexrig_profiles:
+            if profile.dirty and profile.loaded:
+                changes["profiles"].append((cls.to_serializable(profile), profile.library_name or None))
+                profile.library_name = profile.name
+                profile.dirty = False
+        return changes
+
+    @staticmethod
+    def restore_changes(scene, changes):
+        # Changes of a failed write are pending again, for the next save
+        for data, old_name in changes["profiles"]:
+            profile = profile_registry.find(scene, data["name"])
+            if profile is not None:
+                profile.dirty = True
+                if profile.library_name == data["name"]:
+                    profile.library_name = old_name or ""
+        removed = set(r.name for r in scene.flexrig_removed)
+        for name in changes["removed"]:
+            if name not in removed:
+                scene.flexrig_removed.add().name = name
+
+    @staticmethod
+    def apply_written(scene, written):
+        # Library hashes of saved profiles, the watcher compares them with the index
+        for profile in scene.flexrig_profiles:
+            if profile.library_name in written:
+                profile.library_hash = written[profile.library_name]
+
     def save(self, scene):
-        filename = "flexrig_profiles.json"
-        bck_name = ".~" + filename
+        # Only profiles changed since the last save are written, then the index. A failed
+        # background write is written again with them.
+        failed = None
+        if profile_autosave.writer is not None:
+            profile_autosave.writer.wait()
+            written, failed = profile_autosave.writer.take_results()
+            self.apply_written(scene, written)
+        changes = flexrig_library.merge_changes(failed, self.changes(scene))
 
-        if os.path.isfile(self.path + filename):
-            os.rename(self.path + filename, self.path + bck_name)
-        
         work = False
         try:
-            if os.path.isfile(self.path + filename):
-                os.remove(self.path + filename)
-
-            with open(self.path + filename, 'w') as f:
-                f.write(json.dumps(self.to_serializable(scene)))
-            
-            os.remove(self.path + bck_name)
+            flexrig_library.write_changes(self.library, changes)
+            self.apply_written(scene, flexrig_library.written_hashes(self.library, changes))
             work = True
-        except IOError:
-            print("FlexRig : Could not save setting file in " + self.path)
-
-            if os.path.isfile(self.path + bck_name):
-                os.rename(self.path + bck_name, self.path + filename)
+        except (IOError, OSError):
+            print("FlexRig : Could not save profile library in " + self.library.path)
+            self.restore_changes(scene, changes)
 
         return work
 
-    def to_serializable(self, scene):
-        out_data = []
-
-        for profile in scene.flexrig_profiles:
-            out_profile = {}
-
-            out_profile["name"] = profile.name
-            out_profile["chest"] = profile.chest.to_tuple()
-            out_profile["rib"] = profile.rib.to_tuple()
-            out_profile["tchest"] = profile.tchest.to_tuple()
-            out_profile["control"] = profile.control
-
-            out_profile["heads"] = []
-            for h in profile.heads:
-                out_profile["heads"].append({'suffix':h.suffix, 'neck':h.neck.to_tuple(), 'head':h.head.to_tuple()})
-
-            out_profile["arms"] = []
-            for h in profile.arms:
-                out_profile["arms"].append({'suffix':h.suffix,
-                    'upper':h.upper.to_tuple(), 'lower':h.lower.to_tuple(), 'wrist':h.wrist.to_tuple(),
-                    'thumb':h.thumb.to_tuple(), 'hand':h.hand.to_tuple(), 'shoulder':h.shoulder, 'ik':h.ik
-                })
-
-            out_profile["legs"] = []
-            for h in profile.legs:
-                out_profile["legs"].append({'suffix':h.suffix,
-                    'upper':h.upper.to_tuple(), 'lower':h.lower.to_tuple(), 'knee':h.knee.to_tuple(), 
-                    'foot':h.foot.to_tuple(), 'hip':h.hip, 'ik':h.ik
-                })
-
-            out_data.append(out_profile)
-
-        return out_data
-
-    def to_blender(self, data, scene):
+    @staticmethod
+    def to_serializable(profile):
+        out_profile = {}
+
+        out_profile["name"] = profile.name
+        out_profile["chest"] = profile.chest.to_tuple()
+        out_profile["rib"] = profile.rib.to_tuple()
+        out_profile["tchest"] = profile.tchest.to_tuple()
+        out_profile["control"] = profile.control
+
+        out_profile["heads"] = []
+        for h in profile.heads:
+            out_profile["heads"].append({'suffix':h.suffix, 'neck':h.neck.to_tuple(), 'head':h.head.to_tuple()})
+
+        out_profile["arms"] = []
+        for h in profile.arms:
+            out_profile["arms"].append({'suffix':h.suffix,
+                'upper':h.upper.to_tuple(), 'lower':h.lower.to_tuple(), 'wrist':h.wrist.to_tuple(),
+                'thumb':h.thumb.to_tuple(), 'hand':h.hand.to_tuple(), 'shoulder':h.shoulder, 'ik':h.ik
+            })
+
+        out_profile["legs"] = []
+        for h in profile.legs:
+            out_profile["legs"].append({'suffix':h.suffix,
+                'upper':h.upper.to_tuple(), 'lower':h.lower.to_tuple(), 'knee':h.knee.to_tuple(), 
+                'foot':h.foot.to_tuple(), 'hip':h.hip, 'ik':h.ik
+            })
+
+        return out_profile
+
+    def to_blender(self, entries, scene):
         profiles = scene.flexrig_profiles
+        active_profile = scene.flexrig_active if len(profiles) > 0 else None
         profiles.clear()
+        profile_registry.invalidate()
+        profile_registry.suspended = True
+        # The list is the library again, nothing is pending deletion
+        self.forget_removed(scene, None)
+
+        try:
+            for entry in entries:
+                self.add_stub(profiles, entry)
+        finally:
+            profile_registry.suspended = False
+            profile_registry.invalidate()
+
+        # Keep the selected profile when it still exists, selecting it loads it
+        if len(profiles) > 0:
+            scene.flexrig_active = active_profile if profile_registry.find_index(scene, active_profile) is not None else profiles[0].name
+
+    @staticmethod
+    def set_profile(prop, d):
+        prop.control = d["control"]
+        prop.chest = d["chest"]
+        prop.tchest = d["tchest"]
+        prop.rib = d["rib"]
+
+        prop.heads.clear()
+        for head in d["heads"]:
+            h = prop.heads.add()
+            h.suffix = head["suffix"]
+            h.neck = mathutils.Vector(head["neck"])
+            h.head = mathutils.Vector(head["head"])
+
+        prop.arms.clear()
+        for arm in d["arms"]:
+            a = prop.arms.add()
+            a.suffix = arm["suffix"]
+            a.upper = mathutils.Vector(arm["upper"])
+            a.lower = mathutils.Vector(arm["lower"])
+            a.wrist = mathutils.Vector(arm["wrist"])
+            a.hand = mathutils.Vector(arm["hand"])
+            a.thumb = mathutils.Vector(arm["thumb"])
+            a.shoulder = arm["shoulder"]
+            a.ik = arm["ik"]
+
+        prop.legs.clear()
+        for leg in d["legs"]:
+            lg = prop.legs.add()
+            lg.suffix = leg["suffix"]
+            lg.upper = mathutils.Vector(leg["upper"])
+            lg.lower = mathutils.Vector(leg["lower"])
+            lg.knee = mathutils.Vector(leg["knee"])
+            lg.foot = mathutils.Vector(leg["foot"])
+            lg.hip = leg["hip"]
+            lg.ik = leg["ik"]
+
+        prop.loaded = True
+
+# Autosave --------------------------------------
+
+class FlexrigAutosave:
+    # Edits are collected once they stopped for delay seconds, then written by a worker thread
+    def __init__(self, delay=2.0, poll=0.5):
+        self.delay = delay
+        self.poll = poll
+        self.last_edit = 0.0
+        self.scheduled = False
+        self.polling = False
+        self.writer = None
+
+    def touch(self):
+        self.last_edit = time.time()
+        if not self.scheduled:
+            self.scheduled = True
+            add_timer(self.on_timer, self.delay)
+
+    def on_timer(self):
+        remaining = self.last_edit + self.delay - time.time()
+        if remaining > 0.0:
+            return remaining
+        self.flush(bpy.context.scene)
+        return None
+
+    def flush(self, scene):
+        self.scheduled = False
+        profileIE = FlexrigProfileIE()
+        if self.writer is None or self.writer.library.path != profileIE.library.path:
+            self.writer = flexrig_library.BackgroundWriter(profileIE.library.path)
+        self.writer.submit(profileIE.changes(scene))
+        if not self.polling:
+            self.polling = True
+            add_timer(self.on_written, self.poll)
+
+    def on_written(self):
+        # Profiles are only clean once written, a failed write makes them dirty again
+        if self.writer.busy():
+            return self.poll
+        self.polling = False
+
+        written, failed = self.writer.take_results()
+        FlexrigProfileIE.apply_written(bpy.context.scene, written)
+        if failed is not None:
+            FlexrigProfileIE.restore_changes(bpy.context.scene, failed)
+        return None
+
+profile_autosave = FlexrigAutosave()
+
+# Watcher ---------------------------------------
+
+class FlexrigWatcher:
+    # Polls the library index, profiles changed on disk by someone else are reloaded
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        self.running = False
+        self.library = None
+        self.stamp = None
+
+    def start(self, library):
+        self.library = library
+        self.stamp = library.stamp()
+        if not self.running:
+            self.running = True
+            add_timer(self.on_timer, self.interval)
+
+    def on_timer(self):
+        scene = bpy.context.scene
+        if scene is None or not scene.flexrig_watch:
+            self.running = False
+            return None
+
+        stamp = self.library.stamp()
+        if stamp != self.stamp:
+            self.stamp = stamp
+            FlexrigProfileIE().reload_changed(scene)
+        return self.interval
+
+profile_watcher = FlexrigWatcher()
+
+# Startup ---------------------------------------
+
+class FlexrigStartup:
+    # Profiles are read when a FlexRig panel is first drawn. A panel cannot change scene
+    # data while drawing so the load runs right after, from a timer.
+    def __init__(self):
+        self.scheduled = False
 
-        enum_data = []
-
-        for d in data:
-            prop = profiles.add()
-            prop.name = d["name"]
-            prop.control = d["control"]
-            prop.chest = d["chest"]
-            prop.tchest = d["tchest"]
-            prop.rib = d["rib"]
-
-            for head in d["heads"]:
-                h = prop.heads.add()
-                h.suffix = head["suffix"]
-                h.neck = mathutils.Vector(head["neck"])
-                h.head = mathutils.Vector(head["head"])
-
-            for arm in d["arms"]:
-                a = prop.arms.add()
-                a.suffix = arm["suffix"]
-                a.upper = mathutils.Vector(arm["upper"])
-                a.lower = mathutils.Vector(arm["lower"])
-                a.wrist = mathutils.Vector(arm["wrist"])
-                a.hand = mathutils.Vector(arm["hand"])
-                a.thumb = mathutils.Vector(arm["thumb"])
-                a.shoulder = arm["shoulder"]
-                a.ik = arm["ik"]
-
-            for leg in d["legs"]:
-                lg = prop.legs.add()
-                lg.suffix = leg["suffix"]
-                lg.upper = mathutils.Vector(leg["upper"])
-                lg.lower = mathutils.Vector(leg["lower"])
-                lg.knee = mathutils.Vector(leg["knee"])
-                lg.foot = mathutils.Vector(leg["foot"])
-                lg.hip = leg["hip"]
-                lg.ik = leg["ik"]
-
-            enum_data.append((d["name"], d["name"], "Select " + d["name"] + "profile"))
-
-        set_flexrig_profile_list(enum_data)
+    def request(self, scene):
+        if self.scheduled or len(scene.flexrig_profiles) > 0:
+            return
+        self.scheduled = True
+        add_timer(self.on_timer, 0.0)
+
+    def on_timer(self):
+        scene = bpy.context.scene
+        if scene is not None and len(scene.flexrig_profiles) == 0:
+            # If profile library isn't loaded create profile to not let empty enum
+            if FlexrigProfileIE().load(scene) is False or len(scene.flexrig_profiles) == 0:
+                profile_registry.append(scene, "")
+                scene.flexrig_profiles.add().name = "New.0"
+        self.scheduled = False
+        return None
+
+profile_startup = FlexrigStartup()
+
+def on_watch_change(self, context):
+    if self.flexrig_watch:
+        profile_watcher.start(FlexrigProfileIE().library)
+
+@bpy.app.handlers.persistent
+def on_file_load(dummy):
+    # A loaded scene already lists its profiles, so startup does not read the library. The
+    # library may have changed since the file was saved : the list is brought up to date and
+    # the watcher started for it.
+    scene = bpy.context.scene
+    if scene is None or len(scene.flexrig_profiles) == 0:
+        return
+
+    profileIE = FlexrigProfileIE()
+    profileIE.reload_changed(scene)
+    if scene.flexrig_watch:
+        profile_watcher.start(profileIE.library)
+
+def register_handlers():
+    if on_file_load not in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.append(on_file_load)
+
+def unregister_handlers():
+    if on_file_load in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(on_file_load)
 
 # Panels ----------------------------------------
 
@@ -210,7 +637,8 @@ class FlexrigPanel(bpy.types.Panel):
     def draw(self, context):
         scene = context.scene
         layout = self.layout
-        profile = find_flexrig_active_profile(scene)
+        profile = find_flexrig_active_profile(scene, loaded=False)
+        profile_startup.request(scene)
         
         row = layout.row(align=True)
         row.prop(scene, "flexrig_active")
@@ -218,11 +646,16 @@ class FlexrigPanel(bpy.types.Panel):
         row.operator("flexrig.add_profile", icon='ZOOMIN', text="")
         row.separator()
 
-        if profile is not None:
+        if profile is not None and not profile.loaded:
+            row = layout.row()
+            row.operator("flexrig.load_profile", icon="FILE_FOLDER", text="Load profile")
+        elif profile is not None:
             row = layout.row()
             row.prop(profile, "name", text="")
             row = layout.row()
             row.operator("flexrig.save_profile", icon="DISK_DRIVE", text="Save profile")
+            row.prop(scene, "flexrig_autosave")
+            row.prop(scene, "flexrig_watch")
 
         row = layout.row()
         row.operator("flexrig.reset_profile", icon="PARTICLES", text="Reset to default")
@@ -239,9 +672,24 @@ class FlexrigLinkPanel(bpy.types.Panel):
         layout = self.layout
         
         row = layout.row()
-        row.prop_search(scene.flexrig_link, "target_object", scene, "objects", icon='OBJECT_DATA', text="Object")
+        row.prop(scene.flexrig_link, "target_mode", expand=True)
+        row = layout.row()
+        if scene.flexrig_link.target_mode == 'OBJECT':
+            row.prop_search(scene.flexrig_link, "target_object", scene, "objects", icon='OBJECT_DATA', text="Object")
+        elif scene.flexrig_link.target_mode == 'GROUP':
+            row.prop_search(scene.flexrig_link, "target_group", bpy.data, "groups", icon='GROUP', text="Group")
         row = layout.row()
         row.prop_search(scene.flexrig_link, "armature_object", scene, "objects", icon='ARMATURE_DATA', text="Armature")
+        row = layout.row()
+        row.prop(scene.flexrig_link, "weight_mode")
+        row = layout.row(align=True)
+        row.prop(scene.flexrig_link, "use_proxy", toggle=True)
+        if scene.flexrig_link.use_proxy:
+            row.prop(scene.flexrig_link, "proxy_ratio")
+        row = layout.row()
+        row.prop(scene.flexrig_link, "use_cache")
+        if scene.flexrig_link.target_mode != 'OBJECT' and scene.flexrig_link.weight_mode == 'FAST':
+            row.prop(scene.flexrig_link, "workers")
 
         row = layout.row()
         row.operator("flexrig.link_to", text="Link armature to object", icon="LINK_AREA")
@@ -266,8 +714,11 @@ class FlexrigAmtPanel(bpy.types.Panel):
             row = layout.row()
             row.prop(profile, "control", text="Create control handle", toggle=True)
 
-        row = layout.row()
+        row = layout.row(align=True)
         row.operator("flexrig.create_amt", icon="OUTLINER_OB_ARMATURE", text="Create armature")
+        row.prop(scene, "flexrig_linked", text="Linked", toggle=True)
+        row = layout.row()
+        row.operator("flexrig.update_amt", icon="FILE_REFRESH", text="Update armature")
 
 class FlexrigHeadPanel(bpy.types.Panel):
     bl_label = "FlexRig Head(s)"
@@ -490,58 +941,81 @@ class FlexrigLegPanel(bpy.types.Panel):
 # Properties ------------------------------------
 
 class FlexrigArmProperty(bpy.types.PropertyGroup):
-    suffix = bpy.props.StringProperty(name="Arm suffix")
+    suffix = bpy.props.StringProperty(name="Arm suffix", update=on_profile_edit)
 
-    upper = bpy.props.FloatVectorProperty(name="Upper arm", subtype='XYZ', size=3)
-    lower = bpy.props.FloatVectorProperty(name="Lower arm", subtype='XYZ', size=3)
-    wrist = bpy.props.FloatVectorProperty(name="Wrist", subtype='XYZ', size=3)
-    thumb = bpy.props.FloatVectorProperty(name="Thumb", subtype='XYZ', size=3)
-    hand = bpy.props.FloatVectorProperty(name="Hand", subtype='XYZ', size=3)
+    upper = bpy.props.FloatVectorProperty(name="Upper arm", subtype='XYZ', size=3, update=on_profile_edit)
+    lower = bpy.props.FloatVectorProperty(name="Lower arm", subtype='XYZ', size=3, update=on_profile_edit)
+    wrist = bpy.props.FloatVectorProperty(name="Wrist", subtype='XYZ', size=3, update=on_profile_edit)
+    thumb = bpy.props.FloatVectorProperty(name="Thumb", subtype='XYZ', size=3, update=on_profile_edit)
+    hand = bpy.props.FloatVectorProperty(name="Hand", subtype='XYZ', size=3, update=on_profile_edit)
 
-    shoulder = bpy.props.BoolProperty(name="Shoulder", default=True)
-    ik = bpy.props.BoolProperty(name="Ik", default=False)
+    shoulder = bpy.props.BoolProperty(name="Shoulder", default=True, update=on_profile_edit)
+    ik = bpy.props.BoolProperty(name="Ik", default=False, update=on_profile_edit)
 
     mirror = bpy.props.BoolVectorProperty(name="Symmetry", subtype='XYZ')
     expand = bpy.props.BoolProperty(name="expand", default=False)
 
 class FlexrigLegProperty(bpy.types.PropertyGroup):
-    suffix = bpy.props.StringProperty(name="Leg suffix")
+    suffix = bpy.props.StringProperty(name="Leg suffix", update=on_profile_edit)
 
-    upper = bpy.props.FloatVectorProperty(name="Upper leg", subtype='XYZ', size=3)
-    lower = bpy.props.FloatVectorProperty(name="Lower leg", subtype='XYZ', size=3)
-    knee = bpy.props.FloatVectorProperty(name="Knee", subtype='XYZ', size=3)
-    foot = bpy.props.FloatVectorProperty(name="Foot", subtype='XYZ', size=3)
+    upper = bpy.props.FloatVectorProperty(name="Upper leg", subtype='XYZ', size=3, update=on_profile_edit)
+    lower = bpy.props.FloatVectorProperty(name="Lower leg", subtype='XYZ', size=3, update=on_profile_edit)
+    knee = bpy.props.FloatVectorProperty(name="Knee", subtype='XYZ', size=3, update=on_profile_edit)
+    foot = bpy.props.FloatVectorProperty(name="Foot", subtype='XYZ', size=3, update=on_profile_edit)
 
-    hip = bpy.props.BoolProperty(name="hip", default=True)
-    ik = bpy.props.BoolProperty(name="Ik", default=False)
+    hip = bpy.props.BoolProperty(name="hip", default=True, update=on_profile_edit)
+    ik = bpy.props.BoolProperty(name="Ik", default=False, update=on_profile_edit)
 
     mirror = bpy.props.BoolVectorProperty(name="Symmetry", subtype='XYZ')
     expand = bpy.props.BoolProperty(name="expand", default=False)
 
 class FlexrigHeadProperty(bpy.types.PropertyGroup):
-    suffix = bpy.props.StringProperty(name="Head suffix")
+    suffix = bpy.props.StringProperty(name="Head suffix", update=on_profile_edit)
 
-    neck = bpy.props.FloatVectorProperty(name="Neck", subtype='XYZ', size=3)
-    head = bpy.props.FloatVectorProperty(name="Head", subtype='XYZ', size=3)
+    neck = bpy.props.FloatVectorProperty(name="Neck", subtype='XYZ', size=3, update=on_profile_edit)
+    head = bpy.props.FloatVectorProperty(name="Head", subtype='XYZ', size=3, update=on_profile_edit)
 
     mirror = bpy.props.BoolVectorProperty(name="Symmetry", subtype='XYZ')
     expand = bpy.props.BoolProperty(name="expand", default=False)
 
 class FlexrigProfileProperty(bpy.types.PropertyGroup):
     name = bpy.props.StringProperty(name="Profile name", update=on_profile_name_change)
+    library_name = bpy.props.StringProperty(name="Name in the profile library")
+    library_hash = bpy.props.StringProperty(name="Content hash in the profile library")
+    loaded = bpy.props.BoolProperty(name="Loaded", default=True)
+    dirty = bpy.props.BoolProperty(name="Changed since last save", default=False)
 
-    rib = bpy.props.FloatVectorProperty(name="Rib", subtype='XYZ', size=3)
-    chest = bpy.props.FloatVectorProperty(name="Chest", subtype='XYZ', size=3)
-    tchest = bpy.props.FloatVectorProperty(name="Top chest", subtype='XYZ', size=3)
-    control = bpy.props.BoolProperty(name="Controller", default=True)
+    rib = bpy.props.FloatVectorProperty(name="Rib", subtype='XYZ', size=3, update=on_profile_edit)
+    chest = bpy.props.FloatVectorProperty(name="Chest", subtype='XYZ', size=3, update=on_profile_edit)
+    tchest = bpy.props.FloatVectorProperty(name="Top chest", subtype='XYZ', size=3, update=on_profile_edit)
+    control = bpy.props.BoolProperty(name="Controller", default=True, update=on_profile_edit)
 
     heads = bpy.props.CollectionProperty(type=FlexrigHeadProperty)
     arms = bpy.props.CollectionProperty(type=FlexrigArmProperty)
     legs = bpy.props.CollectionProperty(type=FlexrigLegProperty)
 
+class FlexrigRemovedProperty(bpy.types.PropertyGroup):
+    # A profile deleted since the last save, name is its name in the library
+    pass
+
 class FlexrigLinkProperty(bpy.types.PropertyGroup):
     armature_object = bpy.props.StringProperty(name="Armature object name")
     target_object = bpy.props.StringProperty(name="Target object name")
+    target_mode = bpy.props.EnumProperty(name="Targets", default='OBJECT', items=[
+        ('OBJECT', "Object", "Link the target object"),
+        ('SELECTED', "Selected", "Link every selected mesh"),
+        ('GROUP', "Group", "Link every mesh of a group"),
+    ])
+    target_group = bpy.props.StringProperty(name="Target group name")
+    workers = bpy.props.IntProperty(name="Threads", default=0, min=0, description="Threads solving fast weights of several meshes, 0 for one per CPU")
+    weight_mode = bpy.props.EnumProperty(name="Weights", default='HEAT', items=[
+        ('HEAT', "Bone heat", "Automatic weights from bone heat (slow on dense meshes)"),
+        ('ENVELOPE', "Envelope", "Weights from bone envelopes"),
+        ('FAST', "Fast", "Weights from the distance to bone segments, computed with NumPy"),
+    ])
+    use_proxy = bpy.props.BoolProperty(name="Proxy", default=False, description="Solve weights on a decimated copy then transfer them")
+    proxy_ratio = bpy.props.FloatProperty(name="Ratio", default=0.1, min=0.001, max=1.0)
+    use_cache = bpy.props.BoolProperty(name="Cache weights", default=True, description="Reuse weights computed for the same mesh and rest pose")
 
 # Operators -------------------------------------
 
@@ -555,23 +1029,13 @@ class FLEXRIG_OT_add_profile(bpy.types.Operator):
         is_exists = True
         while is_exists is True:
             profile_name = "New."  + str(i)
-            is_exists = False
-            for d in context.scene.flexrig_profiles:
-                if d["name"] == profile_name:
-                    is_exists = True
-                    break
+            is_exists = profile_registry.find_index(context.scene, profile_name) is not None
             i += 1
 
-        # Add profile
+        # Add profile, its name update selects it
+        profile_registry.append(context.scene, "")
         p = context.scene.flexrig_profiles.add()
         p.name = profile_name
-
-        # Reload profile list
-        enum_data = []
-        for d in context.scene.flexrig_profiles:
-            enum_data.append((d["name"], d["name"], "Select " + d["name"] + "profile"))
-        set_flexrig_profile_list(enum_data)
-        context.scene.flexrig_active = profile_name
         return {'FINISHED'}
 
 class FLEXRIG_OT_del_profile(bpy.types.Operator):
@@ -580,19 +1044,17 @@ class FLEXRIG_OT_del_profile(bpy.types.Operator):
 
     def execute(self, context):
         # Remove profile
-        i = 0
         if len(context.scene.flexrig_profiles) > 1:
-            while i < len(context.scene.flexrig_profiles):
-                if context.scene.flexrig_profiles[i].name == context.scene.flexrig_active:
-                    context.scene.flexrig_profiles.remove(i)
-                    break
-                i += 1
+            i = profile_registry.find_index(context.scene, context.scene.flexrig_active)
+            if i is not None:
+                # Only profiles deleted here are removed from the library by the next save
+                library_name = context.scene.flexrig_profiles[i].library_name
+                if library_name != "":
+                    context.scene.flexrig_removed.add().name = library_name
+                context.scene.flexrig_profiles.remove(i)
+            profile_registry.invalidate()
+            mark_profile_dirty(context.scene, None)
 
-            # Reload profile list
-            enum_data = []
-            for d in context.scene.flexrig_profiles:
-                enum_data.append((d["name"], d["name"], "Select " + d["name"] + "profile"))
-            set_flexrig_profile_list(enum_data)
             context.scene.flexrig_active = context.scene.flexrig_profiles[len(context.scene.flexrig_profiles) - 1].name
         return {'FINISHED'}
 
@@ -601,16 +1063,18 @@ class FLEXRIG_OT_save_profile(bpy.types.Operator):
     bl_label = "Save Flexrig profile"
 
     def execute(self, context):
-        active_profile = context.scene.flexrig_active
         profileIE = FlexrigProfileIE()
         profileIE.save(context.scene)
+        return {'FINISHED'}
 
-        # Reload profile list
-        enum_data = []
-        for d in context.scene.flexrig_profiles:
-            enum_data.append((d["name"], d["name"], "Select " + d["name"] + "profile"))
-        set_flexrig_profile_list(enum_data)
-        context.scene.flexrig_active = active_profile
+class FLEXRIG_OT_load_profile(bpy.types.Operator):
+    bl_idname = "flexrig.load_profile"
+    bl_label = "Load Flexrig profile from the library"
+
+    def execute(self, context):
+        profile = find_flexrig_active_profile(context.scene, loaded=False)
+        if profile is not None:
+            FlexrigProfileIE().load_profile(profile)
         return {'FINISHED'}
 
 class FLEXRIG_OT_reset_profile(bpy.types.Operator):
@@ -627,10 +1091,7 @@ class FLEXRIG_OT_set_profile_name(bpy.types.Operator):
     bl_label = "Change Flexrig profile name"
 
     def execute(self, context):
-        enum_data = []
-        for d in context.scene.flexrig_profiles:
-            enum_data.append((d["name"], d["name"], "Select " + d["name"] + "profile"))
-        set_flexrig_profile_list(enum_data)
+        profile_registry.invalidate()
         return {'FINISHED'}
 
 class FLEXRIG_OT_add_head(bpy.types.Operator):
@@ -641,6 +1102,7 @@ class FLEXRIG_OT_add_head(bpy.types.Operator):
         profile = find_flexrig_active_profile(context.scene)
         if profile is not None:
             profile.heads.add()
+            mark_profile_dirty(context.scene, profile)
         return {'FINISHED'}
 
 class FLEXRIG_OT_add_arm(bpy.types.Operator):
@@ -651,6 +1113,7 @@ class FLEXRIG_OT_add_arm(bpy.types.Operator):
         profile = find_flexrig_active_profile(context.scene)
         if profile is not None:
             profile.arms.add()
+            mark_profile_dirty(context.scene, profile)
         return {'FINISHED'}
 
 class FLEXRIG_OT_add_leg(bpy.types.Operator):
@@ -661,6 +1124,7 @@ class FLEXRIG_OT_add_leg(bpy.types.Operator):
         profile = find_flexrig_active_profile(context.scene)
         if profile is not None:
             profile.legs.add()
+            mark_profile_dirty(context.scene, profile)
         return {'FINISHED'}
 
 class FLEXRIG_OT_del_member(bpy.types.Operator):
@@ -675,6 +1139,7 @@ class FLEXRIG_OT_del_member(bpy.types.Operator):
         members_list = getattr(profile, self.member_type)
         if members_list is not None:
             members_list.remove(self.member_id)
+            mark_profile_dirty(context.scene, profile)
         return {'FINISHED'}
 
 class FLEXRIG_OT_set_position(bpy.types.Operator):
@@ -818,38 +1283,129 @@ class FLEXRIG_OT_copy_member(bpy.types.Operator):
         new_member.suffix = member.suffix
         return {'FINISHED'}
 
-class FLEXRIG_OT_link_to(bpy.types.Operator):
+class FLEXRIG_OT_link_to(FlexrigModalJob, bpy.types.Operator):
     bl_idname = "flexrig.link_to"
     bl_label = "Link armature to object"
 
+    @staticmethod
+    def targets(context, link):
+        # Meshes to link, the armature itself is never one of them
+        if link.target_mode == 'SELECTED':
+            objects = context.selected_objects
+        elif link.target_mode == 'GROUP':
+            objects = bpy.data.groups[link.target_group].objects if link.target_group in bpy.data.groups else []
+        else:
+            objects = [bpy.data.objects[link.target_object]] if link.target_object in bpy.data.objects else []
+        return [obj.name for obj in objects if obj.type == 'MESH' and obj.name != link.armature_object]
+
+    def check_targets(self, context, link):
+        if link.armature_object not in bpy.data.objects:
+            return None
+
+        targets = self.targets(context, link)
+        if len(targets) == 0:
+            self.report({'ERROR'}, "FlexRig : no mesh to link")
+            return None
+        return targets
+
+    def invoke(self, context, event):
+        # From the UI weights are solved and written a chunk of vertices per timer event
+        link = context.scene.flexrig_link
+        self.link_targets = self.check_targets(context, link)
+        if self.link_targets is None:
+            return {'CANCELLED'}
+
+        from . import flexrig
+        return self.start(context, flexrig.Flexrig.link_steps(link.armature_object, self.link_targets, link.weight_mode,
+            link.proxy_ratio if link.use_proxy else 1.0, weight_cache if link.use_cache else None, link.workers or None))
+
+    def finish(self, context, elapsed):
+        self.report({'INFO'}, "FlexRig : " + str(len(self.link_targets)) + " objects linked in " + ("%.2f" % elapsed) + " s")
+
     def execute(self, context):
-        if context.scene.flexrig_link.armature_object not in bpy.data.objects:
-            return {'CANCELED'}
-        if context.scene.flexrig_link.target_object not in bpy.data.objects:
-            return {'CANCELED'}
+        link = context.scene.flexrig_link
+        targets = self.check_targets(context, link)
+        if targets is None:
+            return {'CANCELLED'}
 
-        flexrig.Flexrig.link_to_object(context.scene.flexrig_link.armature_object, context.scene.flexrig_link.target_object)
+        from . import flexrig
+        t_start = time.perf_counter()
+        cached = flexrig.Flexrig.link_to_objects(link.armature_object, targets, link.weight_mode,
+            link.proxy_ratio if link.use_proxy else 1.0, weight_cache if link.use_cache else None, link.workers or None)
+
+        self.report({'INFO'}, "FlexRig : " + str(len(targets)) + " objects linked in " + ("%.2f" % (time.perf_counter() - t_start)) + " s" + (" (" + str(cached) + " cached)" if cached > 0 else ""))
         return {'FINISHED'}
 
-class FLEXRIG_OT_create_amt(bpy.types.Operator):
+class FLEXRIG_OT_create_amt(FlexrigModalJob, bpy.types.Operator):
     bl_idname = "flexrig.create_amt"
     bl_label = "Create flexrig armature"
 
+    def active_profile(self, scene):
+        profile = find_flexrig_active_profile(scene)
+        if profile is None:
+            self.report({'ERROR'}, "FlexRig : no profile loaded")
+            return None
+        return FlexrigProfileIE.to_serializable(profile)
+
+    def invoke(self, context, event):
+        # From the UI bones are written a chunk at a time, a linked instance has nothing to build
+        scene = context.scene
+        if scene.flexrig_linked:
+            return self.execute(context)
+
+        profile = self.active_profile(scene)
+        if profile is None:
+            return {'CANCELLED'}
+
+        from . import flexrig
+        self.amt = flexrig.Flexrig(scene.flexrig_amt, batch=True)
+        self.amt.set_plan(flexrig.Flexrig.plan_from_profile(profile, self.amt.arm.name))
+        return self.start(context, self.amt.build_steps())
+
+    def rollback(self, context):
+        # The armature of a cancelled build is deleted
+        self.amt.remove()
+
+    def finish(self, context, elapsed):
+        self.report({'INFO'}, "FlexRig : armature built with " + str(self.amt.mode_switches) + " mode switches")
+
     def execute(self, context):
+        scene = context.scene
+        profile = self.active_profile(scene)
+        if profile is None:
+            return {'CANCELLED'}
+
+        from . import flexrig
+        if scene.flexrig_linked:
+            amt, shared = flexrig.Flexrig.linked_instance(scene.flexrig_amt, profile)
+            if shared:
+                self.report({'INFO'}, "FlexRig : armature data shared by " + str(amt.arm.data.users) + " characters")
+                return {'FINISHED'}
+        else:
+            amt = flexrig.Flexrig(scene.flexrig_amt, batch=True)
+            amt.apply_plan(flexrig.Flexrig.plan_from_profile(profile, amt.arm.name))
+
+        self.report({'INFO'}, "FlexRig : armature built with " + str(amt.mode_switches) + " mode switches")
+        return {'FINISHED'}
+
+class FLEXRIG_OT_update_amt(bpy.types.Operator):
+    bl_idname = "flexrig.update_amt"
+    bl_label = "Update flexrig armature"
+
+    def execute(self, context):
+        from . import flexrig, flexrig_plan
         profile = find_flexrig_active_profile(context.scene)
-        amt = flexrig.Flexrig(context.scene.flexrig_amt)
-        amt.create_chest(profile.rib, profile.chest, profile.tchest)
+        arm = bpy.data.objects.get(context.scene.flexrig_amt)
 
-        for head in profile.heads:
-            amt.create_head(head.suffix, head.neck, head.head)
-        for arm in profile.arms:
-            hand = arm.hand if arm.hand.x != 0.0 or arm.hand.y != 0.0 or arm.hand.z != 0.0 else None
-            thumb = arm.thumb if hand is not None and (arm.thumb.x != 0.0 or arm.thumb.y != 0.0 or arm.thumb.z != 0.0) else None
-            amt.create_arm(arm.suffix, arm.upper, arm.lower, arm.wrist, arm.shoulder, arm.ik, hand, thumb)
-        for leg in profile.legs:
-            amt.create_leg(leg.suffix, leg.upper, leg.lower, leg.knee, leg.foot, leg.hip, leg.ik)
+        if profile is None or arm is None or arm.type != 'ARMATURE' or flexrig.Flexrig.load_plan(arm) is None:
+            self.report({'ERROR'}, "FlexRig : " + context.scene.flexrig_amt + " is not a FlexRig armature")
+            return {'CANCELLED'}
+
+        amt = flexrig.Flexrig(arm.name, arm=arm)
+        diff = amt.update_plan(flexrig_plan.RigPlan.from_profile(profile, arm.name))
 
-        amt.create_ik_controller(profile.control)
+        changes = ", ".join(str(len(diff[k])) + " " + k.replace("_", " ") for k in ('added', 'removed', 'moved', 'reparented', 'ik_added', 'ik_removed'))
+        self.report({'INFO'}, "FlexRig : armature updated (" + changes + ")")
         return {'FINISHED'}
 
 class FLEXRIG_OT_init(bpy.types.Operator):
@@ -879,10 +1435,14 @@ class FLEXRIG_OT_init(bpy.types.Operator):
 
 def initSceneProperties():
     scene = bpy.types.Scene
-    scene.flexrig_active = bpy.props.EnumProperty(name="Profile", items={})
+    scene.flexrig_active = bpy.props.EnumProperty(name="Profile", items=flexrig_profile_items, update=on_profile_select)
     scene.flexrig_link = bpy.props.PointerProperty(type=FlexrigLinkProperty)
     scene.flexrig_amt = bpy.props.StringProperty(name="Armature name", default="Flexrig.Armature")
+    scene.flexrig_linked = bpy.props.BoolProperty(name="Linked instance", default=False, description="Share armature data between characters of the same profile, copied when one is updated")
     scene.flexrig_profiles = bpy.props.CollectionProperty(type=FlexrigProfileProperty)
+    scene.flexrig_removed = bpy.props.CollectionProperty(type=FlexrigRemovedProperty)
+    scene.flexrig_autosave = bpy.props.BoolProperty(name="Autosave", default=False, description="Save edited profiles in the background")
+    scene.flexrig_watch = bpy.props.BoolProperty(name="Watch library", default=True, update=on_watch_change, description="Reload profiles changed on disk")
 
     # bpy.ops.flexrig.init_opt('INVOKE_DEFAULT')
 
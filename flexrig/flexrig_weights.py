@@ -0,0 +1,618 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Fast skin weights : per-vertex influences from the distance to bone segments.
+# Solving part only needs NumPy, bpy is only used to read and write object data.
+
+import concurrent.futures
+import hashlib
+import os
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+# Weights solved by Blender (heat, envelope) are read back vertex by vertex to be cached,
+# above this size that pass costs more than it saves
+READBACK_MAX_VERTICES = 250000
+
+def require_numpy():
+    if numpy is None:
+        raise ImportError("FlexRig : fast weights need NumPy")
+
+# Solver ----------------------------------------
+
+def segment_distance(points, heads, tails, eps=1e-12):
+    # Distance from points to segments, all arrays broadcast on the last axis
+    ab = tails - heads
+    ap = points - heads
+    t = numpy.clip(numpy.sum(ap * ab, axis=-1) / numpy.maximum(numpy.sum(ab * ab, axis=-1), eps), 0.0, 1.0)
+    closest = heads + ab * t[..., None]
+    return numpy.sqrt(numpy.sum((points - closest) ** 2, axis=-1))
+
+def grid_bounds(points, resolution=32):
+    lo = points.min(axis=0)
+    return lo, max(float((points.max(axis=0) - lo).max()) / resolution, 1e-9)
+
+def candidate_bones(points, heads, tails, candidates=8, resolution=32, bounds=None):
+    # Uniform grid over the points : bones nearest to each occupied cell are the only ones
+    # tested for the vertices of that cell. Chunks of a point set share the grid bounds.
+    count = min(candidates, len(heads))
+    lo, size = bounds if bounds is not None else grid_bounds(points, resolution)
+
+    cells = numpy.floor((points - lo) / size).astype(numpy.int64)
+    dims = cells.max(axis=0) + 1
+    keys = numpy.ravel_multi_index(cells.T, dims)
+    occupied, inverse = numpy.unique(keys, return_inverse=True)
+
+    centers = lo + (numpy.stack(numpy.unravel_index(occupied, dims), axis=1) + 0.5) * size
+    distance = segment_distance(centers[:, None, :], heads[None, :, :], tails[None, :, :])
+    lower_bound = numpy.maximum(distance - size * 0.8660254, 0.0)
+
+    if count < len(heads):
+        nearest = numpy.argpartition(lower_bound, count - 1, axis=1)[:, :count]
+    else:
+        nearest = numpy.broadcast_to(numpy.arange(len(heads)), (len(occupied), len(heads)))
+    return nearest[inverse.reshape(-1)]
+
+def solve_weights(points, heads, tails, influences=4, candidates=8, falloff=4.0, resolution=32, chunk=65536):
+    # Returns (bones, weights), two (vertex count, influences) arrays, weights sum to 1
+    require_numpy()
+    points = numpy.asarray(points, dtype=numpy.float64)
+    heads = numpy.asarray(heads, dtype=numpy.float64)
+    tails = numpy.asarray(tails, dtype=numpy.float64)
+
+    bones, weights = influence_arrays(len(points), min(influences, candidates, len(heads)))
+    for done in solve_steps(points, heads, tails, bones, weights, candidates, falloff, resolution, chunk):
+        pass
+    return bones, weights
+
+def influence_arrays(count, influences):
+    return numpy.zeros((count, influences), dtype=numpy.int32), numpy.zeros((count, influences), dtype=numpy.float32)
+
+def solve_steps(points, heads, tails, bones, weights, candidates=8, falloff=4.0, resolution=32, chunk=65536):
+    # Fill bones and weights one chunk of points at a time, yields the number of points done
+    influences = bones.shape[1]
+    if len(points) == 0 or len(heads) == 0:
+        return
+
+    # Bounds are gathered chunk by chunk too, a single pass over a large mesh already stalls.
+    # That pass is counted as the first points of the progress, so it keeps moving forward
+    bounds_share = 0.05
+    lo = numpy.full(3, numpy.inf)
+    hi = numpy.full(3, -numpy.inf)
+    for start in range(0, len(points), chunk * 8):
+        lo = numpy.minimum(lo, points[start:start + chunk * 8].min(axis=0))
+        hi = numpy.maximum(hi, points[start:start + chunk * 8].max(axis=0))
+        yield bounds_share * min(start + chunk * 8, len(points))
+    extent = float((hi - lo).max())
+    bounds = (lo, max(extent / resolution, 1e-9))
+    eps = 1e-6 * max(extent, 1e-9)
+
+    for start in range(0, len(points), chunk):
+        end = min(start + chunk, len(points))
+        cand = candidate_bones(points[start:end], heads, tails, candidates, resolution, bounds)
+        distance = segment_distance(points[start:end, None, :], heads[cand], tails[cand])
+
+        if cand.shape[1] > influences:
+            nearest = numpy.argpartition(distance, influences - 1, axis=1)[:, :influences]
+            rows = numpy.arange(len(cand))[:, None]
+            cand = cand[rows, nearest]
+            distance = distance[rows, nearest]
+
+        w = 1.0 / (distance + eps) ** falloff
+        w /= w.sum(axis=1, keepdims=True)
+
+        bones[start:end] = cand
+        weights[start:end] = w
+        yield bounds_share * len(points) + (1.0 - bounds_share) * end
+
+def top_influences(dense, influences=4):
+    # Keep the strongest influences of a (vertex count, bone count) weight matrix
+    influences = min(influences, dense.shape[1])
+    if influences < dense.shape[1]:
+        bones = numpy.argpartition(-dense, influences - 1, axis=1)[:, :influences]
+    else:
+        bones = numpy.broadcast_to(numpy.arange(dense.shape[1]), dense.shape)
+    weights = dense[numpy.arange(len(dense))[:, None], bones]
+    total = weights.sum(axis=1, keepdims=True)
+    weights = numpy.where(total > 0.0, weights / numpy.where(total > 0.0, total, 1.0), 0.0)
+    return bones.astype(numpy.int32), weights.astype(numpy.float32)
+
+# Transfer --------------------------------------
+
+def grid_keys(points, lo, size):
+    cells = numpy.floor((points - lo) / size).astype(numpy.int64)
+    dims = cells.max(axis=0) + 1
+    return cells, dims
+
+def nearest_points(points, queries, occupancy=4.0, chunk=65536):
+    # Exact nearest neighbour with a uniform grid : the 27 cells around a query are searched
+    # and queries whose nearest point is farther than one cell fall back to a brute force pass.
+    return grid_nearest(point_grid(points, occupancy), queries, chunk)
+
+def point_grid(points, occupancy=4.0):
+    # Search grid of nearest_points(), built once for several query batches
+    grid = {}
+    for n in grid_steps(points, grid, occupancy):
+        pass
+    return grid
+
+def occupied_cells(cells, dims):
+    keys = numpy.ravel_multi_index(cells.T, dims)
+    if int(numpy.prod(dims)) <= 1 << 24:
+        return int(numpy.count_nonzero(numpy.bincount(keys, minlength=int(numpy.prod(dims)))))
+    return len(numpy.unique(keys))
+
+def grid_steps(points, grid, occupancy=4.0):
+    # Fill grid for point_grid() one sizing pass at a time, for modal operators
+    points = numpy.asarray(points, dtype=numpy.float64)
+
+    # Cell size adjusted for the points actual distribution (mesh vertices lie on a surface)
+    lo = points.min(axis=0)
+    extent = numpy.maximum(points.max(axis=0) - lo, 1e-9)
+    size = max(float((numpy.prod(extent) * occupancy / len(points)) ** (1.0 / 3.0)), float(extent.max()) / 1024.0, 1e-9)
+    for i in range(3):
+        cells, dims = grid_keys(points, lo, size)
+        mean = len(points) / float(occupied_cells(cells, dims))
+        size = max(size * (occupancy / mean) ** 0.5, float(extent.max()) / 1024.0, 1e-9)
+        yield 0
+
+    cells, dims = grid_keys(points, lo, size)
+    keys = numpy.ravel_multi_index(cells.T, dims)
+    order = numpy.argsort(keys, kind='mergesort')
+    sorted_keys = keys[order]
+    yield 0
+
+    # Direct cell -> first point table when the grid is small enough
+    cell_count = int(numpy.prod(dims))
+    cell_starts = numpy.searchsorted(sorted_keys, numpy.arange(cell_count + 1)) if cell_count <= 1 << 24 else None
+
+    grid.update({'lo': lo, 'size': size, 'dims': dims, 'order': order, 'sorted_keys': sorted_keys, 'sorted_points': points[order], 'cell_starts': cell_starts})
+
+def grid_nearest(grid, queries, chunk=65536):
+    queries = numpy.asarray(queries, dtype=numpy.float64)
+    lo, size, dims = grid["lo"], grid["size"], grid["dims"]
+    order, sorted_keys, sorted_points, cell_starts = grid["order"], grid["sorted_keys"], grid["sorted_points"], grid["cell_starts"]
+
+    offsets = numpy.stack(numpy.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1], indexing='ij'), axis=-1).reshape(-1, 3)
+    nearest = numpy.empty(len(queries), dtype=numpy.int64)
+
+    for start in range(0, len(queries), chunk):
+        q = queries[start:start + chunk]
+        q_cells = numpy.floor((q - lo) / size).astype(numpy.int64)
+        best = numpy.full(len(q), numpy.inf)
+        best_index = numpy.zeros(len(q), dtype=numpy.int64)
+
+        for offset in offsets:
+            cell = q_cells + offset
+            inside = numpy.flatnonzero(numpy.all((cell >= 0) & (cell < dims), axis=1))
+            key = numpy.ravel_multi_index(cell[inside].T, dims)
+            if cell_starts is not None:
+                first = cell_starts[key]
+                counts = cell_starts[key + 1] - first
+            else:
+                first = numpy.searchsorted(sorted_keys, key, 'left')
+                counts = numpy.searchsorted(sorted_keys, key, 'right') - first
+
+            # One (query, point) pair per point of the cell
+            pair_query = numpy.repeat(inside, counts)
+            pair_point = numpy.repeat(first - numpy.cumsum(counts) + counts, counts) + numpy.arange(counts.sum())
+            if len(pair_query) == 0:
+                continue
+
+            distance = numpy.sum((sorted_points[pair_point] - q[pair_query]) ** 2, axis=1)
+            previous = best.copy()
+            numpy.minimum.at(best, pair_query, distance)
+            winner = (distance == best[pair_query]) & (distance < previous[pair_query])
+            best_index[pair_query[winner]] = pair_point[winner]
+
+        # Nearest point may be outside of the searched cells
+        far = numpy.flatnonzero(best > size * size)
+        for f_start in range(0, len(far), 256):
+            f = far[f_start:f_start + 256]
+            distance = numpy.sum((sorted_points[None, :, :] - q[f][:, None, :]) ** 2, axis=2)
+            best_index[f] = distance.argmin(axis=1)
+
+        nearest[start:start + chunk] = order[best_index]
+
+    return nearest
+
+def triangle_adjacency(triangles, point_count, max_valence=16):
+    # (point count, max_valence) triangle indices around each point, -1 padded
+    corners = triangles.reshape(-1)
+    tri_index = numpy.repeat(numpy.arange(len(triangles)), 3)
+    order = numpy.argsort(corners, kind='mergesort')
+    corners, tri_index = corners[order], tri_index[order]
+
+    first = numpy.searchsorted(corners, numpy.arange(point_count), 'left')
+    rank = numpy.arange(len(corners)) - first[corners]
+    keep = rank < max_valence
+
+    adjacency = numpy.full((point_count, max_valence), -1, dtype=numpy.int64)
+    adjacency[corners[keep], rank[keep]] = tri_index[keep]
+    return adjacency
+
+def barycentric_project(q, a, b, c):
+    # Barycentric coordinates of the projection of q on triangles abc, clamped inside the triangle
+    v0, v1, v2 = b - a, c - a, q - a
+    d00 = numpy.sum(v0 * v0, axis=-1)
+    d01 = numpy.sum(v0 * v1, axis=-1)
+    d11 = numpy.sum(v1 * v1, axis=-1)
+    d20 = numpy.sum(v2 * v0, axis=-1)
+    d21 = numpy.sum(v2 * v1, axis=-1)
+    denom = d00 * d11 - d01 * d01
+    safe = numpy.where(numpy.abs(denom) > 1e-20, denom, 1.0)
+
+    v = (d11 * d20 - d01 * d21) / safe
+    w = (d00 * d21 - d01 * d20) / safe
+    bary = numpy.clip(numpy.stack((1.0 - v - w, v, w), axis=-1), 0.0, None)
+    bary /= numpy.maximum(bary.sum(axis=-1, keepdims=True), 1e-20)
+
+    # Degenerate triangles take the first corner
+    bary = numpy.where((numpy.abs(denom) > 1e-20)[..., None], bary, numpy.array([1.0, 0.0, 0.0]))
+    projected = a * bary[..., 0:1] + b * bary[..., 1:2] + c * bary[..., 2:3]
+    return bary, numpy.sum((projected - q) ** 2, axis=-1)
+
+def transfer_weights(proxy_points, proxy_triangles, proxy_weights, points, influences=4, chunk=32768):
+    # Interpolate (proxy point count, bone count) weights on points : nearest proxy point, then
+    # barycentric interpolation on the closest triangle around it.
+    require_numpy()
+    bones, weights = influence_arrays(len(points), min(influences, proxy_weights.shape[1]))
+    for done in transfer_steps(proxy_points, proxy_triangles, proxy_weights, points, bones, weights, chunk):
+        pass
+    return bones, weights
+
+def transfer_steps(proxy_points, proxy_triangles, proxy_weights, points, bones, weights, chunk=32768):
+    # Fill bones and weights one chunk of points at a time, yields the number of points done
+    proxy_points = numpy.asarray(proxy_points, dtype=numpy.float64)
+    proxy_triangles = numpy.asarray(proxy_triangles, dtype=numpy.int64).reshape(-1, 3)
+    points = numpy.asarray(points, dtype=numpy.float64)
+    influences = bones.shape[1]
+
+    grid = {}
+    for n in grid_steps(proxy_points, grid):
+        yield 0
+    adjacency = triangle_adjacency(proxy_triangles, len(proxy_points))
+    yield 0
+
+    for start in range(0, len(points), chunk):
+        q = points[start:start + chunk]
+        near = grid_nearest(grid, q)
+        tris = adjacency[near]
+        valid = tris >= 0
+
+        corners = proxy_triangles[numpy.where(valid, tris, 0)]
+        bary, distance = barycentric_project(q[:, None, :], proxy_points[corners[..., 0]], proxy_points[corners[..., 1]], proxy_points[corners[..., 2]])
+        distance = numpy.where(valid, distance, numpy.inf)
+        best = distance.argmin(axis=1)
+
+        rows = numpy.arange(len(q))
+        corner = corners[rows, best]
+        b = bary[rows, best]
+
+        # Points without any triangle around take the nearest point weights
+        lonely = ~valid.any(axis=1)
+        corner[lonely] = near[lonely, None]
+        b[lonely] = (1.0, 0.0, 0.0)
+
+        dense = proxy_weights[corner[:, 0]] * b[:, 0:1] + proxy_weights[corner[:, 1]] * b[:, 1:2] + proxy_weights[corner[:, 2]] * b[:, 2:3]
+        bones[start:start + chunk], weights[start:start + chunk] = top_influences(dense, influences)
+        yield min(start + chunk, len(points))
+
+def dense_weights(bones, weights, bone_count):
+    dense = numpy.zeros((len(bones), bone_count), dtype=numpy.float32)
+    numpy.add.at(dense, (numpy.arange(len(bones))[:, None], bones), weights)
+    return dense
+
+def weight_error(a, b):
+    # Mean and max absolute difference between two dense weight matrices
+    difference = numpy.abs(numpy.asarray(a, dtype=numpy.float64) - numpy.asarray(b, dtype=numpy.float64))
+    return float(difference.mean()) if difference.size > 0 else 0.0, float(difference.max()) if difference.size > 0 else 0.0
+
+# Blender data ----------------------------------
+
+def matrix_to_numpy(matrix):
+    return numpy.array([list(row) for row in matrix], dtype=numpy.float64)
+
+def transform_points(matrix, points):
+    m = matrix_to_numpy(matrix)
+    return numpy.dot(points, m[:3, :3].T) + m[:3, 3]
+
+def mesh_points(obj):
+    # World space vertex positions, read with one foreach_get
+    vertices = obj.data.vertices
+    co = numpy.empty(len(vertices) * 3, dtype=numpy.float32)
+    vertices.foreach_get("co", co)
+    return transform_points(obj.matrix_world, co.reshape(-1, 3).astype(numpy.float64))
+
+def bone_segments(arm):
+    # World space segments of the deforming bones
+    bones = arm.data.bones
+    heads = numpy.empty(len(bones) * 3, dtype=numpy.float32)
+    tails = numpy.empty(len(bones) * 3, dtype=numpy.float32)
+    bones.foreach_get("head_local", heads)
+    bones.foreach_get("tail_local", tails)
+    deform = [False] * len(bones)
+    bones.foreach_get("use_deform", deform)
+
+    mask = numpy.array(deform, dtype=bool)
+    names = [b.name for b, d in zip(bones, deform) if d]
+    heads = transform_points(arm.matrix_world, heads.reshape(-1, 3).astype(numpy.float64))[mask]
+    tails = transform_points(arm.matrix_world, tails.reshape(-1, 3).astype(numpy.float64))[mask]
+    return names, heads, tails
+
+def write_vertex_groups(obj, names, bones, weights, levels=256):
+    # Weights are quantized so each group is written with one add() call per weight level
+    # instead of one call per vertex.
+    for name in names:
+        if name in obj.vertex_groups:
+            obj.vertex_groups.remove(obj.vertex_groups[name])
+
+    for name in names:
+        obj.vertex_groups.new(name=name)
+    for done in write_steps(obj, names, bones, weights, levels, max(len(bones), 1)):
+        pass
+
+def write_steps(obj, group_names, bones, weights, levels=256, chunk=32768):
+    # Write weights in existing groups one chunk of vertices at a time, yields the number of vertices done
+    for first in range(0, len(bones), chunk):
+        groups = [obj.vertex_groups[name] for name in group_names]
+        count = min(chunk, len(bones) - first)
+
+        flat_bones = bones[first:first + count].reshape(-1)
+        flat_levels = numpy.rint(weights[first:first + count].reshape(-1) * (levels - 1)).astype(numpy.int32)
+        flat_vertices = numpy.repeat(numpy.arange(first, first + count, dtype=numpy.int32), bones.shape[1])
+
+        keep = flat_levels > 0
+        flat_bones, flat_levels, flat_vertices = flat_bones[keep], flat_levels[keep], flat_vertices[keep]
+
+        # Sort by (bone, level) then split into runs
+        order = numpy.lexsort((flat_levels, flat_bones))
+        flat_bones, flat_levels, flat_vertices = flat_bones[order], flat_levels[order], flat_vertices[order]
+        runs = numpy.flatnonzero(numpy.diff(flat_bones) | numpy.diff(flat_levels)) + 1
+        starts = numpy.concatenate(([0], runs)) if len(flat_bones) > 0 else []
+
+        for start, end in zip(starts, list(starts[1:]) + [len(flat_bones)]):
+            groups[flat_bones[start]].add(flat_vertices[start:end].tolist(), float(flat_levels[start]) / (levels - 1), 'REPLACE')
+        yield first + count
+
+def staging_names(names):
+    # Groups written aside by a cancellable link, renamed by commit_groups() once complete
+    return ["~flexrig." + str(i) for i in range(len(names))]
+
+def add_groups(obj, group_names):
+    for name in group_names:
+        obj.vertex_groups.new(name=name)
+
+def commit_groups(obj, names, group_names):
+    for name in names:
+        if name in obj.vertex_groups:
+            obj.vertex_groups.remove(obj.vertex_groups[name])
+    for name, group_name in zip(names, group_names):
+        obj.vertex_groups[group_name].name = name
+
+def discard_groups(obj, group_names):
+    for name in group_names:
+        if name in obj.vertex_groups:
+            obj.vertex_groups.remove(obj.vertex_groups[name])
+
+def read_vertex_groups(obj, names):
+    # Dense (vertex count, len(names)) weights, meant for small meshes such as proxies
+    columns = {}
+    for vg in obj.vertex_groups:
+        if vg.name in names:
+            columns[vg.index] = names.index(vg.name)
+
+    dense = numpy.zeros((len(obj.data.vertices), len(names)), dtype=numpy.float32)
+    for v in obj.data.vertices:
+        for g in v.groups:
+            if g.group in columns:
+                dense[v.index, columns[g.group]] = g.weight
+    return dense
+
+def read_influences(obj, names, influences=8):
+    # Strongest influences of every vertex from its vertex groups, as top_influences() of
+    # read_vertex_groups() but without the dense (vertex count, bone count) matrix
+    columns = {vg.index: names.index(vg.name) for vg in obj.vertex_groups if vg.name in names}
+    count = len(obj.data.vertices)
+    bones = numpy.zeros((count, influences), dtype=numpy.int32)
+    weights = numpy.zeros((count, influences), dtype=numpy.float32)
+
+    # Vertex group elements have no bulk access, they are gathered in one flat pass
+    vertex = []
+    bone = []
+    weight = []
+    for v in obj.data.vertices:
+        for g in v.groups:
+            column = columns.get(g.group)
+            if column is not None:
+                vertex.append(v.index)
+                bone.append(column)
+                weight.append(g.weight)
+    if len(vertex) == 0:
+        return bones, weights
+
+    vertex = numpy.array(vertex, dtype=numpy.int32)
+    bone = numpy.array(bone, dtype=numpy.int32)
+    weight = numpy.array(weight, dtype=numpy.float32)
+
+    # Rank of each weight among the ones of its vertex, strongest first
+    order = numpy.lexsort((-weight, vertex))
+    vertex, bone, weight = vertex[order], bone[order], weight[order]
+    rank = numpy.arange(len(vertex)) - numpy.searchsorted(vertex, vertex, 'left')
+    keep = rank < influences
+    bones[vertex[keep], rank[keep]] = bone[keep]
+    weights[vertex[keep], rank[keep]] = weight[keep]
+
+    total = weights.sum(axis=1, keepdims=True)
+    weights = numpy.where(total > 0.0, weights / numpy.where(total > 0.0, total, 1.0), 0.0)
+    return bones, weights.astype(numpy.float32)
+
+def mesh_triangles(mesh):
+    # Vertex indices of a triangulated mesh
+    loops = numpy.empty(len(mesh.loops), dtype=numpy.int32)
+    mesh.loops.foreach_get("vertex_index", loops)
+    return loops.reshape(-1, 3)
+
+def make_proxy(obj, ratio, scene):
+    # Decimated and triangulated copy of obj, other modifiers are ignored
+    states = [(m, m.show_viewport) for m in obj.modifiers]
+    for m, state in states:
+        m.show_viewport = False
+
+    decimate = obj.modifiers.new(name="Flexrig.Decimate", type='DECIMATE')
+    decimate.ratio = ratio
+    triangulate = obj.modifiers.new(name="Flexrig.Triangulate", type='TRIANGULATE')
+
+    try:
+        mesh = obj.to_mesh(scene, True, 'PREVIEW')
+    finally:
+        obj.modifiers.remove(triangulate)
+        obj.modifiers.remove(decimate)
+        for m, state in states:
+            m.show_viewport = state
+
+    proxy = bpy.data.objects.new(obj.name + ".proxy", mesh)
+    proxy.matrix_world = obj.matrix_world.copy()
+    scene.objects.link(proxy)
+    return proxy
+
+def remove_proxy(proxy, scene):
+    mesh = proxy.data
+    scene.objects.unlink(proxy)
+    bpy.data.objects.remove(proxy)
+    bpy.data.meshes.remove(mesh)
+
+def mesh_hash(obj):
+    # Geometry and placement of a mesh object
+    mesh = obj.data
+    co = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+    mesh.vertices.foreach_get("co", co)
+    loops = numpy.empty(len(mesh.loops), dtype=numpy.int32)
+    mesh.loops.foreach_get("vertex_index", loops)
+    loop_totals = numpy.empty(len(mesh.polygons), dtype=numpy.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+
+    h = hashlib.sha1()
+    for array in (co, loops, loop_totals, matrix_to_numpy(obj.matrix_world)):
+        h.update(array.tobytes())
+    return h.hexdigest()
+
+def rig_hash(arm):
+    # Rest pose of an armature object : bone names, heads, tails, parents and deform flags
+    bones = arm.data.bones
+    heads = numpy.empty(len(bones) * 3, dtype=numpy.float32)
+    tails = numpy.empty(len(bones) * 3, dtype=numpy.float32)
+    bones.foreach_get("head_local", heads)
+    bones.foreach_get("tail_local", tails)
+    deform = [False] * len(bones)
+    bones.foreach_get("use_deform", deform)
+
+    h = hashlib.sha1()
+    for array in (heads, tails, numpy.array(deform, dtype=numpy.uint8), matrix_to_numpy(arm.matrix_world)):
+        h.update(array.tobytes())
+    for b in bones:
+        h.update((b.name + "\0" + (b.parent.name if b.parent is not None else "") + "\0").encode('utf-8'))
+    return h.hexdigest()
+
+def apply_weights(arm, obj, names, bones, weights):
+    write_vertex_groups(obj, names, bones, weights)
+    bind_to_armature(arm, obj)
+
+def bind_to_armature(arm, obj):
+    # Parent and armature modifier without going through parent_set
+    obj.parent = arm
+    obj.matrix_parent_inverse = arm.matrix_world.inverted()
+
+    modifier = None
+    for m in obj.modifiers:
+        if m.type == 'ARMATURE':
+            modifier = m
+    if modifier is None:
+        modifier = obj.modifiers.new(name=arm.name, type='ARMATURE')
+    modifier.object = arm
+    modifier.use_vertex_groups = True
+
+def link_proxy(arm, obj, ratio, solve, scene, influences=4):
+    # Solve weights on a decimated proxy with solve(arm, proxies), then transfer them to obj
+    return link_proxy_many(arm, [obj], ratio, solve, scene, influences)[0]
+
+def link_fast(arm, obj, influences=4, candidates=8, falloff=4.0):
+    return link_fast_many(arm, [obj], influences, candidates, falloff)[0]
+
+# Several meshes --------------------------------
+#
+# Bone segments are read once for every mesh. Blender data is only read and written from the
+# calling thread, solving runs on a thread pool (NumPy releases the GIL in its array loops).
+
+def map_parallel(func, items, workers=None):
+    items = list(items)
+    workers = min(workers or os.cpu_count() or 1, len(items))
+    if workers <= 1:
+        return [func(item) for item in items]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, items))
+
+def solve_many(point_sets, heads, tails, influences=4, candidates=8, falloff=4.0, workers=None):
+    # solve_weights() of several point sets against the same bones
+    return map_parallel(lambda points: solve_weights(points, heads, tails, influences, candidates, falloff), point_sets, workers)
+
+def link_fast_many(arm, objects, influences=4, candidates=8, falloff=4.0, workers=None):
+    require_numpy()
+    names, heads, tails = bone_segments(arm)
+    results = solve_many([mesh_points(obj) for obj in objects], heads, tails, influences, candidates, falloff, workers)
+
+    out = []
+    for obj, (bones, weights) in zip(objects, results):
+        apply_weights(arm, obj, names, bones, weights)
+        out.append((names, bones, weights))
+    return out
+
+def link_proxy_many(arm, objects, ratio, solve, scene, influences=4, workers=None):
+    # One proxy per object, all solved by a single solve(arm, proxies) call
+    require_numpy()
+    names = bone_segments(arm)[0]
+    proxy_data = solve_proxies(arm, objects, ratio, solve, scene, names)
+
+    jobs = [data + (mesh_points(obj),) for data, obj in zip(proxy_data, objects)]
+    results = map_parallel(lambda job: transfer_weights(job[0], job[1], job[2], job[3], influences), jobs, workers)
+
+    out = []
+    for obj, (bones, weights) in zip(objects, results):
+        apply_weights(arm, obj, names, bones, weights)
+        out.append((names, bones, weights))
+    return out
+
+def solve_proxies(arm, objects, ratio, solve, scene, names):
+    # (points, triangles, dense weights) of a solved proxy per object, proxies are removed after
+    proxies = []
+    try:
+        for obj in objects:
+            proxies.append(make_proxy(obj, ratio, scene))
+        solve(arm, proxies)
+        return [(mesh_points(p), mesh_triangles(p.data), read_vertex_groups(p, names)) for p in proxies]
+    finally:
+        for p in proxies:
+            remove_proxy(p, scene)